@@ -3,19 +3,25 @@
 #----------------------------------------------------------------------------#
 import sys
 import json
+from functools import wraps
 import dateutil.parser
 import babel
 from configparser import ConfigParser
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, stream_with_context, session, g, make_response, jsonify
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func
+from sqlalchemy import func, and_, or_, literal, literal_column, tuple_
+from sqlalchemy.orm import joinedload
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from search import SearchIndex, words as search_words
+from cache import PageCache
+from pool import pool_stats
 from flask_migrate import Migrate
 from datetime import datetime
+from itertools import groupby
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -26,6 +32,12 @@ app.config.from_object('config')
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 
+SEARCH_RESULTS_PER_PAGE = 20
+MAX_SHOWS_PER_PAGE = 100
+# template items rendered per streamed chunk
+STREAM_BUFFER_SIZE = 100
+search_indexes = {}
+
 # TODO: connect to a local postgresql database
 #----------------------------------------------------------------------------#
 # Models.
@@ -33,6 +45,9 @@ migrate = Migrate(app, db)
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_city_state', 'city', 'state'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -52,6 +67,9 @@ class Venue(db.Model):
     
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_city_state', 'city', 'state'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -73,6 +91,11 @@ class Artist(db.Model):
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 class Show(db.Model):
     __tablename__ = 'Show'
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
@@ -91,6 +114,170 @@ def format_datetime(value, format='medium'):
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+#----------------------------------------------------------------------------#
+# Rendering.
+#----------------------------------------------------------------------------#
+
+def render_page(template_name, **context):
+  # endpoints listed in STREAMED_PAGES send the page as it renders instead of
+  # buffering the whole document, so large listings start arriving at once
+  # and never sit in memory in full
+  if request.endpoint not in app.config['STREAMED_PAGES']:
+    return render_template(template_name, **context)
+  app.update_template_context(context)
+  stream = app.jinja_env.get_template(template_name).stream(context)
+  stream.enable_buffering(STREAM_BUFFER_SIZE)
+  return Response(stream_with_context(stream))
+
+def page_cache():
+  # built on first use so CACHE_* settings can still be changed after import
+  if 'page_cache' not in app.extensions:
+    app.extensions['page_cache'] = PageCache.from_config(app.config)
+  return app.extensions['page_cache']
+
+def cached_page(*tags):
+  # caches a GET page under its full path. <tags> are formatted with the view
+  # arguments; the view may add more to g.cache_tags while it runs
+  def decorator(f):
+    @wraps(f)
+    def wrapper(**kwargs):
+      g.cache_tags = [tag.format(**kwargs) for tag in tags]
+      cache = page_cache()
+      # pages carrying flashed messages belong to one visitor only
+      if cache is None or '_flashes' in session:
+        return f(**kwargs)
+      key = request.full_path
+      entry = cache.lookup(key, request.endpoint)
+      if entry is not None:
+        return Response(entry['body'], status=entry['status'], mimetype=entry['mimetype'])
+
+      # versions are read before the page is built, so a write that lands
+      # while it renders leaves the stored copy already stale
+      versions = cache.versions(g.cache_tags)
+      response = make_response(f(**kwargs))
+      versions.update(cache.versions(list(dict.fromkeys(tag for tag in g.cache_tags if tag not in versions))))
+      if response.status_code != 200:
+        return response
+      if not response.is_streamed:
+        cache.store(key, response.get_data(), response.status_code, response.mimetype, versions)
+        return response
+
+      # streamed pages are stored once the last chunk has been sent
+      def tee(chunks, status, mimetype):
+        body = []
+        size = 0
+        for chunk in chunks:
+          if size <= cache.max_entry_bytes:
+            chunk_bytes = chunk.encode(response.charset) if isinstance(chunk, str) else chunk
+            body.append(chunk_bytes)
+            size += len(chunk_bytes)
+          yield chunk
+        cache.store(key, b''.join(body), status, mimetype, versions)
+      response.response = tee(response.response, response.status_code, response.mimetype)
+      return response
+    return wrapper
+  return decorator
+
+def invalidate_pages(*tags):
+  # called by the writers after a successful commit
+  cache = page_cache()
+  if cache is not None:
+    cache.invalidate(*tags)
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+def venue_areas():
+  # one aggregated pass: every venue LEFT JOINed to its upcoming shows,
+  # ordered by area so consecutive rows can be grouped without lookups
+  rows = db.session.query(
+      Venue.city,
+      Venue.state,
+      Venue.id,
+      Venue.name,
+      func.count(Show.id).label('num_upcoming_shows')
+    ).outerjoin(Show, and_(Show.venue_id == Venue.id, Show.start_time >= func.now())
+    ).group_by(Venue.city, Venue.state, Venue.id, Venue.name
+    ).order_by(Venue.city, Venue.state, Venue.id
+    ).yield_per(1000)
+
+  # structring queried data to desired schema
+  for (city, state), area_rows in groupby(rows, key=lambda row: (row.city, row.state)):
+    yield {
+      "city": city,
+      "state": state,
+      "venues": [{
+        "id": row.id,
+        "name": row.name,
+        "num_upcoming_shows": row.num_upcoming_shows
+      } for row in area_rows]
+    }
+
+def upcoming_show_counts(key, ids):
+  # maps each id in <ids> to its number of upcoming shows, <key> is either
+  # Show.venue_id or Show.artist_id. The aggregate only covers the given ids
+  # so its cost follows the result set rather than the whole Show table
+  ids = list(ids)
+  counts = dict.fromkeys(ids, 0)
+  for start in range(0, len(ids), 500):
+    rows = db.session.query(key, func.count(Show.id)
+      ).filter(key.in_(ids[start:start + 500]), Show.start_time >= func.now()
+      ).group_by(key)
+    counts.update(rows)
+  return counts
+
+def search_entities(model, search_term, page=1):
+  # returns (total matches, one page of <model> rows) ranked by relevance over
+  # name, city, state and genres
+  if db.engine.dialect.name == 'postgresql':
+    vector = literal_column('"{}".search_vector'.format(model.__tablename__))
+    terms = search_words(search_term)
+    if terms:
+      # prefix match on every word, plus the trigram-indexed ILIKE so partial
+      # words inside a name ("usic") still match as they always did
+      tsquery = func.to_tsquery('simple', ' & '.join(term + ':*' for term in terms))
+      query = model.query.filter(or_(
+        vector.op('@@')(tsquery),
+        model.name.ilike('%{}%'.format(search_term))
+      )).order_by(func.ts_rank(vector, tsquery).desc(), model.name, model.id)
+    else:
+      query = model.query.order_by(model.name, model.id)
+    count = query.order_by(None).count()
+    results = query.limit(SEARCH_RESULTS_PER_PAGE).offset((page - 1) * SEARCH_RESULTS_PER_PAGE).all()
+    return count, results
+
+  count, ids = search_index(model).search(search_term, page, SEARCH_RESULTS_PER_PAGE)
+  rows = {row.id: row for row in model.query.filter(model.id.in_(ids))} if ids else {}
+  return count, [rows[id] for id in ids if id in rows]
+
+def search_index(model):
+  # in-memory fallback index, built on first use and kept current by reindex()
+  if model not in search_indexes:
+    index = SearchIndex()
+    rows = db.session.query(model.id, model.name, model.city, model.state, model.genres).yield_per(1000)
+    for row in rows:
+      index.add(row.id, name=row.name, city=row.city, state=row.state, genres=row.genres)
+    search_indexes[model] = index
+  return search_indexes[model]
+
+def reindex(model, id):
+  # called after a committed write; PostgreSQL maintains search_vector itself.
+  # It never raises: the write is already saved, so when the index cannot be
+  # updated it is dropped and rebuilt by the next search
+  index = search_indexes.get(model)
+  if index is None:
+    return
+  try:
+    row = db.session.query(model.id, model.name, model.city, model.state, model.genres).filter(model.id == id).first()
+    if row is None:
+      index.remove(id)
+    else:
+      index.add(row.id, name=row.name, city=row.city, state=row.state, genres=row.genres)
+  except Exception:
+    search_indexes.pop(model, None)
+    app.logger.exception('could not reindex %s %s, the index is rebuilt on the next search', model.__name__, id)
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -104,37 +291,15 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@cached_page('venues')
 def venues():
   # TODO: replace with real venues data.
   #       num_shows should be aggregated based on number of upcoming shows per venue.
 
-  # SQLAlchemy queries 
-  areas = Venue.query.distinct(Venue.city, Venue.state).all()
-  venues = Venue.query.all()
+  # SQLAlchemy queries
   recent_venues = Venue.query.order_by(Venue.id.desc()).limit(10).all()
-  upcoming_shows = Show.query.with_entities(Show.venue_id, func.count(Show.venue_id)).filter(Show.start_time >= func.now()).group_by(Show.venue_id).all()
-
-  # structring queried data to desired schema
-  data = []
-  for area in areas:
-    venues_list = []
-    for venue in venues:
-      if venue.city == area.city:
-        # looping on aggregated shows to find the desired show count
-        num_upcoming_shows = next((item for item in upcoming_shows if item.venue_id == venue.id), (venue.id,0))
-        venue_dictionary = {
-          "id": venue.id,
-          "name": venue.name,
-          "num_upcoming_shows": num_upcoming_shows[1]
-        }
-        venues_list.append(venue_dictionary)
-    data_dictionary={
-      "city": area.city,
-      "state": area.state,
-      "venues": venues_list
-    }
-    data.append(data_dictionary)
-  return render_template('pages/venues.html', areas=data, recent_venues=recent_venues);
+  # areas are grouped lazily so the template consumes rows as they are fetched
+  return render_page('pages/venues.html', areas=venue_areas(), recent_venues=recent_venues)
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
@@ -144,64 +309,57 @@ def search_venues():
 
   # SQLAlchemy queries
   search_term = request.form.get('search_term', '')
-  if ", " in search_term:
-    if search_term[-2:] in state_list:
-      search_result = Venue.query.filter(Venue.city+", "+Venue.state == search_term).all()
-  else:
-    search_result = Venue.query.filter(Venue.name.ilike("%{}%".format(search_term))).all()  
-  upcoming_shows = Show.query.with_entities(Show.venue_id, func.count(Show.venue_id)).filter(Show.start_time >= func.now()).group_by(Show.venue_id).all()
+  page = max(request.form.get('page', 1, type=int), 1)
+  count, search_result = search_entities(Venue, search_term, page)
+  upcoming_shows = upcoming_show_counts(Show.venue_id, (result.id for result in search_result))
 
   # structring queried data to desired schema
-  count = len(search_result) # count the number of upcomig shows by returning the length of the returned list
   data = []  
   for result in search_result:
     data_dictionary={
       "id": result.id,
       "name": result.name,
-      "num_upcoming_shows": next((item for item in upcoming_shows if item.venue_id == result.id), (result.id,0))[1],
-    }  
+      "num_upcoming_shows": upcoming_shows[result.id],
+    }
     data.append(data_dictionary)
   response={
     "count": count,
-    "data": data
+    "data": data,
+    "page": page,
+    "pages": -(-count // SEARCH_RESULTS_PER_PAGE)
   }
   return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 @app.route('/venues/<int:venue_id>')
+@cached_page('venue:{venue_id}')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
 
   # SQLAlchemy queries
-  venue = Venue.query.get(venue_id)
-  shows = Show.query.filter(Show.venue_id==venue.id).all()
-  # past and upcoming shows count aggregating
-  past_shows = Show.query.with_entities(Show.venue_id, func.count(Show.venue_id)).filter(Show.start_time <= func.now()).filter(Show.venue_id==venue.id).group_by(Show.venue_id).all()  
-  upcoming_shows = Show.query.with_entities(Show.venue_id, func.count(Show.venue_id)).filter(Show.start_time > func.now()).filter(Show.venue_id==venue.id).group_by(Show.venue_id).all()
-  # for show in list if show not found return zero
-  past_shows_count = next((show for show in past_shows if show[0] is not 0), (venue.id,0)) 
-  upcoming_shows_count = next((show for show in upcoming_shows if show[0] is not 0), (venue.id,0))
+  # one statement loads the venue, its shows and their artists
+  venue = Venue.query.options(joinedload(Venue.shows).joinedload(Show.artist)).filter(Venue.id == venue_id).one_or_none()
+  if venue is None:
+    abort(404)
 
   # structring queried data to desired schema
+  now = datetime.now()
   past_shows_list = []  
   upcoming_shows_list = []  
-  for show in shows:
-    if show.start_time <= datetime.now():
-      artist = show.artist
-      past_shows_dict= {
-        "artist_id": artist.id,
-        "artist_name": artist.name,
-        "artist_image_link": artist.image_link,
-        "start_time": str(show.start_time)}
-      past_shows_list.append(past_shows_dict)
-    elif show.start_time > datetime.now():
-      artist = show.artist
-      upcoming_shows_dict= {
-        "artist_id": artist.id,
-        "artist_name": artist.name,
-        "artist_image_link": artist.image_link,
-        "start_time": str(show.start_time)}
-      upcoming_shows_list.append(upcoming_shows_dict)          
+  for show in venue.shows:
+    if show.start_time is None:
+      continue
+    artist = show.artist
+    g.cache_tags.append('artist:{}'.format(artist.id))
+    show_dict = {
+      "artist_id": artist.id,
+      "artist_name": artist.name,
+      "artist_image_link": artist.image_link,
+      "start_time": str(show.start_time)}
+    if show.start_time <= now:
+      past_shows_list.append(show_dict)
+    else:
+      upcoming_shows_list.append(show_dict)
   data={
   "id": venue.id,
   "name": venue.name,
@@ -217,8 +375,8 @@ def show_venue(venue_id):
   "image_link": venue.image_link,
   "past_shows": past_shows_list,
   "upcoming_shows": upcoming_shows_list,
-  "past_shows_count": past_shows_count[1],
-  "upcoming_shows_count": upcoming_shows_count[1],
+  "past_shows_count": len(past_shows_list),
+  "upcoming_shows_count": len(upcoming_shows_list),
   }
   return render_template('pages/show_venue.html', venue=data)
 #  Create Venue
@@ -247,6 +405,8 @@ def create_venue_submission():
       facebook_link=req['facebook_link'])
     db.session.add(new_venue)
     db.session.commit()  
+    reindex(Venue, new_venue.id)
+    invalidate_pages('venues')
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
   except:
     db.session.rollback()
@@ -267,6 +427,8 @@ def delete_venue(venue_id):
     deleted_venue = Venue.query.get(venue_id)
     db.session.delete(deleted_venue)
     db.session.commit()
+    reindex(Venue, int(venue_id))
+    invalidate_pages('venues', 'venue:{}'.format(venue_id), 'shows')
   except:
     db.session.rollback()
   finally:    
@@ -278,13 +440,15 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@cached_page('artists')
 def artists():
   # TODO: replace with real data returned from querying the database
   # SQLAlchemy queries
-  data = Artist.query.with_entities(Artist.id, Artist.name).all()
   recent_artists = Artist.query.order_by(Artist.id.desc()).limit(10).all()
+  # rows are fetched from a server-side cursor while the template consumes them
+  data = Artist.query.with_entities(Artist.id, Artist.name).order_by(Artist.id).yield_per(1000)
   # for this part artist model is the same as desired schema
-  return render_template('pages/artists.html', artists=data, recent_artists=recent_artists)
+  return render_page('pages/artists.html', artists=data, recent_artists=recent_artists)
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
@@ -294,64 +458,57 @@ def search_artists():
 
   # SQLAlchemy queries
   search_term = request.form.get('search_term', '')
-  if ", " in search_term:
-    if search_term[-2:] in state_list:
-      search_result = Artist.query.filter(Artist.city+", "+Artist.state == search_term).all()
-  else:
-    search_result = Artist.query.filter(Artist.name.ilike("%{}%".format(search_term))).all()  
-  upcoming_shows = Show.query.with_entities(Show.artist_id, func.count(Show.artist_id)).filter(Show.start_time >= func.now()).group_by(Show.artist_id).all()
+  page = max(request.form.get('page', 1, type=int), 1)
+  count, search_result = search_entities(Artist, search_term, page)
+  upcoming_shows = upcoming_show_counts(Show.artist_id, (result.id for result in search_result))
 
   # structring queried data to desired schema
-  count = len(search_result) # count the number of upcomig shows by returning the length of the returned list
   data = []  
   for result in search_result:
     data_dictionary={
       "id": result.id,
       "name": result.name,
-      "num_upcoming_shows": next((item for item in upcoming_shows if item.artist_id == result.id), (result.id,0))[1],
+      "num_upcoming_shows": upcoming_shows[result.id],
     }
     data.append(data_dictionary)
   response={
     "count": count,
-    "data": data
+    "data": data,
+    "page": page,
+    "pages": -(-count // SEARCH_RESULTS_PER_PAGE)
   }
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/artists/<int:artist_id>')
+@cached_page('artist:{artist_id}')
 def show_artist(artist_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
   
   # SQLAchemy queries
-  artist = Artist.query.get(artist_id)
-  shows = Show.query.filter(Show.artist_id==artist.id).all()
-  # past and upcoming shows count aggregating
-  past_shows = Show.query.with_entities(Show.artist_id, func.count(Show.artist_id)).filter(Show.start_time <= func.now()).filter(Show.artist_id==artist.id).group_by(Show.artist_id).all()  
-  upcoming_shows = Show.query.with_entities(Show.artist_id, func.count(Show.artist_id)).filter(Show.start_time > func.now()).filter(Show.artist_id==artist.id).group_by(Show.artist_id).all()
-  # for show in list if show not found return zero
-  past_shows_count = next((show for show in past_shows if show[0] is not 0), (artist.id,0)) 
-  upcoming_shows_count = next((show for show in upcoming_shows if show[0] is not 0), (artist.id,0))
+  # one statement loads the artist, its shows and their venues
+  artist = Artist.query.options(joinedload(Artist.shows).joinedload(Show.venue)).filter(Artist.id == artist_id).one_or_none()
+  if artist is None:
+    abort(404)
 
   # structring queried data to desired schema
+  now = datetime.now()
   past_shows_list = []  
   upcoming_shows_list = []  
-  for show in shows:
-    if show.start_time < datetime.now():
-      venue = show.venue
-      past_shows_dict= {
-        "venue_id": venue.id,
-        "venue_name": venue.name,
-        "venue_image_link": venue.image_link,
-        "start_time": str(show.start_time)}
-      past_shows_list.append(past_shows_dict)
-    elif show.start_time >= datetime.now():
-      venue = show.venue
-      upcoming_shows_dict= {
-        "venue_id": venue.id,
-        "venue_name": venue.name,
-        "venue_image_link": venue.image_link,
-        "start_time": str(show.start_time)}
-      upcoming_shows_list.append(upcoming_shows_dict)          
+  for show in artist.shows:
+    if show.start_time is None:
+      continue
+    venue = show.venue
+    g.cache_tags.append('venue:{}'.format(venue.id))
+    show_dict = {
+      "venue_id": venue.id,
+      "venue_name": venue.name,
+      "venue_image_link": venue.image_link,
+      "start_time": str(show.start_time)}
+    if show.start_time < now:
+      past_shows_list.append(show_dict)
+    else:
+      upcoming_shows_list.append(show_dict)
   data={
   "id": artist.id,
   "name": artist.name,
@@ -366,8 +523,8 @@ def show_artist(artist_id):
   "image_link": artist.image_link,
   "past_shows": past_shows_list,
   "upcoming_shows": upcoming_shows_list,
-  "past_shows_count": past_shows_count[1],
-  "upcoming_shows_count": upcoming_shows_count[1],
+  "past_shows_count": len(past_shows_list),
+  "upcoming_shows_count": len(upcoming_shows_list),
   }
   return render_template('pages/show_artist.html', artist=data)
 #  Update
@@ -393,6 +550,8 @@ def edit_artist_submission(artist_id):
     artist.phone=req['phone'] 
     artist.facebook_link=req['facebook_link']
     db.session.commit()  
+    reindex(Artist, artist_id)
+    invalidate_pages('artists', 'artist:{}'.format(artist_id), 'shows')
     flash('Artist ' + request.form['name'] + ' was successfully edited!')
   except:
     db.session.rollback()
@@ -424,6 +583,8 @@ def edit_venue_submission(venue_id):
     venue.phone=req['phone'] 
     venue.facebook_link=req['facebook_link']
     db.session.commit()  
+    reindex(Venue, venue_id)
+    invalidate_pages('venues', 'venue:{}'.format(venue_id), 'shows')
     flash('Venue ' + request.form['name'] + ' was successfully edited!')
   except:
     db.session.rollback()
@@ -458,6 +619,8 @@ def create_artist_submission():
       dates=req['availble_dates'])
     db.session.add(new_artist)
     db.session.commit()  
+    reindex(Artist, new_artist.id)
+    invalidate_pages('artists')
     flash('Artist ' + request.form['name'] + ' was successfully listed!')
   except:
     db.session.rollback()
@@ -475,26 +638,61 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@cached_page('shows')
 def shows():
   # displays list of shows at /shows
   # TODO: replace with real venues data.
   #       num_shows should be aggregated based on number of upcoming shows per venue.
+  # shows are paged by a (start_time, id) keyset cursor, so every page costs
+  # one indexed range scan no matter how deep into the list it is
+  per_page = request.args.get('per_page', app.config['SHOWS_PER_PAGE'], type=int)
+  per_page = max(1, min(per_page, MAX_SHOWS_PER_PAGE))
+  upcoming = bool(request.args.get('upcoming', 0, type=int))
+  after = request.args.get('after')
+
   # SQLAchemy queires
-  shows = Show.query.all()
+  query = db.session.query(
+      Show.id,
+      Show.start_time,
+      Venue.id.label('venue_id'),
+      Venue.name.label('venue_name'),
+      Artist.id.label('artist_id'),
+      Artist.name.label('artist_name')
+    ).join(Venue, Venue.id == Show.venue_id
+    ).join(Artist, Artist.id == Show.artist_id
+    ).filter(Show.start_time.isnot(None))
+  if upcoming:
+    query = query.filter(Show.start_time >= datetime.now())
+  if after:
+    try:
+      after_time, after_id = after.rsplit(',', 1)
+      after_key = tuple_(literal(datetime.fromisoformat(after_time)), literal(int(after_id)))
+    except ValueError:
+      abort(400)
+    query = query.filter(tuple_(Show.start_time, Show.id) > after_key)
+  # one extra row tells whether there is a next page
+  rows = query.order_by(Show.start_time, Show.id).limit(per_page + 1).all()
+  next_cursor = None
+  if len(rows) > per_page:
+    rows = rows[:per_page]
+    next_cursor = '{},{}'.format(rows[-1].start_time.isoformat(), rows[-1].id)
 
   # structring queried data to desired schema
   data = []
-  for show in shows:
+  for show in rows:
     data_dictionary= {
-    "venue_id": show.venue.id,
-    "venue_name": show.venue.name,
-    "artist_id": show.artist.id,
-    "artist_name": show.artist.name,
+    "venue_id": show.venue_id,
+    "venue_name": show.venue_name,
+    "artist_id": show.artist_id,
+    "artist_name": show.artist_name,
     "artist_image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
     "start_time": str(show.start_time)
     }
     data.append(data_dictionary)
-  return render_template('pages/shows.html', shows=data)
+  next_url = None
+  if next_cursor:
+    next_url = url_for('shows', after=next_cursor, per_page=per_page, upcoming=1 if upcoming else None)
+  return render_template('pages/shows.html', shows=data, next_url=next_url)
 
 @app.route('/shows/create')
 def create_shows():
@@ -516,6 +714,7 @@ def create_show_submission():
         start_time = req['start_time'])
       db.session.add(new_show)
       db.session.commit()  
+      invalidate_pages('shows', 'venues', 'venue:{}'.format(req['venue_id']), 'artist:{}'.format(req['artist_id']))
       flash('Show was successfully listed!')
     else:
       flash('Date not availble please choose another one')  
@@ -530,6 +729,21 @@ def create_show_submission():
   # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
   return render_template('pages/home.html')
 
+#  Cache
+#  ----------------------------------------------------------------
+
+@app.route('/cache/stats')
+def cache_stats():
+  cache = page_cache()
+  return jsonify(cache.stats() if cache is not None else {'backend': None})
+
+#  Admin
+#  ----------------------------------------------------------------
+
+@app.route('/admin/pool')
+def database_pool_stats():
+  return jsonify(pool_stats(db.engine))
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -0,0 +1,50 @@
+'''
+Buffered against streamed rendering of the large listing pages.
+
+  python -m benchmarks.bench_streaming [rows]
+
+Seeds <rows> artists and venues (100000 by default) and reports, for each
+mode, time to first byte, total time and the peak Python memory allocated
+while the response is produced and read chunk by chunk.
+'''
+import sys
+import time
+import tracemalloc
+
+from benchmarks.common import setup_app, seed
+
+
+def measure(client, url):
+  tracemalloc.start()
+  start = time.perf_counter()
+  response = client.get(url, buffered=False)
+  first_byte = None
+  size = 0
+  for chunk in response.iter_encoded():
+    if first_byte is None:
+      first_byte = time.perf_counter() - start
+    size += len(chunk)
+  total = time.perf_counter() - start
+  response.close()
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  return first_byte, total, peak, size
+
+
+def main(rows=100000):
+  app = setup_app()
+  client = app.test_client()
+  with app.app_context():
+    seed(venues=rows, artists=rows, shows=0, areas=rows // 100)
+  print('{:<10} {:<9} {:>10} {:>10} {:>10} {:>12}'.format(
+    'page', 'mode', 'ttfb s', 'total s', 'peak MiB', 'bytes'))
+  for url, endpoint in (('/artists', 'artists'), ('/venues', 'venues')):
+    for mode, streamed in (('buffered', []), ('streamed', [endpoint])):
+      app.config['STREAMED_PAGES'] = streamed
+      first_byte, total, peak, size = measure(client, url)
+      print('{:<10} {:<9} {:>10.3f} {:>10.3f} {:>10.1f} {:>12}'.format(
+        url, mode, first_byte, total, peak / 2 ** 20, size))
+
+
+if __name__ == '__main__':
+  main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,25 @@
+'''
+GET /venues render time against the number of venues.
+
+  python -m benchmarks.bench_venues
+
+A linear listing keeps the per-venue cost flat while the row count doubles.
+'''
+from benchmarks.common import setup_app, seed, timed
+
+SIZES = [1000, 2000, 4000, 8000, 16000]
+
+
+def main():
+  app = setup_app()
+  client = app.test_client()
+  print('{:>8} {:>10} {:>14}'.format('venues', 'seconds', 'us per venue'))
+  with app.app_context():
+    for size in SIZES:
+      seed(venues=size, artists=size // 10, shows=size * 2)
+      elapsed = timed(lambda: client.get('/venues'))
+      print('{:>8} {:>10.3f} {:>14.1f}'.format(size, elapsed, elapsed / size * 1e6))
+
+
+if __name__ == '__main__':
+  main()
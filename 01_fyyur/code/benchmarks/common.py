@@ -0,0 +1,68 @@
+'''
+Shared helpers for the Fyyur benchmarks.
+
+Benchmarks run against a throwaway SQLite database by default, set
+BENCH_DATABASE_URL to point them at a local PostgreSQL instead.
+'''
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from app import app, db, Venue, Artist, Show
+from pool import engine_options
+
+BENCH_DATABASE_URL = os.environ.get(
+  'BENCH_DATABASE_URL',
+  'sqlite:///{}'.format(os.path.join(tempfile.gettempdir(), 'fyyur_bench.db')))
+
+
+def setup_app():
+  app.config['SQLALCHEMY_DATABASE_URI'] = BENCH_DATABASE_URL
+  app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(BENCH_DATABASE_URL)
+  app.config['WTF_CSRF_ENABLED'] = False
+  # measure rendering, not cache hits
+  app.config['CACHE_BACKEND'] = None
+  return app
+
+
+def seed(venues=0, artists=0, shows=0, areas=50):
+  # wipes the database and bulk inserts synthetic rows
+  db.drop_all()
+  db.create_all()
+  now = datetime.now()
+  db.session.bulk_insert_mappings(Venue, [{
+    "id": i,
+    "name": "Venue {}".format(i),
+    "city": "City {}".format(i % areas),
+    "state": "CA",
+    "genres": "Jazz,Rock",
+    "address": "{} Main St".format(i)
+  } for i in range(1, venues + 1)])
+  db.session.bulk_insert_mappings(Artist, [{
+    "id": i,
+    "name": "Artist {}".format(i),
+    "city": "City {}".format(i % areas),
+    "state": "CA",
+    "genres": "Jazz",
+    "dates": ""
+  } for i in range(1, artists + 1)])
+  db.session.bulk_insert_mappings(Show, [{
+    "id": i,
+    "venue_id": random.randint(1, venues),
+    "artist_id": random.randint(1, artists),
+    "start_time": now + timedelta(days=random.randint(-365, 365))
+  } for i in range(1, shows + 1)])
+  db.session.commit()
+
+
+def timed(fn, repeat=3):
+  # best of <repeat> wall clock runs, in seconds
+  best = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return best
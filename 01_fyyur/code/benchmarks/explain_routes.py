@@ -0,0 +1,116 @@
+'''
+Runs EXPLAIN on every SELECT issued by the read routes and fails when a
+plan contains a sequential scan.
+
+  python -m benchmarks.explain_routes
+
+It checks the database configured for the app (run `flask db upgrade`
+first so the index migration is applied). On PostgreSQL sequential scans
+are disabled for the session, so a "Seq Scan" left in a plan means no
+index can serve the predicate at all, whatever the table size. The only
+scans allowed are the whole-table reads listed in FULL_TABLE_READS, any
+other sequential scan fails the check.
+'''
+import sys
+
+from sqlalchemy import event
+
+from app import app, db, Venue, Artist
+
+# statements without a WHERE clause that read a whole table on purpose: the
+# venue and artist listings, and the first search of a process, which builds
+# the search index from every row
+FULL_TABLE_READS = {
+  ('GET', '/venues'): {'Venue'},
+  ('GET', '/artists'): {'Artist'},
+  ('POST', '/venues/search'): {'Venue'},
+  ('POST', '/artists/search'): {'Artist'},
+}
+
+
+def routes():
+  venue = Venue.query.order_by(Venue.id).first()
+  artist = Artist.query.order_by(Artist.id).first()
+  checked = [
+    ('GET', '/venues', None),
+    ('GET', '/artists', None),
+    ('GET', '/shows', None),
+    ('POST', '/venues/search', {'search_term': 'Music'}),
+    ('POST', '/artists/search', {'search_term': 'Band'}),
+  ]
+  if venue:
+    checked.append(('GET', '/venues/{}'.format(venue.id), None))
+    checked.append(('POST', '/venues/search', {'search_term': '{}, {}'.format(venue.city, venue.state)}))
+  if artist:
+    checked.append(('GET', '/artists/{}'.format(artist.id), None))
+  return checked
+
+
+def capture(client, method, url, data):
+  # records every SELECT the route sends to the database
+  statements = []
+
+  def record(conn, cursor, statement, parameters, context, executemany):
+    if statement.lstrip().upper().startswith('SELECT'):
+      statements.append((statement, parameters))
+
+  event.listen(db.engine, 'before_cursor_execute', record)
+  try:
+    client.open(url, method=method, data=data)
+  finally:
+    event.remove(db.engine, 'before_cursor_execute', record)
+  return statements
+
+
+def sequential_scans(cursor, dialect, statement, parameters):
+  if dialect == 'postgresql':
+    cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+    plan = cursor.fetchone()[0][0]['Plan']
+    found = []
+    nodes = [plan]
+    while nodes:
+      node = nodes.pop()
+      if node['Node Type'] == 'Seq Scan':
+        found.append(node['Relation Name'])
+      nodes.extend(node.get('Plans', []))
+    return found
+  cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+  details = [row[-1] for row in cursor.fetchall()]
+  # "SCAN t" walks the table, "SCAN t USING INDEX" and "SEARCH t" do not
+  return [detail.split()[-1] for detail in details
+          if detail.startswith('SCAN') and 'USING' not in detail and 'CONSTANT ROW' not in detail]
+
+
+def main():
+  failures = 0
+  client = app.test_client()
+  with app.app_context():
+    dialect = db.engine.dialect.name
+    connection = db.engine.raw_connection()
+    try:
+      cursor = connection.cursor()
+      if dialect == 'postgresql':
+        cursor.execute('SET enable_seqscan = off')
+      for method, url, data in routes():
+        failed = False
+        for statement, parameters in capture(client, method, url, data):
+          scans = sequential_scans(cursor, dialect, statement, parameters)
+          allowed = set()
+          if ' WHERE ' not in ' '.join(statement.upper().split()):
+            allowed = FULL_TABLE_READS.get((method, url), set())
+          unexpected = [table for table in scans if table not in allowed]
+          if unexpected:
+            failed = True
+            print('FAIL {} {}: sequential scan on {}'.format(method, url, ', '.join(unexpected)))
+            print('     ' + ' '.join(statement.split()))
+        if failed:
+          failures += 1
+        else:
+          print('ok   {} {}'.format(method, url))
+    finally:
+      connection.close()
+  return 1 if failures else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,171 @@
+'''
+Page cache for Fyyur.
+
+Rendered pages are stored with the version of every tag they depend on
+("venues", "venue:3", ...). Writers bump the versions of the tags they
+touch, so a cached page is served only while none of its tags changed and
+its TTL has not run out. Two backends are available: an in-process LRU and
+a Redis (or Redis-compatible) server shared between workers.
+'''
+import pickle
+import threading
+import time
+from collections import Counter, OrderedDict
+
+try:
+    import redis
+except ImportError:  # only needed for CACHE_BACKEND = 'redis'
+    redis = None
+
+
+class LRUBackend:
+    '''Least recently used entries are evicted past <max_entries>.'''
+    name = 'lru'
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def versions(self, tags):
+        return [self._versions.get(tag, 0) for tag in tags]
+
+    def bump(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+
+class RedisBackend:
+    '''Entries expire through Redis TTLs, size is bounded by the server's maxmemory.'''
+    name = 'redis'
+
+    def __init__(self, url, prefix='fyyur:'):
+        if redis is None:
+            raise RuntimeError("CACHE_BACKEND = 'redis' requires the redis package")
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def __len__(self):
+        return sum(1 for _ in self._client.scan_iter(self._prefix + 'page:*'))
+
+    def get(self, key):
+        value = self._client.get(self._prefix + 'page:' + key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self._client.set(self._prefix + 'page:' + key, pickle.dumps(value), ex=ttl)
+
+    def versions(self, tags):
+        if not tags:
+            return []
+        values = self._client.mget([self._prefix + 'tag:' + tag for tag in tags])
+        return [int(value or 0) for value in values]
+
+    def bump(self, tags):
+        pipeline = self._client.pipeline()
+        for tag in tags:
+            pipeline.incr(self._prefix + 'tag:' + tag)
+        pipeline.execute()
+
+    def clear(self):
+        for key in self._client.scan_iter(self._prefix + '*'):
+            self._client.delete(key)
+
+
+class PageCache:
+    def __init__(self, backend, ttl=60, max_entry_bytes=4 * 1024 * 1024):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes
+        self.hits = Counter()
+        self.misses = Counter()
+
+    @classmethod
+    def from_config(cls, config):
+        '''Returns None when CACHE_BACKEND is not set, which turns caching off.'''
+        name = config.get('CACHE_BACKEND')
+        if not name:
+            return None
+        if name == 'lru':
+            backend = LRUBackend(config.get('CACHE_MAX_ENTRIES', 1024))
+        elif name == 'redis':
+            backend = RedisBackend(config['CACHE_REDIS_URL'])
+        else:
+            raise ValueError('unknown CACHE_BACKEND {!r}'.format(name))
+        return cls(backend, config.get('CACHE_TTL', 60), config.get('CACHE_MAX_ENTRY_BYTES', 4 * 1024 * 1024))
+
+    def lookup(self, key, endpoint):
+        entry = self.backend.get(key)
+        if entry is not None:
+            tags = list(entry['tags'])
+            if self.backend.versions(tags) == [entry['tags'][tag] for tag in tags]:
+                self.hits[endpoint] += 1
+                return entry
+        self.misses[endpoint] += 1
+        return None
+
+    def versions(self, tags):
+        return dict(zip(tags, self.backend.versions(tags)))
+
+    def store(self, key, body, status, mimetype, tags):
+        # <tags> maps every tag to the version read before the page was built
+        if len(body) > self.max_entry_bytes:
+            return
+        self.backend.set(key, {
+            'body': body,
+            'status': status,
+            'mimetype': mimetype,
+            'tags': tags
+        }, self.ttl)
+
+    def invalidate(self, *tags):
+        self.backend.bump(tags)
+
+    def clear(self):
+        self.backend.clear()
+        self.hits.clear()
+        self.misses.clear()
+
+    def stats(self):
+        hits = sum(self.hits.values())
+        misses = sum(self.misses.values())
+        return {
+            'backend': self.backend.name,
+            'entries': len(self.backend),
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / (hits + misses) if hits + misses else 0.0,
+            'endpoints': {
+                endpoint: {'hits': self.hits[endpoint], 'misses': self.misses[endpoint]}
+                for endpoint in set(self.hits) | set(self.misses)
+            }
+        }
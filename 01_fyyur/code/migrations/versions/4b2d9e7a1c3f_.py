@@ -0,0 +1,44 @@
+"""add indexes for hot query predicates
+
+Revision ID: 4b2d9e7a1c3f
+Revises: 8c5b70ffe7d2
+Create Date: 2026-10-18 18:52:10.418203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b2d9e7a1c3f'
+down_revision = '8c5b70ffe7d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'], unique=False)
+    op.create_index('ix_Venue_city_state', 'Venue', ['city', 'state'], unique=False)
+    op.create_index('ix_Artist_city_state', 'Artist', ['city', 'state'], unique=False)
+
+    # case-insensitive substring search (name ILIKE '%term%') can only use
+    # an index through trigrams, which is a PostgreSQL extension
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index('ix_Venue_name_trgm', 'Venue', ['name'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+        op.create_index('ix_Artist_name_trgm', 'Artist', ['name'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_Artist_name_trgm', table_name='Artist')
+        op.drop_index('ix_Venue_name_trgm', table_name='Venue')
+    op.drop_index('ix_Artist_city_state', table_name='Artist')
+    op.drop_index('ix_Venue_city_state', table_name='Venue')
+    op.drop_index('ix_Show_start_time_id', table_name='Show')
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
@@ -0,0 +1,43 @@
+"""add search vectors for venue and artist search
+
+Revision ID: 9e1f6c2a7b84
+Revises: 4b2d9e7a1c3f
+Create Date: 2026-10-18 19:20:41.106532
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e1f6c2a7b84'
+down_revision = '4b2d9e7a1c3f'
+branch_labels = None
+depends_on = None
+
+# name outranks the location, which outranks the genres
+SEARCH_VECTOR = """
+    setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(city, '') || ' ' || coalesce(state, '')), 'B') ||
+    setweight(to_tsvector('simple', replace(coalesce(genres, ''), ',', ' ')), 'C')
+"""
+
+
+def upgrade():
+    # other databases search through the in-memory index in search.py
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in ('Venue', 'Artist'):
+        op.execute(
+            'ALTER TABLE "{}" ADD COLUMN search_vector tsvector '
+            'GENERATED ALWAYS AS ({}) STORED'.format(table, SEARCH_VECTOR))
+        op.create_index('ix_{}_search_vector'.format(table), table, ['search_vector'],
+                        unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in ('Artist', 'Venue'):
+        op.drop_index('ix_{}_search_vector'.format(table), table_name=table)
+        op.drop_column(table, 'search_vector')
@@ -0,0 +1,85 @@
+'''
+Database connection pool settings and statistics.
+
+The pool is sized from the environment so workers can be tuned against
+PostgreSQL without code changes:
+
+  DB_POOL_SIZE          connections kept open (5)
+  DB_MAX_OVERFLOW       extra connections allowed under load (10)
+  DB_POOL_TIMEOUT       seconds to wait for a free connection (30)
+  DB_POOL_RECYCLE       seconds before a connection is replaced (1800)
+  DB_POOL_PRE_PING      test connections before handing them out (true)
+  DB_STATEMENT_TIMEOUT  PostgreSQL statement_timeout in ms, 0 is off (0)
+'''
+import os
+import time
+
+from sqlalchemy.pool import QueuePool
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def env_bool(name, default):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+class TimedQueuePool(QueuePool):
+    '''QueuePool that records how long checkouts wait for a connection.'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            self.checkouts += 1
+            self.wait_time += waited
+            self.max_wait = max(self.max_wait, waited)
+
+
+def engine_options(database_uri):
+    '''Options for create_engine, SQLite keeps its default pool.'''
+    if database_uri.startswith('sqlite'):
+        return {}
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': env_int('DB_POOL_SIZE', 5),
+        'max_overflow': env_int('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': env_int('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': env_int('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': env_bool('DB_POOL_PRE_PING', True),
+    }
+    statement_timeout = env_int('DB_STATEMENT_TIMEOUT', 0)
+    if statement_timeout and database_uri.startswith('postgres'):
+        options['connect_args'] = {'options': '-c statement_timeout={}'.format(statement_timeout)}
+    return options
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            # overflow() counts up from -size while the pool fills up
+            'overflow': max(pool.overflow(), 0),
+            'max_overflow': pool._max_overflow,
+        })
+    if isinstance(pool, TimedQueuePool):
+        stats.update({
+            'checkouts': pool.checkouts,
+            'wait_seconds_total': round(pool.wait_time, 6),
+            'wait_seconds_avg': round(pool.wait_time / pool.checkouts, 6) if pool.checkouts else 0.0,
+            'wait_seconds_max': round(pool.max_wait, 6),
+        })
+    return stats
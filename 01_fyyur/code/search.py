@@ -0,0 +1,116 @@
+'''
+Search index for venues and artists.
+
+On PostgreSQL searches are answered by the database from the precomputed
+search_vector column and the trigram name index (see the migrations).
+Other databases, SQLite in tests in particular, fall back to SearchIndex:
+a pure Python inverted index held in memory and updated as rows change.
+'''
+import re
+from collections import defaultdict
+
+# fields covered by the index and their relevance weight
+WEIGHTS = (('name', 4), ('city', 2), ('state', 2), ('genres', 1))
+
+WORD = re.compile(r'\w+')
+
+
+def words(text):
+    return WORD.findall((text or '').lower())
+
+
+def trigrams(word):
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+class SearchIndex:
+    '''
+    Inverted index over the words of every document. A query word matches a
+    document when it is a substring of one of the document words, which keeps
+    the partial, case-insensitive behaviour of ILIKE '%term%'. Words of three
+    letters or more are looked up through trigrams, shorter ones through the
+    vocabulary.
+    '''
+    def __init__(self):
+        self._documents = {}
+        self._words = defaultdict(set)
+        self._trigrams = defaultdict(set)
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, doc_id, **fields):
+        self.remove(doc_id)
+        document = {field: set(words(fields.get(field))) for field, _ in WEIGHTS}
+        document['sort_key'] = ((fields.get('name') or '').lower(), doc_id)
+        self._documents[doc_id] = document
+        for word in set().union(*(document[field] for field, _ in WEIGHTS)):
+            self._words[word].add(doc_id)
+            for gram in trigrams(word):
+                self._trigrams[gram].add(doc_id)
+
+    def remove(self, doc_id):
+        document = self._documents.pop(doc_id, None)
+        if document is None:
+            return
+        for word in set().union(*(document[field] for field, _ in WEIGHTS)):
+            self._discard(self._words, word, doc_id)
+            for gram in trigrams(word):
+                self._discard(self._trigrams, gram, doc_id)
+
+    def search(self, term, page=1, per_page=20):
+        '''
+        Returns the total number of matches and the ids on the requested
+        page, best match first.
+        '''
+        query = words(term)
+        if query:
+            candidates = None
+            for word in query:
+                matches = self._candidates(word)
+                candidates = matches if candidates is None else candidates & matches
+                if not candidates:
+                    break
+            scored = []
+            for doc_id in candidates:
+                score = self._score(doc_id, query)
+                if score:
+                    scored.append((-score, self._documents[doc_id]['sort_key']))
+        else:
+            scored = [(0, document['sort_key']) for document in self._documents.values()]
+        scored.sort()
+        start = (page - 1) * per_page
+        return len(scored), [sort_key[1] for _, sort_key in scored[start:start + per_page]]
+
+    def _candidates(self, word):
+        if len(word) < 3:
+            return set().union(*(ids for known, ids in self._words.items() if word in known))
+        grams = sorted(trigrams(word), key=lambda gram: len(self._trigrams.get(gram, ())))
+        candidates = set(self._trigrams.get(grams[0], ()))
+        for gram in grams[1:]:
+            candidates &= self._trigrams.get(gram, set())
+        return candidates
+
+    def _score(self, doc_id, query):
+        # trigrams only narrow the candidates, the substring check is exact
+        document = self._documents[doc_id]
+        score = 0
+        for word in query:
+            matched = 0
+            for field, weight in WEIGHTS:
+                if word in document[field]:
+                    matched += 2 * weight
+                elif any(word in known for known in document[field]):
+                    matched += weight
+            if not matched:
+                return 0
+            score += matched
+        return score
+
+    @staticmethod
+    def _discard(postings, key, doc_id):
+        ids = postings.get(key)
+        if ids is not None:
+            ids.discard(doc_id)
+            if not ids:
+                del postings[key]
@@ -0,0 +1,219 @@
+import json
+import os
+import re
+import threading
+import unittest
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from unittest import mock
+
+from sqlalchemy import create_engine, event
+
+from app import app, db, Venue, Artist, Show, search_indexes
+from pool import engine_options, TimedQueuePool
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {}
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client
+        self.context = app.app_context()
+        self.context.push()
+        db.create_all()
+        search_indexes.clear()
+        app.extensions.pop('page_cache', None)
+
+        venue = Venue(name='The Musical Hop', city='San Francisco', state='CA', genres='Jazz,Reggae')
+        artist = Artist(name='Guns N Petals', city='San Francisco', state='CA', genres='Rock n Roll', dates='')
+        db.session.add_all([venue, artist])
+        db.session.commit()
+        self.venue_id = venue.id
+        self.artist_id = artist.id
+        self.add_shows(-30, 30, 60)
+
+    def tearDown(self):
+        """Executed after reach test"""
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    @contextmanager
+    def assertMaxQueries(self, limit):
+        """Fails when the block sends more than <limit> statements to the database."""
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertLessEqual(len(statements), limit, '\n'.join(statements))
+
+    def add_shows(self, *days):
+        now = datetime.now()
+        db.session.add_all([Show(venue_id=self.venue_id, artist_id=self.artist_id,
+                                 start_time=now + timedelta(days=day)) for day in days])
+        db.session.commit()
+        # start every request from an empty session, as a real one would
+        db.session.remove()
+
+    def test_GET_venue_200(self):
+        with self.assertMaxQueries(1):
+            res = self.client().get('/venues/{}'.format(self.venue_id))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'The Musical Hop', res.data)
+        self.assertIn(b'Guns N Petals', res.data)
+
+    def test_GET_venue_queries_do_not_grow_with_shows(self):
+        self.add_shows(*range(1, 26))
+        with self.assertMaxQueries(1):
+            res = self.client().get('/venues/{}'.format(self.venue_id))
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_GET_venue_not_found_404(self):
+        res = self.client().get('/venues/1000')
+
+        self.assertEqual(res.status_code, 404)
+
+    def test_GET_artist_200(self):
+        self.add_shows(*range(1, 26))
+        with self.assertMaxQueries(1):
+            res = self.client().get('/artists/{}'.format(self.artist_id))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'The Musical Hop', res.data)
+
+    def test_GET_artist_not_found_404(self):
+        res = self.client().get('/artists/1000')
+
+        self.assertEqual(res.status_code, 404)
+
+    def test_GET_venues_200(self):
+        self.add_shows(*range(1, 26))
+        with self.assertMaxQueries(2):
+            res = self.client().get('/venues')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'San Francisco, CA', res.data)
+
+    def test_POST_search_venues_200(self):
+        res = self.client().post('/venues/search', data={'search_term': 'music'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'The Musical Hop', res.data)
+        self.assertIn(b': 1</h3>', res.data)
+
+    def test_POST_search_venues_page_below_one(self):
+        res = self.client().post('/venues/search', data={'search_term': 'music', 'page': -2})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'The Musical Hop', res.data)
+
+    def test_POST_create_venue_survives_reindex_failure(self):
+        self.client().post('/venues/search', data={'search_term': 'music'})
+        with mock.patch.object(search_indexes[Venue], 'add', side_effect=RuntimeError):
+            res = self.client().post('/venues/create', data={
+                'name': 'Park Square Live Music', 'genres': 'Jazz', 'address': '34 Whiskey Moore Ave',
+                'city': 'San Francisco', 'state': 'CA', 'phone': '', 'facebook_link': ''})
+
+        self.assertIn(b'was successfully listed', res.data)
+        self.assertIsNotNone(Venue.query.filter_by(name='Park Square Live Music').first())
+        # the dropped index is rebuilt with the new venue
+        res = self.client().post('/venues/search', data={'search_term': 'park square'})
+        self.assertIn(b'Park Square Live Music', res.data)
+
+    def test_GET_shows_keyset_pages(self):
+        self.add_shows(*range(1, 6))
+        seen = []
+        url = '/shows?per_page=3'
+        while url:
+            with self.assertMaxQueries(1):
+                res = self.client().get(url)
+            self.assertEqual(res.status_code, 200)
+            seen.append(res.data.count(b'tile-show'))
+            next_url = re.search(rb'href="(/shows\?[^"]+)"', res.data)
+            url = next_url.group(1).decode().replace('&amp;', '&') if next_url else None
+
+        self.assertEqual(seen, [3, 3, 2])
+
+    def test_GET_shows_upcoming_only(self):
+        res = self.client().get('/shows?upcoming=1')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data.count(b'tile-show'), 2)
+
+    def test_GET_venue_served_from_cache(self):
+        self.client().get('/venues/{}'.format(self.venue_id))
+        with self.assertMaxQueries(0):
+            res = self.client().get('/venues/{}'.format(self.venue_id))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'The Musical Hop', res.data)
+
+    def test_POST_edit_artist_invalidates_cached_pages(self):
+        self.client().get('/venues/{}'.format(self.venue_id))
+        self.client().get('/artists')
+        self.client().post('/artists/{}/edit'.format(self.artist_id), data={
+            'name': 'The Wild Sax Band', 'genres': 'Jazz', 'city': 'San Francisco',
+            'state': 'CA', 'phone': '', 'facebook_link': ''})
+        with self.client() as client:
+            # drop the flashed message so the pages are cacheable again
+            with client.session_transaction() as session:
+                session.pop('_flashes', None)
+            venue_page = client.get('/venues/{}'.format(self.venue_id))
+            artists_page = client.get('/artists')
+
+        self.assertIn(b'The Wild Sax Band', venue_page.data)
+        self.assertIn(b'The Wild Sax Band', artists_page.data)
+
+    def test_GET_cache_stats_200(self):
+        self.client().get('/shows')
+        self.client().get('/shows')
+        res = self.client().get('/cache/stats')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['hits'], 1)
+        self.assertEqual(data['misses'], 1)
+
+    def test_GET_admin_pool_reports_checkouts(self):
+        env = {'DB_POOL_SIZE': '1', 'DB_MAX_OVERFLOW': '0', 'DB_POOL_TIMEOUT': '5',
+               'DB_POOL_RECYCLE': '60', 'DB_POOL_PRE_PING': 'false', 'DB_STATEMENT_TIMEOUT': '500'}
+        with mock.patch.dict(os.environ, env):
+            options = engine_options('postgresql://localhost/fyyur')
+        self.assertEqual(options.pop('connect_args'), {'options': '-c statement_timeout=500'})
+        self.assertEqual(options, {'poolclass': TimedQueuePool, 'pool_size': 1, 'max_overflow': 0,
+                                   'pool_timeout': 5, 'pool_recycle': 60, 'pool_pre_ping': False})
+
+        # the same pool over SQLite, its only connection is released after 0.2 s
+        engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, **options)
+        self.addCleanup(engine.dispose)
+        held = engine.connect()
+        threading.Timer(0.2, held.close).start()
+        with engine.connect():
+            with mock.patch.object(type(db), 'engine', new_callable=mock.PropertyMock,
+                                   return_value=engine):
+                res = self.client().get('/admin/pool')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['pool'], 'TimedQueuePool')
+        self.assertEqual(data['checked_out'], 1)
+        self.assertEqual(data['checkouts'], 2)
+        self.assertGreaterEqual(data['wait_seconds_max'], 0.15)
+        self.assertGreaterEqual(data['wait_seconds_total'], data['wait_seconds_max'])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
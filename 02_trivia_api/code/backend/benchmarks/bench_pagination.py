@@ -0,0 +1,108 @@
+'''
+GET /questions page cost against the number of questions.
+
+    python -m benchmarks.bench_pagination [questions ...]
+
+Grows a throwaway SQLite database (BENCH_DATABASE_URL points it at a local
+PostgreSQL instead, its tables are dropped first) to each size (10000,
+100000 and 1000000 questions by default) and reports the median time of the first, middle and last page for
+the previous implementation (every question loaded and formatted, then
+sliced), LIMIT/OFFSET pages and ?after_id= pages, with the number of
+queries each request runs. ?after_id= pages cost the same at any depth,
+OFFSET pages grow with the rows the database skips. The previous implementation is skipped above
+LEGACY_LIMIT questions, it needs the whole table in memory.
+'''
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = os.environ.get(
+    'BENCH_DATABASE_URL', 'sqlite:///{}'.format(DATABASE_PATH))
+
+from sqlalchemy import event  # noqa: E402
+
+from flaskr import create_app, QUESTIONS_PER_PAGE  # noqa: E402
+from models import db, Question, QuestionCount, Category  # noqa: E402
+
+SIZES = [10000, 100000, 1000000]
+LEGACY_LIMIT = 100000
+REPEAT = 20
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+
+
+def legacy_page(page):
+    questions = Question.query.order_by(Question.category).all()
+    formatted = [question.format() for question in questions]
+    start = (page - 1) * QUESTIONS_PER_PAGE
+    return formatted[start:start + QUESTIONS_PER_PAGE], len(questions)
+
+
+def seed(start, stop, batch_size=20000):
+    table = Question.__table__
+    for first in range(start, stop, batch_size):
+        db.session.execute(table.insert(), [{
+            'question': 'Question {}'.format(i),
+            'answer': 'Answer {}'.format(i),
+            'category': i % len(CATEGORIES) + 1,
+            'difficulty': i % 5 + 1
+        } for i in range(first, min(first + batch_size, stop))])
+    db.session.commit()
+    QuestionCount.rebuild()
+
+
+def measure(request, statements):
+    times = []
+    for _ in range(REPEAT):
+        del statements[:]
+        started = time.perf_counter()
+        request()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times) * 1000, len(statements)
+
+
+def main(*sizes):
+    app = create_app()
+    client = app.test_client()
+    statements = []
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add_all([Category(type) for type in CATEGORIES])
+        db.session.commit()
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda *args: statements.append(args[2]))
+        print('{:>9} {:<8} {:<7} {:>10} {:>8}'.format(
+            'questions', 'mode', 'page', 'median ms', 'queries'))
+        seeded = 0
+        for size in sizes or SIZES:
+            seed(seeded, size)
+            seeded = size
+            pages = size // QUESTIONS_PER_PAGE
+            ids = [i for i, in db.session.query(Question.id).order_by(Question.id)
+                   .offset(size // 2).limit(1)] + [
+                   i for i, in db.session.query(Question.id).order_by(Question.id.desc())
+                   .offset(QUESTIONS_PER_PAGE).limit(1)]
+            runs = [
+                ('offset', 'first', lambda: client.get('/questions?page=1')),
+                ('offset', 'middle', lambda: client.get('/questions?page={}'.format(pages // 2))),
+                ('offset', 'last', lambda: client.get('/questions?page={}'.format(pages))),
+                ('after_id', 'first', lambda: client.get('/questions?after_id=0')),
+                ('after_id', 'middle', lambda: client.get('/questions?after_id={}'.format(ids[0]))),
+                ('after_id', 'last', lambda: client.get('/questions?after_id={}'.format(ids[1]))),
+            ]
+            if size <= LEGACY_LIMIT:
+                runs.insert(0, ('legacy', 'first', lambda: legacy_page(1)))
+            for mode, page, request in runs:
+                elapsed, queries = measure(request, statements)
+                print('{:>9} {:<8} {:<7} {:>10.2f} {:>8}'.format(
+                    size, mode, page, elapsed, queries))
+        db.session.remove()
+    if os.path.exists(DATABASE_PATH):
+        os.remove(DATABASE_PATH)
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -1,19 +1,84 @@
 import os
+import json
+import click
 from flask import Flask, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
 
-from models import setup_db, Question, Category
+from models import db, setup_db, pool_stats, Question, QuestionCount
+from .catalog import CategoryCatalog
+from .search import search_backend, search_questions
+from .quiz import random_question, build_deck, session_store_from_env
+from .ingest import iter_ndjson, ingest
 
 # Change this variable with to change questions per page
 QUESTIONS_PER_PAGE = 10
+# seconds a worker serves the category list before reading it again, its
+# own writes refresh it immediately
+CATEGORIES_CACHE_TTL = int(os.environ.get('CATEGORIES_CACHE_TTL', 300))
+# most questions dealt to one quiz session
+QUIZ_DECK_SIZE = int(os.environ.get('QUIZ_DECK_SIZE', 1000))
+# questions per transaction of a bulk ingestion
+INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', 5000))
 
 # flask app setup
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
   setup_db(app)
+
+  catalog = CategoryCatalog(CATEGORIES_CACHE_TTL)
+  quiz_sessions = session_store_from_env()
+  # picked once, restart the app after `flask create-search-index`
+  search = search_backend()
+
+  @app.cli.command('create-search-index')
+  def create_search_index():
+    '''Installs the full-text search index and indexes every question.'''
+    backend = search_backend(installed_only=False)
+    backend.install()
+    click.echo('{} search index ready, {} questions'.format(
+      backend.name, QuestionCount.total()))
+
+  @app.cli.command('ingest-questions')
+  @click.argument('source', type=click.File('rb'))
+  @click.option('--batch-size', default=INGEST_BATCH_SIZE, show_default=True,
+                help='Questions per transaction.')
+  @click.option('--checkpoint', type=click.Path(dir_okay=False),
+                help='File recording the last committed row, a rerun resumes after it.')
+  def ingest_questions(source, batch_size, checkpoint):
+    '''Loads questions from a newline delimited json SOURCE ("-" for stdin).'''
+    start_row = 0
+    if checkpoint and os.path.exists(checkpoint):
+      with open(checkpoint) as f:
+        start_row = json.load(f)['last_row']
+      click.echo('resuming after row {}'.format(start_row), err=True)
+
+    def save_checkpoint(report):
+      if checkpoint:
+        with open(checkpoint, 'w') as f:
+          json.dump({'last_row': report['last_row']}, f)
+
+    def progress(report):
+      save_checkpoint(report)
+      click.echo('row {last_row}: {inserted} inserted, {failed} failed'.format(**report),
+                 err=True)
+
+    report = ingest(iter_ndjson(source), set(catalog.snapshot().types), batch_size,
+                    start_row, on_commit=progress,
+                    on_error=lambda row, error: click.echo(
+                      'row {}: {}'.format(row, error), err=True))
+    save_checkpoint(report)
+    click.echo('{rows} rows in {seconds} s ({rows_per_second} rows/s): '
+               '{inserted} inserted, {failed} failed'.format(**report))
+    if 'error' in report:
+      raise click.ClickException(report['error'])
+
+  @app.cli.command('rebuild-question-counts')
+  def rebuild_question_counts():
+    '''Counts the questions of every category again.'''
+    QuestionCount.rebuild()
+    click.echo('{} questions'.format(QuestionCount.total()))
   
   '''
   @DONE: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -34,14 +99,15 @@ def create_app(test_config=None):
   Create an endpoint to handle GET requests 
   for all available categories.
   '''
+  # served from the catalog's encoded body, answered with 304 when the
+  # client sends its ETag in If-None-Match
   @app.route('/categories', methods=['GET'])
   def get_categories():
-    categories = Category.query.all()
-    formatted_categories = [category.format() for category in categories]
-    return jsonify({
-      'success': True,
-      'categories': formatted_categories
-    })
+    snapshot = catalog.snapshot()
+    response = app.response_class(snapshot.body, mimetype='application/json')
+    response.set_etag(snapshot.etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 
   '''
@@ -56,28 +122,37 @@ def create_app(test_config=None):
   ten questions per page and pagination at the bottom of the screen for three pages.
   Clicking on the page numbers should update the questions. 
   '''
-  # Function to paginate questions
-  def paginate_questions(request, selection):
-    page = request.args.get('page', 1, type=int)
-    start =  (page - 1) * QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
-    questions = [question.format() for question in selection]
-    current_questions = questions[start:end]
-    return current_questions
+  # Function to paginate questions, the page is read with LIMIT/OFFSET
+  # ordered by category, or with ?after_id= as the questions following that
+  # id in id order, which costs the same on every page
+  def paginate_questions(request, query):
+    after_id = request.args.get('after_id', type=int)
+    if after_id is not None:
+      query = query.filter(Question.id > after_id).order_by(Question.id)
+    else:
+      page = request.args.get('page', 1, type=int)
+      if page < 1:
+        return []
+      query = query.order_by(Question.category, Question.id).offset(
+        (page - 1) * QUESTIONS_PER_PAGE)
+    return [question.format() for question in query.limit(QUESTIONS_PER_PAGE).all()]
 
   @app.route('/questions', methods=['GET'])
   def get_paginated_questions():
-    categories = Category.query.all()
-    questions = Question.query.order_by(Question.category).all()
-    paginated_questions = paginate_questions(request, questions)
+    paginated_questions = paginate_questions(request, Question.query)
     if not paginated_questions:
       abort(404) 
-    return jsonify({
+    response = {
       'success': True,
       'questions': paginated_questions,
-      'total_questions': len(questions),
-      'categories': [category.format() for category in categories]
-    })
+      'total_questions': QuestionCount.total(),
+      'categories': catalog.categories()
+    }
+    if request.args.get('after_id', type=int) is not None:
+      # a full page may be followed by more questions
+      response['next_after_id'] = paginated_questions[-1]['id'] \
+        if len(paginated_questions) == QUESTIONS_PER_PAGE else None
+    return jsonify(response)
 
   '''
   @DONE: 
@@ -128,6 +203,20 @@ def create_app(test_config=None):
     except:
       abort(400)  
   '''
+  POST /questions/bulk
+    loads newline delimited json questions, INGEST_BATCH_SIZE per
+    transaction, categories are checked against the category catalog.
+    ?start_row=<n> skips the rows committed by an earlier request, which
+    the report returns as last_row
+  '''
+  @app.route('/questions/bulk', methods=['POST'])
+  def bulk_create_questions():
+    start_row = request.args.get('start_row', 0, type=int)
+    report = ingest(iter_ndjson(request.stream), set(catalog.snapshot().types),
+                    INGEST_BATCH_SIZE, start_row)
+    return jsonify(dict(report, success=not report['failed'] and 'error' not in report))
+
+  '''
   @DONE: 
   Create a POST endpoint to get questions based on a search term. 
   It should return any questions for whom the search term 
@@ -137,20 +226,26 @@ def create_app(test_config=None):
   only question that include that string within their question. 
   Try using the word "title" to start. 
   '''
+  # ranked full-text search over questions and answers, paginated like
+  # GET /questions with "page" in the body or the query string
   @app.route('/questions/search', methods=['POST'])
   def search_question():
     try:  
       body = request.get_json()
       search_term = body['searchTerm']
-      questions = Question.query.filter(Question.question.ilike(f'%{search_term}%')).all()
-      if not questions:
-        abort(404)
-      return jsonify({
-        'success': True,
-        'questions': [question.format() for question in questions]
-      })  
+      page = int(body.get('page', request.args.get('page', 1)))
     except:
-        abort(400)  
+      abort(400)
+    if page < 1:
+      abort(404)
+    total, questions = search_questions(search, search_term, page, QUESTIONS_PER_PAGE)
+    if not questions:
+      abort(404)
+    return jsonify({
+      'success': True,
+      'questions': [question.format() for question in questions],
+      'total_questions': total
+    })  
     
 
   '''
@@ -161,18 +256,35 @@ def create_app(test_config=None):
   categories in the left column will cause only questions of that 
   category to be shown. 
   '''
+  # the whole category (the frontend does not page it), total_questions is
+  # read from the maintained category count
   @app.route('/categories/<int:category_id>/questions', methods=['GET'])
   def get_questions_by_category(category_id):
-    questions = Question.query.filter(Question.category == category_id).all()
-    category = Category.query.get(category_id)
+    questions = Question.query.filter(Question.category == category_id) \
+      .order_by(Question.id).all()
     if not questions:
       abort(404)
     return jsonify({
       'success': True,
       'questions': [question.format() for question in questions],
-      'total_questions': len(questions),
-      'current_category': category.type
+      'total_questions': QuestionCount.of(category_id),
+      'current_category': catalog.type_of(category_id)
     })  
+
+  '''
+  GET /categories/counts
+    number of questions of every category, read from the maintained counts
+  '''
+  @app.route('/categories/counts', methods=['GET'])
+  def get_category_counts():
+    counts = QuestionCount.by_category()
+    return jsonify({
+      'success': True,
+      'categories': [dict(category, total_questions=counts.get(category['id'], 0))
+                     for category in catalog.categories()],
+      'total_questions': sum(counts.values())
+    })
+
   '''
   @DONE: 
   Create a POST endpoint to get questions to play the quiz. 
@@ -184,27 +296,87 @@ def create_app(test_config=None):
   one question at a time is displayed, the user is allowed to answer
   and shown whether they were correct or not. 
   '''
+  # quiz_category 0 or null plays every category ("ALL" in the frontend)
   @app.route('/quizzes', methods=['POST'])
   def quizz_questions():
     try:
       body = request.get_json()
-      old_questions = body['previous_questions']
+      previous_questions = body['previous_questions']
+      if not isinstance(previous_questions, list):
+        abort(400)
       # front end is modfied to return only category id check README for how to use with curl
-      all_questions = Question.query.filter(Question.category == body['quiz_category'])
-      unique_questions = [question for question in all_questions if question.id not in old_questions]
-      if not all_questions:
-        abort(404)
-      if not unique_questions:
-        question = False
-      else:
-        question = random.choice(unique_questions).format() 
+      category = int(body['quiz_category'] or 0) or None
+      question = random_question(category, previous_questions)
       return jsonify({
         'success': True,
-        'question': question
+        'question': question.format() if question else False
       })
     except:
       abort(400)  
   '''
+  POST /quizzes/sessions
+    starts a quiz on a category (quiz_category 0 or null for all of them),
+    its questions are shuffled once into a deck kept on the server
+  POST /quizzes/sessions/<session_id>/next
+    deals the next question of the deck, false once the deck is empty
+  DELETE /quizzes/sessions/<session_id>
+    ends the quiz
+  '''
+  @app.route('/quizzes/sessions', methods=['POST'])
+  def create_quiz_session():
+    try:
+      body = request.get_json()
+      category = int(body['quiz_category'] or 0) or None
+    except:
+      abort(400)
+    deck = build_deck(category, QUIZ_DECK_SIZE)
+    if not deck:
+      abort(404)
+    return jsonify({
+      'success': True,
+      'session_id': quiz_sessions.create(deck),
+      'total_questions': len(deck)
+    })
+
+  @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+  def next_quiz_question(session_id):
+    while True:
+      try:
+        question_id, remaining = quiz_sessions.pop(session_id)
+      except KeyError:
+        abort(404)
+      # questions deleted since the deck was shuffled are skipped
+      question = Question.query.get(question_id) if question_id else None
+      if question or question_id is None:
+        break
+    return jsonify({
+      'success': True,
+      'question': question.format() if question else False,
+      'remaining': remaining
+    })
+
+  @app.route('/quizzes/sessions/<session_id>', methods=['DELETE'])
+  def delete_quiz_session(session_id):
+    if not quiz_sessions.delete(session_id):
+      abort(404)
+    return jsonify({
+      'success': True,
+      'deleted_session': session_id
+    })
+
+  '''
+  GET /admin/pool
+    live database connection pool statistics, used to size
+    workers against PostgreSQL
+  '''
+  @app.route('/admin/pool', methods=['GET'])
+  def get_pool_stats():
+    return jsonify({
+      'success': True,
+      'pool': pool_stats()
+    })
+
+  '''
   @DONE: 
   Create error handlers for all expected errors 
   including 404 and 422. 
@@ -0,0 +1,36 @@
+import threading
+import time
+
+'''
+CachedValue
+  the result of load() kept for ttl seconds, writers that change it call
+  invalidate() so the next get() loads it again. Other workers do not see
+  those calls, ttl bounds how long they serve the old value.
+'''
+class CachedValue:
+
+  def __init__(self, load, ttl=60):
+    self.load = load
+    self.ttl = ttl
+    self.loads = 0
+    self._value = None
+    self._expires = 0
+    self._generation = 0
+    self._lock = threading.Lock()
+
+  def get(self):
+    if time.monotonic() >= self._expires:
+      with self._lock:
+        # another request loaded it while this one waited for the lock
+        if time.monotonic() >= self._expires:
+          generation = self._generation
+          self._value = self.load()
+          self.loads += 1
+          # a write that landed during the load makes the value stale already
+          if generation == self._generation:
+            self._expires = time.monotonic() + self.ttl
+    return self._value
+
+  def invalidate(self):
+    self._generation += 1
+    self._expires = 0
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import weakref
+from collections import namedtuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import Category
+from .cache import CachedValue
+
+# every live catalog, refreshed when a transaction writing categories commits
+_catalogs = weakref.WeakSet()
+
+Snapshot = namedtuple('Snapshot', ['types', 'categories', 'body', 'etag'])
+
+'''
+CategoryCatalog
+  the categories loaded once into an id -> type map, with their formatted
+  list and the encoded body of GET /categories and its ETag
+
+  a commit that inserts, updates or deletes a Category refreshes every
+  catalog of the process, changes made by other processes are picked up
+  after ttl seconds
+'''
+class CategoryCatalog:
+
+  def __init__(self, ttl=300):
+    self._snapshot = CachedValue(self._load, ttl)
+    _catalogs.add(self)
+
+  def _load(self):
+    categories = [category.format() for category in Category.query.order_by(Category.id).all()]
+    body = json.dumps({
+      'success': True,
+      'categories': categories
+    }).encode('utf-8')
+    return Snapshot(
+      types={category['id']: category['type'] for category in categories},
+      categories=categories,
+      body=body,
+      etag=hashlib.sha1(body).hexdigest())
+
+  @property
+  def loads(self):
+    return self._snapshot.loads
+
+  def snapshot(self):
+    return self._snapshot.get()
+
+  def categories(self):
+    return self.snapshot().categories
+
+  def type_of(self, category_id):
+    return self.snapshot().types.get(category_id)
+
+  def invalidate(self):
+    self._snapshot.invalidate()
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_category_writes(session, flush_context, instances):
+  if any(isinstance(instance, Category)
+         for instance in list(session.new) + list(session.dirty) + list(session.deleted)):
+    session.info['categories_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _refresh_catalogs(session):
+  if session.info.pop('categories_changed', False):
+    for catalog in list(_catalogs):
+      catalog.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_category_writes(session):
+  session.info.pop('categories_changed', None)
@@ -0,0 +1,138 @@
+import csv
+import io
+import json
+import time
+
+from sqlalchemy import exc
+
+from models import db, Question, QuestionCount
+
+# a failed ingestion reports its first errors and counts the rest
+MAX_REPORTED_ERRORS = 100
+COLUMNS = ('question', 'answer', 'category', 'difficulty')
+
+'''
+iter_ndjson(stream)
+  (row number, document or ValueError) for every line of a newline
+  delimited json stream, blank lines are skipped but numbered
+'''
+def iter_ndjson(stream):
+  for row, line in enumerate(stream, 1):
+    if not line.strip():
+      continue
+    try:
+      yield row, json.loads(line)
+    except ValueError as error:
+      yield row, ValueError('invalid json: {}'.format(error))
+
+
+'''
+validate_question(document, category_ids)
+  the row to insert for a question document, raises ValueError with the
+  reason when it is not a valid question of a known category
+'''
+def validate_question(document, category_ids):
+  if isinstance(document, ValueError):
+    raise document
+  if not isinstance(document, dict):
+    raise ValueError('a question must be a json object')
+  for field in ('question', 'answer'):
+    if not isinstance(document.get(field), str) or not document[field].strip():
+      raise ValueError('{} must be a non empty string'.format(field))
+  try:
+    category = int(document.get('category'))
+    difficulty = int(document.get('difficulty'))
+  except (TypeError, ValueError):
+    raise ValueError('category and difficulty must be integers')
+  if category not in category_ids:
+    raise ValueError('unknown category {}'.format(category))
+  if not 1 <= difficulty <= 5:
+    raise ValueError('difficulty must be between 1 and 5')
+  return {
+    'question': document['question'],
+    'answer': document['answer'],
+    'category': category,
+    'difficulty': difficulty
+  }
+
+
+'''
+insert_rows(rows)
+  inserts a batch in the current transaction, with COPY on PostgreSQL and
+  a single executemany elsewhere. COPY errors are raised as the DBAPI's
+  own errors
+'''
+def insert_rows(rows):
+  if db.engine.dialect.name == 'postgresql':
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([row[column] for column in COLUMNS] for row in rows)
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert('COPY questions ({}) FROM STDIN WITH (FORMAT csv)'.format(
+      ', '.join(COLUMNS)), buffer)
+  else:
+    db.session.execute(Question.__table__.insert(), rows)
+
+
+'''
+ingest(documents, category_ids, batch_size, start_row, on_commit, on_error)
+  inserts the valid questions of (row number, document) pairs,
+  batch_size per transaction together with their question counts. Rows up
+  to start_row were committed by an earlier run and are skipped, invalid
+  rows are reported and skipped. After every commit on_commit(report) can
+  save report['last_row'] as the checkpoint to resume from. A batch the
+  database rejects stops the ingestion, report['error'] tells why.
+  returns the ingestion report
+'''
+def ingest(documents, category_ids, batch_size=5000, start_row=0, on_commit=None, on_error=None):
+  report = {'rows': 0, 'inserted': 0, 'failed': 0, 'errors': [],
+            'last_row': start_row, 'seconds': 0.0, 'rows_per_second': 0.0}
+  started = time.perf_counter()
+  batch = []
+
+  def flush(last_row):
+    counts = {}
+    for row in batch:
+      counts[row['category']] = counts.get(row['category'], 0) + 1
+    try:
+      insert_rows(batch)
+      QuestionCount.adjust(counts)
+      db.session.commit()
+    # COPY runs on the raw DBAPI cursor, its errors are not wrapped by SQLAlchemy
+    except (exc.SQLAlchemyError, db.engine.dialect.dbapi.Error) as error:
+      db.session.rollback()
+      report['error'] = 'batch after row {} rejected by the database: {}'.format(
+        report['last_row'], error.__class__.__name__)
+      return False
+    report['inserted'] += len(batch)
+    report['last_row'] = last_row
+    del batch[:]
+    if on_commit:
+      on_commit(report)
+    return True
+
+  row = start_row
+  for row, document in documents:
+    if row <= start_row:
+      continue
+    report['rows'] += 1
+    try:
+      batch.append(validate_question(document, category_ids))
+    except ValueError as error:
+      report['failed'] += 1
+      if len(report['errors']) < MAX_REPORTED_ERRORS:
+        report['errors'].append({'row': row, 'error': str(error)})
+      if on_error:
+        on_error(row, error)
+    if len(batch) >= batch_size and not flush(row):
+      break
+  else:
+    if not batch or flush(row):
+      # the rows after the last batch were all invalid
+      report['last_row'] = max(report['last_row'], row)
+
+  report['seconds'] = round(time.perf_counter() - started, 3)
+  if report['seconds']:
+    report['rows_per_second'] = round(report['rows'] / report['seconds'], 1)
+  return report
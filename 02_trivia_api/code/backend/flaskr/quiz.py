@@ -0,0 +1,184 @@
+import os
+import random
+import secrets
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from sqlalchemy import func
+
+from models import Question
+
+try:
+  import redis
+except ImportError:  # only needed for QUIZ_SESSION_STORE=redis
+  redis = None
+
+# random ids tried before the questions already asked are skipped in the
+# query instead, only reached once the quiz has seen most of the category
+SAMPLE_ATTEMPTS = 8
+
+'''
+category_questions(category)
+  the questions of a category, every question when category is None
+'''
+def category_questions(category):
+  query = Question.query
+  if category is not None:
+    query = query.filter(Question.category == category)
+  return query
+
+
+'''
+random_question(category, previous_questions)
+  a random question of the category (None for all categories) that is not
+  in previous_questions, or None once every question has been asked.
+
+  Each attempt draws an id between the smallest and the largest id of the
+  category and reads the first question from there on, a range lookup on
+  the (category, id) index (the primary key for every category), and keeps
+  it unless it was asked already, a set lookup (a question that follows a
+  wide gap in the ids comes up more often). One attempt usually answers
+  the request however many questions there are and however long the quiz
+  has run. When attempts keep hitting the history, the last lookup leaves
+  the asked ids out in the query and wraps around to the start.
+'''
+def random_question(category, previous_questions):
+  query = category_questions(category)
+  low, high = query.with_entities(func.min(Question.id), func.max(Question.id)).one()
+  if low is None:
+    return None
+  asked = set(previous_questions)
+  for _ in range(SAMPLE_ATTEMPTS):
+    # a question deleted since min/max were read is just a miss
+    question = query.filter(Question.id >= random.randint(low, high)) \
+      .order_by(Question.id).first()
+    if question is not None and question.id not in asked:
+      return question
+  remaining = query.filter(~Question.id.in_(asked)) if asked else query
+  start = random.randint(low, high)
+  return remaining.filter(Question.id >= start).order_by(Question.id).first() \
+    or remaining.filter(Question.id < start).order_by(Question.id.desc()).first()
+
+
+'''
+build_deck(category, size)
+  the ids of the questions of a category (None for all categories) in a
+  random order, at most size of them, as a compact array of ints
+'''
+def build_deck(category, size):
+  ids = array('i', (question_id for question_id, in
+                    category_questions(category).with_entities(Question.id)))
+  random.shuffle(ids)
+  return ids[:size]
+
+
+'''
+MemorySessionStore
+  quiz sessions of this worker, each one a shuffled deck popped from its
+  end. Sessions expire ttl seconds after their last use, the least
+  recently used ones are dropped past max_sessions.
+'''
+class MemorySessionStore:
+  name = 'memory'
+
+  def __init__(self, ttl=3600, max_sessions=10000):
+    self.ttl = ttl
+    self.max_sessions = max_sessions
+    self._sessions = OrderedDict()
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return len(self._sessions)
+
+  def create(self, deck):
+    session_id = secrets.token_urlsafe(16)
+    with self._lock:
+      self._sessions[session_id] = (deck, time.monotonic() + self.ttl)
+      while len(self._sessions) > self.max_sessions:
+        self._sessions.popitem(last=False)
+    return session_id
+
+  '''
+  pop(session_id)
+    (next question id or None once the deck is empty, questions left),
+    raises KeyError for an unknown or expired session
+  '''
+  def pop(self, session_id):
+    with self._lock:
+      deck, expires = self._sessions[session_id]
+      if expires < time.monotonic():
+        del self._sessions[session_id]
+        raise KeyError(session_id)
+      self._sessions[session_id] = (deck, time.monotonic() + self.ttl)
+      self._sessions.move_to_end(session_id)
+      return (deck.pop() if deck else None), len(deck)
+
+  def delete(self, session_id):
+    with self._lock:
+      return self._sessions.pop(session_id, None) is not None
+
+
+'''
+RedisSessionStore
+  quiz sessions shared by every worker, the deck is a Redis list popped
+  with RPOP and a marker key tells an empty deck from an expired session
+'''
+class RedisSessionStore:
+  name = 'redis'
+
+  def __init__(self, url, ttl=3600, prefix='trivia:quiz:'):
+    if redis is None:
+      raise RuntimeError('QUIZ_SESSION_STORE=redis requires the redis package')
+    self.ttl = ttl
+    self._client = redis.Redis.from_url(url)
+    self._prefix = prefix
+
+  def __len__(self):
+    return sum(1 for _ in self._client.scan_iter(self._prefix + '*:session'))
+
+  def _keys(self, session_id):
+    return self._prefix + session_id + ':session', self._prefix + session_id + ':deck'
+
+  def create(self, deck):
+    session_id = secrets.token_urlsafe(16)
+    session, cards = self._keys(session_id)
+    pipeline = self._client.pipeline()
+    pipeline.set(session, 1, ex=self.ttl)
+    if deck:
+      pipeline.rpush(cards, *deck)
+      pipeline.expire(cards, self.ttl)
+    pipeline.execute()
+    return session_id
+
+  def pop(self, session_id):
+    session, cards = self._keys(session_id)
+    pipeline = self._client.pipeline()
+    pipeline.expire(session, self.ttl)
+    pipeline.rpop(cards)
+    pipeline.llen(cards)
+    pipeline.expire(cards, self.ttl)
+    alive, question_id, left, _ = pipeline.execute()
+    if not alive:
+      raise KeyError(session_id)
+    return (int(question_id) if question_id is not None else None), left
+
+  def delete(self, session_id):
+    return bool(self._client.delete(*self._keys(session_id)))
+
+
+'''
+session_store_from_env()
+  the quiz session store named by QUIZ_SESSION_STORE, memory (default) or
+  redis at QUIZ_SESSION_REDIS_URL, sessions live QUIZ_SESSION_TTL seconds
+'''
+def session_store_from_env():
+  name = os.environ.get('QUIZ_SESSION_STORE', 'memory')
+  ttl = int(os.environ.get('QUIZ_SESSION_TTL', 3600))
+  if name == 'memory':
+    return MemorySessionStore(ttl, int(os.environ.get('QUIZ_MAX_SESSIONS', 10000)))
+  if name == 'redis':
+    return RedisSessionStore(
+      os.environ.get('QUIZ_SESSION_REDIS_URL', 'redis://localhost:6379/0'), ttl)
+  raise ValueError('unknown QUIZ_SESSION_STORE {!r}'.format(name))
@@ -0,0 +1,163 @@
+import re
+
+from sqlalchemy import func, inspect, literal_column, or_, text
+
+from models import db, Question, QuestionCount
+
+WORD = re.compile(r'\w+')
+
+'''
+Full-text search over the question and answer of every question
+
+  every word of the search term has to start a word of the question or of
+  its answer, matches in the question rank first. The index lives in the
+  database and is installed by `flask create-search-index`:
+    - PostgreSQL (12 or later): a generated tsvector column on questions,
+      kept up to date by the database, with a GIN index
+    - SQLite: an FTS5 table over questions, kept up to date by triggers
+  until it is installed LikeSearch answers with ILIKE scans
+'''
+
+
+def words(term):
+  return WORD.findall((term or '').lower())
+
+
+'''
+LikeSearch
+  questions or answers containing the search term, in id order
+'''
+class LikeSearch:
+  name = 'like'
+
+  def install(self):
+    pass
+
+  def installed(self):
+    return True
+
+  def search(self, term, page, per_page):
+    pattern = '%{}%'.format(term)
+    query = Question.query.filter(or_(Question.question.ilike(pattern),
+                                      Question.answer.ilike(pattern)))
+    total = query.count()
+    questions = query.order_by(Question.id).offset((page - 1) * per_page).limit(per_page).all()
+    return total, questions
+
+
+'''
+PostgresSearch
+  questions.search_vector holds the question (weight A) and the answer
+  (weight B), matches are ranked with ts_rank. A term made only of
+  stopwords is handed to LikeSearch
+'''
+class PostgresSearch:
+  name = 'postgresql'
+  vector = literal_column('questions.search_vector')
+
+  def install(self):
+    # the generated column is computed for every existing row by ALTER TABLE
+    db.session.execute(text(
+      "ALTER TABLE questions ADD COLUMN IF NOT EXISTS search_vector tsvector "
+      "GENERATED ALWAYS AS ("
+      "setweight(to_tsvector('english', coalesce(question, '')), 'A') || "
+      "setweight(to_tsvector('english', coalesce(answer, '')), 'B')) STORED"))
+    db.session.execute(text(
+      "CREATE INDEX IF NOT EXISTS ix_questions_search_vector "
+      "ON questions USING GIN (search_vector)"))
+    db.session.commit()
+    db.session.execute(text('ANALYZE questions'))
+    db.session.commit()
+
+  def installed(self):
+    return 'search_vector' in {column['name'] for column in
+                               inspect(db.engine).get_columns('questions')}
+
+  def search(self, term, page, per_page):
+    query = func.to_tsquery('english', ' & '.join(word + ':*' for word in words(term)))
+    matches = Question.query.filter(self.vector.op('@@')(query))
+    total = matches.with_entities(func.count(Question.id)).scalar()
+    if not total and not db.session.query(func.numnode(query)).scalar():
+      # the term is only stopwords ("what", "who is"), which the english
+      # config drops, the ILIKE scan still finds them
+      return LikeSearch().search(term, page, per_page)
+    questions = matches.order_by(func.ts_rank(self.vector, query).desc(), Question.id) \
+      .offset((page - 1) * per_page).limit(per_page).all()
+    return total, questions
+
+
+'''
+SQLiteSearch
+  questions_fts is an FTS5 table reading its text from questions, matches
+  are ranked with bm25, a match in the question counting twice
+'''
+class SQLiteSearch:
+  name = 'sqlite'
+
+  def install(self):
+    statements = [
+      "CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5("
+      "question, answer, content='questions', content_rowid='id', "
+      "tokenize='porter unicode61')",
+      "CREATE TRIGGER IF NOT EXISTS questions_fts_insert AFTER INSERT ON questions BEGIN "
+      "INSERT INTO questions_fts(rowid, question, answer) "
+      "VALUES (new.id, new.question, new.answer); END",
+      "CREATE TRIGGER IF NOT EXISTS questions_fts_delete AFTER DELETE ON questions BEGIN "
+      "INSERT INTO questions_fts(questions_fts, rowid, question, answer) "
+      "VALUES ('delete', old.id, old.question, old.answer); END",
+      "CREATE TRIGGER IF NOT EXISTS questions_fts_update AFTER UPDATE ON questions BEGIN "
+      "INSERT INTO questions_fts(questions_fts, rowid, question, answer) "
+      "VALUES ('delete', old.id, old.question, old.answer); "
+      "INSERT INTO questions_fts(rowid, question, answer) "
+      "VALUES (new.id, new.question, new.answer); END",
+      # indexes every existing question
+      "INSERT INTO questions_fts(questions_fts) VALUES ('rebuild')",
+    ]
+    for statement in statements:
+      db.session.execute(text(statement))
+    db.session.commit()
+
+  def installed(self):
+    return 'questions_fts' in inspect(db.engine).get_table_names()
+
+  def search(self, term, page, per_page):
+    match = ' '.join('"{}"*'.format(word) for word in words(term))
+    total = db.session.execute(text(
+      'SELECT count(*) FROM questions_fts WHERE questions_fts MATCH :match'),
+      {'match': match}).scalar()
+    ids = [row[0] for row in db.session.execute(text(
+      'SELECT rowid FROM questions_fts WHERE questions_fts MATCH :match '
+      'ORDER BY bm25(questions_fts, 2.0, 1.0), rowid LIMIT :limit OFFSET :offset'),
+      {'match': match, 'limit': per_page, 'offset': (page - 1) * per_page})]
+    questions = {question.id: question for question in
+                 Question.query.filter(Question.id.in_(ids))} if ids else {}
+    return total, [questions[question_id] for question_id in ids if question_id in questions]
+
+
+BACKENDS = {'postgresql': PostgresSearch, 'sqlite': SQLiteSearch}
+
+
+'''
+search_backend(installed_only=True)
+  the search backend of the database, LikeSearch while its index is not
+  installed (or for any other database)
+'''
+def search_backend(installed_only=True):
+  backend = BACKENDS.get(db.engine.dialect.name, LikeSearch)()
+  if installed_only and not backend.installed():
+    return LikeSearch()
+  return backend
+
+
+'''
+search_questions(backend, term, page, per_page)
+  (total number of matches, questions of the page), best match first. A
+  term without words matches every question, in id order, as the ILIKE
+  search did
+'''
+def search_questions(backend, term, page, per_page):
+  if not words(term):
+    questions = Question.query.order_by(Question.id) \
+      .offset((page - 1) * per_page).limit(per_page).all()
+    return QuestionCount.total(), questions
+  return backend.search(term, page, per_page)
@@ -1,13 +1,86 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine, ForeignKey
+import time
+from sqlalchemy import Column, String, Integer, create_engine, ForeignKey, Index, inspect, func, text
+from sqlalchemy.orm.attributes import get_history
+from sqlalchemy.pool import QueuePool
 from flask_sqlalchemy import SQLAlchemy
 import json
 
 database_name = "trivia"
-database_path = "postgres://{}:{}@{}/{}".format('postgres', 'postgres', 'localhost:5432', database_name)
+database_path = os.environ.get(
+    'DATABASE_URL',
+    "postgres://{}:{}@{}/{}".format('postgres', 'postgres', 'localhost:5432', database_name))
 
 db = SQLAlchemy()
 
+'''
+TimedQueuePool
+    QueuePool that records how long checkouts wait for a connection
+'''
+class TimedQueuePool(QueuePool):
+
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.checkouts = 0
+    self.wait_time = 0.0
+    self.max_wait = 0.0
+
+  def _do_get(self):
+    start = time.perf_counter()
+    try:
+      return super()._do_get()
+    finally:
+      waited = time.perf_counter() - start
+      self.checkouts += 1
+      self.wait_time += waited
+      self.max_wait = max(self.max_wait, waited)
+
+'''
+engine_options(database_path)
+    create_engine options read from the environment:
+    DB_POOL_SIZE (5), DB_MAX_OVERFLOW (10), DB_POOL_TIMEOUT (30 s),
+    DB_POOL_RECYCLE (1800 s), DB_POOL_PRE_PING (true) and
+    DB_STATEMENT_TIMEOUT (ms, 0 disables it, PostgreSQL only)
+'''
+def engine_options(database_path):
+    if database_path.startswith('sqlite'):
+        return {}
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes', 'on'),
+    }
+    statement_timeout = int(os.environ.get('DB_STATEMENT_TIMEOUT', 0))
+    if statement_timeout and database_path.startswith('postgres'):
+        options['connect_args'] = {'options': '-c statement_timeout={}'.format(statement_timeout)}
+    return options
+
+'''
+pool_stats()
+    live statistics of the connection pool behind db
+'''
+def pool_stats():
+    pool = db.engine.pool
+    stats = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            # overflow() counts up from -size while the pool fills up
+            'overflow': max(pool.overflow(), 0),
+        })
+    if isinstance(pool, TimedQueuePool):
+        stats.update({
+            'checkouts': pool.checkouts,
+            'wait_seconds_total': round(pool.wait_time, 6),
+            'wait_seconds_max': round(pool.max_wait, 6),
+        })
+    return stats
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
@@ -15,9 +88,25 @@ setup_db(app)
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path)
     db.app = app
     db.init_app(app)
     db.create_all()
+    create_missing_indexes()
+    QuestionCount.backfill()
+
+'''
+create_missing_indexes()
+    create_all() leaves tables restored from trivia.psql alone, this adds
+    the indexes declared on the models that such tables lack
+'''
+def create_missing_indexes():
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
 
 '''
 Question
@@ -25,6 +114,10 @@ Question
 '''
 class Question(db.Model):  
   __tablename__ = 'questions'
+  __table_args__ = (
+    # the question list is ordered by category, a page is read from the index
+    Index('ix_questions_category_id', 'category', 'id'),
+  )
 
   id = Column(Integer, primary_key=True)
   question = Column(String)
@@ -39,15 +132,21 @@ class Question(db.Model):
     self.category = category
     self.difficulty = difficulty
 
+  # the question counts change in the same transaction as the question
   def insert(self):
     db.session.add(self)
+    QuestionCount.adjust({self.category: 1})
     db.session.commit()
   
   def update(self):
+    added, _, deleted = get_history(self, 'category')
+    if added and deleted:
+      QuestionCount.adjust({deleted[0]: -1, added[0]: 1})
     db.session.commit()
 
   def delete(self):
     db.session.delete(self)
+    QuestionCount.adjust({self.category: -1})
     db.session.commit()
 
   def format(self):
@@ -59,6 +158,75 @@ class Question(db.Model):
       'difficulty': self.difficulty
     }
 
+'''
+QuestionCount
+    number of questions per category (category_id 0 counts questions
+    without one), maintained by Question.insert(), update() and delete() so
+    totals are read without counting questions
+'''
+class QuestionCount(db.Model):
+  __tablename__ = 'question_counts'
+
+  category_id = Column(Integer, primary_key=True, autoincrement=False)
+  count = Column(Integer, nullable=False, default=0)
+
+  '''
+  adjust(deltas)
+      adds {category: delta} to the counts inside the current transaction,
+      a single upsert (PostgreSQL, SQLite 3.24 or later) adding delta to
+      the row, so concurrent writers never lose one and two first inserts
+      into a category do not collide
+  '''
+  @classmethod
+  def adjust(cls, deltas):
+    totals = {}
+    for category, delta in deltas.items():
+      key = int(category or 0)
+      totals[key] = totals.get(key, 0) + delta
+    for key, delta in totals.items():
+      if not delta:
+        continue
+      db.session.execute(text(
+        'INSERT INTO question_counts (category_id, count) VALUES (:key, :delta) '
+        'ON CONFLICT (category_id) DO UPDATE SET count = question_counts.count + excluded.count'),
+        {'key': key, 'delta': delta})
+
+  @classmethod
+  def of(cls, category):
+    return db.session.query(cls.count).filter(cls.category_id == int(category or 0)).scalar() or 0
+
+  @classmethod
+  def by_category(cls):
+    return dict(db.session.query(cls.category_id, cls.count).all())
+
+  @classmethod
+  def total(cls):
+    return db.session.query(func.coalesce(func.sum(cls.count), 0)).scalar()
+
+  '''
+  rebuild()
+      counts the questions again, for a table filled outside the models
+  '''
+  @classmethod
+  def rebuild(cls):
+    table = cls.__table__
+    db.session.execute(table.delete())
+    rows = db.session.query(Question.category, func.count(Question.id)) \
+      .group_by(Question.category).all()
+    if rows:
+      db.session.execute(table.insert(), [
+        {'category_id': category or 0, 'count': count} for category, count in rows])
+    db.session.commit()
+
+  '''
+  backfill()
+      fills the counts of a database restored from trivia.psql
+  '''
+  @classmethod
+  def backfill(cls):
+    if cls.query.first() is None and Question.query.first() is not None:
+      cls.rebuild()
+
 '''
 Category
 
@@ -1,10 +1,15 @@
 import os
+import threading
 import unittest
 import json
+from unittest import mock
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.ingest import insert_rows
+from flaskr.search import search_backend, search_questions
+from models import setup_db, engine_options, db, Question, QuestionCount, Category, TimedQueuePool
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -40,6 +45,14 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['success'], True)
 
+    def test_GET_categories_not_modified_304(self):
+        res = self.client().get('/categories')
+        etag = res.headers['ETag']
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
     def test_GET_paginated_questions_200(self):
         res = self.client().get('/questions?page=1')
         data = json.loads(res.data)
@@ -51,6 +64,38 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['total_questions'], len(Question.query.all()))
         self.assertEqual(data['categories'], [category.format() for category in categories])
 
+    def test_GET_questions_page_size_200(self):
+        res = self.client().get('/questions?page=1')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['questions']), 10)
+        self.assertNotIn('next_after_id', data)
+
+    def test_GET_questions_after_id_200(self):
+        res = self.client().get('/questions?after_id=0')
+        data = json.loads(res.data)
+        ids = [question['id'] for question in data['questions']]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(data['next_after_id'], ids[-1])
+
+        res = self.client().get('/questions?after_id={}'.format(data['next_after_id']))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(all(question['id'] > ids[-1] for question in data['questions']))
+
+    def test_GET_questions_after_last_id_404(self):
+        last_id = Question.query.order_by(Question.id.desc()).first().id
+        res = self.client().get('/questions?after_id={}'.format(last_id))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
     def test_GET_page_or_category_not_found_questions_404(self):
         res = self.client().get('/questions?category=Art&page=1000')
         data = json.loads(res.data)
@@ -89,6 +134,55 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['category'], 2) 
         self.assertEqual(data['difficulty'], 4)
 
+    def test_POST_bulk_questions_200(self):
+        before = QuestionCount.of(5)
+        body = '\n'.join(json.dumps(question) for question in [
+            {"question": "bulk 1", "answer": "a", "category": 5, "difficulty": 1},
+            {"question": "bulk 2", "answer": "a", "category": 1000, "difficulty": 1},
+            {"question": "bulk 3", "answer": "a", "category": 5, "difficulty": 2},
+        ])
+        res = self.client().post('/questions/bulk', data=body, content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['inserted'], 2)
+        self.assertEqual(data['errors'], [{'row': 2, 'error': 'unknown category 1000'}])
+        self.assertEqual(data['last_row'], 3)
+        self.assertEqual(QuestionCount.of(5), before + 2)
+
+    def test_POST_bulk_questions_resume_200(self):
+        body = '\n'.join(json.dumps({"question": "resume {}".format(i), "answer": "a", "category": 6, "difficulty": 1})
+                         for i in range(3))
+        res = self.client().post('/questions/bulk?start_row=2', data=body, content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['rows'], 1)
+        self.assertEqual(Question.query.filter(Question.question.like('resume %')).count(), 1)
+
+    def test_POST_bulk_questions_database_error_rolls_back(self):
+        before = QuestionCount.of(5)
+
+        # COPY fails with the DBAPI's own errors, not SQLAlchemy's
+        def insert_then_fail(rows):
+            insert_rows(rows)
+            raise db.engine.dialect.dbapi.Error('rejected')
+
+        body = json.dumps({"question": "rolled back", "answer": "a", "category": 5, "difficulty": 1})
+        with mock.patch('flaskr.ingest.insert_rows', side_effect=insert_then_fail):
+            res = self.client().post('/questions/bulk', data=body, content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['inserted'], 0)
+        self.assertEqual(data['last_row'], 0)
+        self.assertEqual(data['error'], 'batch after row 0 rejected by the database: Error')
+        self.assertEqual(Question.query.filter(Question.question == 'rolled back').count(), 0)
+        self.assertEqual(QuestionCount.of(5), before)
+
     def test_POST_add_question_bad_400(self):
         res = self.client().post('/questions/create')
         data = json.loads(res.data)
@@ -98,6 +192,48 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['error'], 400)
         self.assertEqual(data['message'], "bad request")
 
+    def test_POST_search_questions_and_answers_200(self):
+        res = self.client().post('/questions/search', json={"searchTerm": "Escher"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['total_questions'], 1)
+        self.assertEqual(data['questions'][0]['answer'], 'Escher')
+
+    def test_POST_search_paginated_200(self):
+        res = self.client().post('/questions/search', json={"searchTerm": "what"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertLessEqual(len(data['questions']), 10)
+        self.assertGreaterEqual(data['total_questions'], len(data['questions']))
+
+    def test_POST_search_empty_term_lists_questions_200(self):
+        res = self.client().post('/questions/search', json={"searchTerm": ""})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], Question.query.count())
+        self.assertEqual([question['id'] for question in data['questions']],
+                         [question.id for question in Question.query.order_by(Question.id).limit(10)])
+
+    def test_search_backend_stopword_term(self):
+        backend = search_backend(installed_only=False)
+        backend.install()
+        total, questions = search_questions(backend, 'who', 1, 10)
+
+        # stopwords are not dropped from the term, "who" starts several questions
+        self.assertTrue(questions)
+        self.assertGreaterEqual(total, len(questions))
+
+    def test_POST_search_not_found_404(self):
+        res = self.client().post('/questions/search', json={"searchTerm": "xyzzyplugh"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
     def test_GET_questions_by_category_200(self):
         res = self.client().get('/categories/1/questions')
         data = json.loads(res.data)
@@ -106,6 +242,30 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True) 
         self.assertEqual(data['total_questions'], 3)
         self.assertEqual(data['current_category'], 'Science')
+        # the frontend shows the whole category, it is not paginated
+        self.assertEqual([question['id'] for question in data['questions']],
+                         [question.id for question in
+                          Question.query.filter(Question.category == 1).order_by(Question.id)])
+
+    def test_GET_category_counts_200(self):
+        res = self.client().get('/categories/counts')
+        data = json.loads(res.data)
+        science = [category for category in data['categories'] if category['id'] == 1][0]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(science['total_questions'],
+                         Question.query.filter(Question.category == 1).count())
+        self.assertEqual(data['total_questions'], Question.query.count())
+
+    def test_question_counts_follow_insert_and_delete(self):
+        before = QuestionCount.of(4)
+        res = self.client().post('/questions/create', json={"question": "count", "answer": "me", "category": 4, "difficulty": 1})
+        self.assertEqual(QuestionCount.of(4), before + 1)
+
+        question = Question.query.filter(Question.question == 'count').first()
+        self.client().delete('/questions/{}'.format(question.id))
+        self.assertEqual(QuestionCount.of(4), before)
 
     def test_GET_question_by_category_not_found_404(self):
         res = self.client().get('/categories/100/questions')
@@ -123,6 +283,72 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['success'], True) 
 
+    def test_POST_quizzes_unseen_question_200(self):
+        previous_questions = [question.id for question in
+                              Question.query.filter(Question.category == 3)][1:]
+        res = self.client().post('/quizzes', json={"quiz_category": 3, "previous_questions": previous_questions})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['category'], 3)
+        self.assertNotIn(data['question']['id'], previous_questions)
+
+    def test_POST_quizzes_category_done_200(self):
+        previous_questions = [question.id for question in
+                              Question.query.filter(Question.category == 3)]
+        res = self.client().post('/quizzes', json={"quiz_category": 3, "previous_questions": previous_questions})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['question'], False)
+
+    def test_POST_quizzes_all_categories_200(self):
+        res = self.client().post('/quizzes', json={"quiz_category": 0, "previous_questions": []})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['question'])
+
+    def test_quiz_session_deals_every_question_once_200(self):
+        res = self.client().post('/quizzes/sessions', json={"quiz_category": 3})
+        data = json.loads(res.data)
+        expected = sorted(question.id for question in
+                          Question.query.filter(Question.category == 3))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], len(expected))
+
+        dealt = []
+        for _ in expected:
+            res = self.client().post('/quizzes/sessions/{}/next'.format(data['session_id']))
+            dealt.append(json.loads(res.data)['question']['id'])
+        res = self.client().post('/quizzes/sessions/{}/next'.format(data['session_id']))
+        last = json.loads(res.data)
+
+        self.assertEqual(sorted(dealt), expected)
+        self.assertEqual(last['question'], False)
+        self.assertEqual(last['remaining'], 0)
+
+    def test_quiz_session_not_found_404(self):
+        res = self.client().post('/quizzes/sessions/unknown/next')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
+    def test_DELETE_quiz_session_200(self):
+        res = self.client().post('/quizzes/sessions', json={"quiz_category": 0})
+        session_id = json.loads(res.data)['session_id']
+        res = self.client().delete('/quizzes/sessions/{}'.format(session_id))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted_session'], session_id)
+        res = self.client().post('/quizzes/sessions/{}/next'.format(session_id))
+        self.assertEqual(res.status_code, 404)
+
     def test_POST_quizzes_400(self):
         res = self.client().post('/quizzes', json={"quiz": "3", "previous_questions": "15"})    
         data = json.loads(res.data)
@@ -133,6 +359,33 @@ class TriviaTestCase(unittest.TestCase):
 
 
 
+    def test_GET_admin_pool_reports_checkouts(self):
+        env = {'DB_POOL_SIZE': '1', 'DB_MAX_OVERFLOW': '0', 'DB_POOL_TIMEOUT': '5',
+               'DB_POOL_RECYCLE': '60', 'DB_POOL_PRE_PING': 'false', 'DB_STATEMENT_TIMEOUT': '500'}
+        with mock.patch.dict(os.environ, env):
+            options = engine_options(self.database_path)
+        self.assertEqual(options.pop('connect_args'), {'options': '-c statement_timeout=500'})
+        self.assertEqual(options, {'poolclass': TimedQueuePool, 'pool_size': 1, 'max_overflow': 0,
+                                   'pool_timeout': 5, 'pool_recycle': 60, 'pool_pre_ping': False})
+
+        # a pool of one connection, released by another thread after 0.2 s
+        engine = create_engine(self.database_path, **options)
+        self.addCleanup(engine.dispose)
+        held = engine.connect()
+        threading.Timer(0.2, held.close).start()
+        with engine.connect():
+            with mock.patch.object(type(db), 'engine', new_callable=mock.PropertyMock,
+                                   return_value=engine):
+                res = self.client().get('/admin/pool')
+        data = json.loads(res.data)['pool']
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['pool'], 'TimedQueuePool')
+        self.assertEqual(data['checked_out'], 1)
+        self.assertEqual(data['checkouts'], 2)
+        self.assertGreaterEqual(data['wait_seconds_max'], 0.15)
+        self.assertGreaterEqual(data['wait_seconds_total'], data['wait_seconds_max'])
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
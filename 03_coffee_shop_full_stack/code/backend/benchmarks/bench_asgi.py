@@ -0,0 +1,175 @@
+'''
+Flask against ASGI: concurrent requests one worker can serve.
+
+    python -m benchmarks.bench_asgi [requests] [latency_ms]
+
+Starts each app as a single worker process (the werkzeug server without
+threads for Flask, one uvicorn worker for the ASGI app) on a throwaway
+SQLite database, with the Auth0 management api replaced by a local server
+that answers after <latency_ms> (100 by default). Every endpoint receives
+<requests> requests (200 by default) at increasing concurrency and the
+throughput and latency percentiles are reported.
+'''
+import asyncio
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+# any string works, the servers put it straight into the token cache
+BENCH_TOKEN = 'benchmark-token'
+PERMISSIONS = ['get:drinks-detail', 'get:baristas']
+ENDPOINTS = ['/drinks', '/drinks-detail', '/baristas']
+CONCURRENCY = [1, 10, 50]
+DRINKS = 100
+
+
+def serve(kind, port):
+    from src.auth.auth import token_cache
+    # skip RS256 so the comparison measures request handling only
+    token_cache.put(BENCH_TOKEN, {
+        'sub': 'benchmark',
+        'exp': time.time() + 3600,
+        'permissions': PERMISSIONS
+    })
+    if kind == 'flask':
+        from werkzeug.serving import make_server
+        from src.api import app
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        make_server('127.0.0.1', port, app, threaded=False).serve_forever()
+    else:
+        import uvicorn
+        from src.asgi import create_app
+        uvicorn.run(create_app(), host='127.0.0.1', port=port,
+                    log_level='warning')
+
+
+def seed():
+    from src.database.models import db, Drink
+    from src.api import app
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Drink(
+            title='drink {}'.format(i),
+            recipe=json.dumps([{'name': 'milk', 'color': 'white', 'parts': 1},
+                               {'name': 'coffee', 'color': 'brown', 'parts': 2}])
+        ) for i in range(DRINKS)])
+        db.session.commit()
+
+
+def start_management_api(latency):
+    class Handler(BaseHTTPRequestHandler):
+        # keep-alive, as Auth0 does
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            time.sleep(latency)
+            body = json.dumps([{'user_id': 'auth0|benchmark'}]).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 128
+
+    server = Server(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError('server on port {} did not start'.format(port))
+
+
+async def load(port, path, requests, concurrency):
+    latencies = []
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+    headers = {'Authorization': 'Bearer {}'.format(BENCH_TOKEN)}
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url='http://127.0.0.1:{}'.format(port),
+                                 headers=headers, limits=limits,
+                                 timeout=120) as client:
+        async def user():
+            while not queue.empty():
+                queue.get_nowait()
+                started = time.perf_counter()
+                response = await client.get(path)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return (requests / elapsed,
+            latencies[len(latencies) // 2],
+            latencies[int(len(latencies) * 0.95) - 1])
+
+
+def main(requests=200, latency_ms=100):
+    management = start_management_api(latency_ms / 1000)
+    database_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    env = dict(os.environ,
+               DATABASE_URL='sqlite:///{}'.format(database_path),
+               AUTH0_MANAGEMENT_URL='http://127.0.0.1:{}/api/v2'.format(
+                   management.server_port))
+    os.environ.update(env)
+    seed()
+
+    print('{:<6} {:<15} {:>6} {:>10} {:>10} {:>10}'.format(
+        'app', 'endpoint', 'conc', 'req/s', 'p50 ms', 'p95 ms'))
+    for kind in ('flask', 'asgi'):
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.bench_asgi', 'serve', kind,
+             str(port)], env=env, stdout=subprocess.DEVNULL)
+        try:
+            wait_for(port)
+            for path in ENDPOINTS:
+                for concurrency in CONCURRENCY:
+                    throughput, p50, p95 = asyncio.run(
+                        load(port, path, requests, concurrency))
+                    print('{:<6} {:<15} {:>6} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+                        kind, path, concurrency, throughput,
+                        p50 * 1000, p95 * 1000))
+        finally:
+            server.terminate()
+            server.wait()
+    management.shutdown()
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['serve']:
+        serve(sys.argv[2], int(sys.argv[3]))
+    else:
+        main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,92 @@
+'''
+Drink.short()/long() serialization.
+
+    python -m benchmarks.bench_serialization [drinks] [passes]
+
+Loads <drinks> drinks (50000 by default) from a throwaway SQLite database
+and serializes all of them the way GET /drinks and /drinks-detail do,
+comparing the previous implementation (json recipe parsed on every call,
+twice in short() because of its debug print) with the memoized one built
+from the recipe lines. The first pass runs on freshly loaded instances,
+like a request does, the following <passes> (5 by default) reuse them.
+'''
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = 'sqlite:///{}'.format(DATABASE_PATH)
+
+from src.api import app  # noqa: E402
+from src.database.models import db, Drink, DrinkIngredient, Ingredient  # noqa: E402
+
+
+def legacy_short(drink):
+    print(json.loads(drink.recipe))
+    short_recipe = [{'color': r['color'], 'parts': r['parts']}
+                    for r in json.loads(drink.recipe)]
+    return {'id': drink.id, 'title': drink.title, 'recipe': short_recipe}
+
+
+def legacy_long(drink):
+    return {'id': drink.id, 'title': drink.title,
+            'recipe': json.loads(drink.recipe)}
+
+
+RECIPE = [{'name': 'milk', 'color': 'white', 'parts': 1},
+          {'name': 'coffee', 'color': 'brown', 'parts': 2},
+          {'name': 'foam', 'color': 'grey', 'parts': 1}]
+
+
+def seed(count):
+    db.create_all()
+    db.session.bulk_insert_mappings(Ingredient, [
+        {'id': i, 'name': line['name']} for i, line in enumerate(RECIPE, 1)])
+    db.session.bulk_insert_mappings(Drink, [{
+        'id': i,
+        'title': 'drink {}'.format(i),
+        'recipe': json.dumps(RECIPE)
+    } for i in range(1, count + 1)])
+    db.session.bulk_insert_mappings(DrinkIngredient, [{
+        'drink_id': i,
+        'position': position,
+        'ingredient_id': position + 1,
+        'color': line['color'],
+        'parts': line['parts']
+    } for i in range(1, count + 1) for position, line in enumerate(RECIPE)])
+    db.session.commit()
+
+
+def timed(drinks, serialize):
+    # the debug print is part of the old cost, keep it off the terminal
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        for drink in drinks:
+            serialize(drink)
+        return time.perf_counter() - started
+
+
+def main(count=50000, passes=5):
+    with app.app_context():
+        seed(count)
+        print('{:<8} {:<9} {:>12} {:>12} {:>10}'.format(
+            'form', 'pass', 'legacy s', 'memoized s', 'speedup'))
+        for form, legacy, memoized in (('short', legacy_short, Drink.short),
+                                       ('long', legacy_long, Drink.long)):
+            db.session.expunge_all()
+            drinks = Drink.query.all()
+            rows = [('first', timed(drinks, legacy), timed(drinks, memoized))]
+            rows.append(('repeat', sum(timed(drinks, legacy) for _ in range(passes)),
+                         sum(timed(drinks, memoized) for _ in range(passes))))
+            for label, old, new in rows:
+                print('{:<8} {:<9} {:>12.3f} {:>12.3f} {:>9.1f}x'.format(
+                    form, label, old, new, old / new))
+    os.remove(DATABASE_PATH)
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
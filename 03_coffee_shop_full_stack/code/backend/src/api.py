@@ -1,19 +1,29 @@
 import os
-from flask import Flask, request, jsonify, abort
+from flask import Flask, request, jsonify, abort, stream_with_context
 from sqlalchemy import exc
+from sqlalchemy.orm import joinedload
 import json
 from flask_cors import CORS
-import urllib.request
-import urllib.parse
-from .database.models import db_drop_and_create_all, setup_db, Drink
-from .auth.auth import AuthError, requires_auth
+from .database.models import db_drop_and_create_all, setup_db, pool_stats, drinks_using, Drink
+from .auth.auth import AuthError, requires_auth, token_cache
+from .config import MANG_TOKEN, MANAGEMENT_API, BARISTA_ROLE, MANAGER_ROLE
+from .management import ManagementClient, ManagementError
+from .menu import MenuSnapshot
+from .bulk import (iter_ndjson, iter_json_array, import_drinks, export_drinks,
+                   ndjson_lines, json_array_chunks)
 
 app = Flask(__name__)
 setup_db(app)
 CORS(app)
 
-# management api token availbele for 24h only starts from
-MANG_TOKEN = "eyJhbGciOiJSUzI1NiIsInR5cCI6IkpXVCIsImtpZCI6IlhvRFNOcVM1TGp3NzdnekNLVm9oWSJ9.eyJpc3MiOiJodHRwczovL2Z3ZC1mc25kLnVzLmF1dGgwLmNvbS8iLCJzdWIiOiI5SkkxS3g4eWRZV1QyM1U2dklCTlQwbGYzMElZU3dQdUBjbGllbnRzIiwiYXVkIjoiaHR0cHM6Ly9md2QtZnNuZC51cy5hdXRoMC5jb20vYXBpL3YyLyIsImlhdCI6MTU5NjgyNDc2MCwiZXhwIjoxNTk2OTExMTYwLCJhenAiOiI5SkkxS3g4eWRZV1QyM1U2dklCTlQwbGYzMElZU3dQdSIsInNjb3BlIjoicmVhZDpjbGllbnRfZ3JhbnRzIGNyZWF0ZTpjbGllbnRfZ3JhbnRzIGRlbGV0ZTpjbGllbnRfZ3JhbnRzIHVwZGF0ZTpjbGllbnRfZ3JhbnRzIHJlYWQ6dXNlcnMgdXBkYXRlOnVzZXJzIGRlbGV0ZTp1c2VycyBjcmVhdGU6dXNlcnMgcmVhZDp1c2Vyc19hcHBfbWV0YWRhdGEgdXBkYXRlOnVzZXJzX2FwcF9tZXRhZGF0YSBkZWxldGU6dXNlcnNfYXBwX21ldGFkYXRhIGNyZWF0ZTp1c2Vyc19hcHBfbWV0YWRhdGEgcmVhZDp1c2VyX2N1c3RvbV9ibG9ja3MgY3JlYXRlOnVzZXJfY3VzdG9tX2Jsb2NrcyBkZWxldGU6dXNlcl9jdXN0b21fYmxvY2tzIGNyZWF0ZTp1c2VyX3RpY2tldHMgcmVhZDpjbGllbnRzIHVwZGF0ZTpjbGllbnRzIGRlbGV0ZTpjbGllbnRzIGNyZWF0ZTpjbGllbnRzIHJlYWQ6Y2xpZW50X2tleXMgdXBkYXRlOmNsaWVudF9rZXlzIGRlbGV0ZTpjbGllbnRfa2V5cyBjcmVhdGU6Y2xpZW50X2tleXMgcmVhZDpjb25uZWN0aW9ucyB1cGRhdGU6Y29ubmVjdGlvbnMgZGVsZXRlOmNvbm5lY3Rpb25zIGNyZWF0ZTpjb25uZWN0aW9ucyByZWFkOnJlc291cmNlX3NlcnZlcnMgdXBkYXRlOnJlc291cmNlX3NlcnZlcnMgZGVsZXRlOnJlc291cmNlX3NlcnZlcnMgY3JlYXRlOnJlc291cmNlX3NlcnZlcnMgcmVhZDpkZXZpY2VfY3JlZGVudGlhbHMgdXBkYXRlOmRldmljZV9jcmVkZW50aWFscyBkZWxldGU6ZGV2aWNlX2NyZWRlbnRpYWxzIGNyZWF0ZTpkZXZpY2VfY3JlZGVudGlhbHMgcmVhZDpydWxlcyB1cGRhdGU6cnVsZXMgZGVsZXRlOnJ1bGVzIGNyZWF0ZTpydWxlcyByZWFkOnJ1bGVzX2NvbmZpZ3MgdXBkYXRlOnJ1bGVzX2NvbmZpZ3MgZGVsZXRlOnJ1bGVzX2NvbmZpZ3MgcmVhZDpob29rcyB1cGRhdGU6aG9va3MgZGVsZXRlOmhvb2tzIGNyZWF0ZTpob29rcyByZWFkOmFjdGlvbnMgdXBkYXRlOmFjdGlvbnMgZGVsZXRlOmFjdGlvbnMgY3JlYXRlOmFjdGlvbnMgcmVhZDplbWFpbF9wcm92aWRlciB1cGRhdGU6ZW1haWxfcHJvdmlkZXIgZGVsZXRlOmVtYWlsX3Byb3ZpZGVyIGNyZWF0ZTplbWFpbF9wcm92aWRlciBibGFja2xpc3Q6dG9rZW5zIHJlYWQ6c3RhdHMgcmVhZDp0ZW5hbnRfc2V0dGluZ3MgdXBkYXRlOnRlbmFudF9zZXR0aW5ncyByZWFkOmxvZ3MgcmVhZDpzaGllbGRzIGNyZWF0ZTpzaGllbGRzIHVwZGF0ZTpzaGllbGRzIGRlbGV0ZTpzaGllbGRzIHJlYWQ6YW5vbWFseV9ibG9ja3MgZGVsZXRlOmFub21hbHlfYmxvY2tzIHVwZGF0ZTp0cmlnZ2VycyByZWFkOnRyaWdnZXJzIHJlYWQ6Z3JhbnRzIGRlbGV0ZTpncmFudHMgcmVhZDpndWFyZGlhbl9mYWN0b3JzIHVwZGF0ZTpndWFyZGlhbl9mYWN0b3JzIHJlYWQ6Z3VhcmRpYW5fZW5yb2xsbWVudHMgZGVsZXRlOmd1YXJkaWFuX2Vucm9sbG1lbnRzIGNyZWF0ZTpndWFyZGlhbl9lbnJvbGxtZW50X3RpY2tldHMgcmVhZDp1c2VyX2lkcF90b2tlbnMgY3JlYXRlOnBhc3N3b3Jkc19jaGVja2luZ19qb2IgZGVsZXRlOnBhc3N3b3Jkc19jaGVja2luZ19qb2IgcmVhZDpjdXN0b21fZG9tYWlucyBkZWxldGU6Y3VzdG9tX2RvbWFpbnMgY3JlYXRlOmN1c3RvbV9kb21haW5zIHVwZGF0ZTpjdXN0b21fZG9tYWlucyByZWFkOmVtYWlsX3RlbXBsYXRlcyBjcmVhdGU6ZW1haWxfdGVtcGxhdGVzIHVwZGF0ZTplbWFpbF90ZW1wbGF0ZXMgcmVhZDptZmFfcG9saWNpZXMgdXBkYXRlOm1mYV9wb2xpY2llcyByZWFkOnJvbGVzIGNyZWF0ZTpyb2xlcyBkZWxldGU6cm9sZXMgdXBkYXRlOnJvbGVzIHJlYWQ6cHJvbXB0cyB1cGRhdGU6cHJvbXB0cyByZWFkOmJyYW5kaW5nIHVwZGF0ZTpicmFuZGluZyBkZWxldGU6YnJhbmRpbmcgcmVhZDpsb2dfc3RyZWFtcyBjcmVhdGU6bG9nX3N0cmVhbXMgZGVsZXRlOmxvZ19zdHJlYW1zIHVwZGF0ZTpsb2dfc3RyZWFtcyBjcmVhdGU6c2lnbmluZ19rZXlzIHJlYWQ6c2lnbmluZ19rZXlzIHVwZGF0ZTpzaWduaW5nX2tleXMgcmVhZDpsaW1pdHMgdXBkYXRlOmxpbWl0cyIsImd0eSI6ImNsaWVudC1jcmVkZW50aWFscyJ9.K9PPLcu7S5ujSBqWnteSSgZtT1pH4-z8a51JBn-W-mhXgM7dfjij6tpeeYUrmOrZ-OtWN0uUoqFWSN2wE2Zun27A-ADzXKIM4dqJSyKp5wl90Stl3awbMfdgghH2JNivzSOvpS_2McB__9_iGTOi5yy1uWfBp8ytQqkprteg0gabSkFlGDDLcmFhmatbuck-kgNglkbpYHHJ6g2Jf64kJopv7rBzpMWGzIGPJFAI_YpuE7yVDPDkpC7QRMUvwF0YQp7DFfIp6huPGjXxdZdxhHGJXAGMg-Jj09l0OYgu-8tRVcjHvki37CpzDfftngdBZh9uQBW2562cevqRr0hhBQ"
+management = ManagementClient.from_env(MANAGEMENT_API, MANG_TOKEN)
+# seconds before a worker picks up menu changes made by another worker
+MENU_SNAPSHOT_TTL = int(os.environ.get('MENU_SNAPSHOT_TTL', 30))
+menu = MenuSnapshot(lambda: Drink.query.options(joinedload(Drink.ingredients))
+                    .order_by(Drink.id).all(), MENU_SNAPSHOT_TTL)
+# drinks per transaction of an import and per query of an export
+BULK_BATCH_SIZE = int(os.environ.get('BULK_BATCH_SIZE', 500))
+NDJSON_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
 
 '''
 @DONE uncomment the following line to initialize the datbase
@@ -22,12 +32,34 @@ MANG_TOKEN = "eyJhbGciOiJSUzI1NiIsInR5cCI6IkpXVCIsImtpZCI6IlhvRFNOcVM1TGp3Nzdnek
 '''
 # db_drop_and_create_all()
 
+
+'''
+menu_response(form)
+    the menu snapshot in the given form, answered with 304 when the client
+    sends the current ETag in If-None-Match
+'''
+
+
+def menu_response(form, private=False):
+    body, etag = menu.get(form)
+    if body is None:
+        abort(404)
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    # clients keep the menu but check it is still current on every use
+    response.cache_control.no_cache = True
+    if private:
+        response.cache_control.private = True
+    return response.make_conditional(request)
+
+
 # ROUTES
 '''
 @DONE implement endpoint
     GET /drinks
         it should be a public endpoint
         it should contain only the drink.short() data representation
+        ?ingredient=<name> (repeatable) keeps the drinks using every named ingredient
     returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
         or appropriate status code indicating reason for failure
 '''
@@ -35,13 +67,18 @@ MANG_TOKEN = "eyJhbGciOiJSUzI1NiIsInR5cCI6IkpXVCIsImtpZCI6IlhvRFNOcVM1TGp3Nzdnek
 
 @app.route('/drinks', methods=['GET'])
 def return_drinks():
-    drinks = Drink.query.all()
+    ingredients = request.args.getlist('ingredient')
+    if not ingredients:
+        return menu_response('short')
+    query = Drink.query.options(joinedload(Drink.ingredients))
+    for name in ingredients:
+        query = query.filter(drinks_using(name))
+    drinks = query.order_by(Drink.id).all()
     if not drinks:
         abort(404)
-    formatted_drinks = [drink.short() for drink in drinks]
     return jsonify({
         'success': True,
-        'drinks': formatted_drinks
+        'drinks': [drink.short() for drink in drinks]
     })
 
 
@@ -58,14 +95,7 @@ def return_drinks():
 @app.route('/drinks-detail', methods=['GET'])
 @requires_auth('get:drinks-detail')
 def return_drinks_detail(payload):
-    drinks = Drink.query.all()
-    if not drinks:
-        abort(404)
-    formatted_drinks = [drink.long() for drink in drinks]
-    return jsonify({
-        'success': True,
-        'drinks': formatted_drinks
-    })
+    return menu_response('long', private=True)
 
 
 '''
@@ -84,13 +114,10 @@ def return_drinks_detail(payload):
 def add_drink(payload):
     try:
         req = request.get_json()
-        # turn json into string to be stored in database
-        recipe = str(req['recipe'])
-        # string is sent with single quotes which violates JSON principles so
-        # its replaced with a double quotes
-        recipe = recipe.replace("\'", "\"")
-        new_drink = Drink(title=req['title'], recipe=recipe)
+        new_drink = Drink(title=req['title'])
+        new_drink.set_recipe(req['recipe'])
         new_drink.insert()
+        menu.rebuild()
         return jsonify({
             "sucess": True,
             "drinks": new_drink.long()
@@ -119,17 +146,11 @@ def update_drink_info(payload, drink_id):
     req = request.get_json()
     if not drink:
         abort(404)
-    try:
-        # turn json into string to be stored in database
-        recipe = str(req['recipe'])
-        # string is sent with single quotes which violates JSON principles so
-        # its replaced with a double quotes
-        recipe = recipe.replace("\'", "\"")
-        drink.recipe = recipe
-    except BaseException:
-        print("no recipe")
+    if 'recipe' in req:
+        drink.set_recipe(req['recipe'])
     drink.title = req['title']
     drink.update()
+    menu.rebuild()
     return jsonify({
         'success': True,
         'drinks': [drink.short()]
@@ -155,12 +176,60 @@ def delete_drink(payload, drink_id):
     if not drink:
         abort(404)
     drink.delete()
+    menu.rebuild()
     return jsonify({
         'success': True,
         'drink_id': drink_id
     })
 
 
+'''
+    POST /drinks/import
+        it should require the 'post:drinks-import' permission
+        the body is either newline delimited json (Content-Type
+        application/x-ndjson), one drink per line, or a json array of drinks,
+        each drink being {"title": string, "recipe": [{"color", "name", "parts"}]}
+        rows are validated while the body is read and inserted
+        BULK_BATCH_SIZE drinks per transaction, invalid rows are skipped
+    returns status code 200 and json {"success": True, "rows": n, "imported": n, "failed": n, "errors": errors}
+        where errors lists the first 100 failed rows as {"row": n, "error": reason}
+        success is False when any row failed
+'''
+
+
+@app.route('/drinks/import', methods=['POST'])
+@requires_auth('post:drinks-import')
+def import_drinks_file(payload):
+    if request.mimetype in NDJSON_TYPES:
+        rows = iter_ndjson(request.stream)
+    else:
+        rows = iter_json_array(request.stream)
+    report = import_drinks(rows, BULK_BATCH_SIZE)
+    if report['imported']:
+        menu.rebuild()
+    return jsonify(dict(report, success=report['failed'] == 0))
+
+
+'''
+    GET /drinks/export
+        it should require the 'get:drinks-export' permission
+        streams drink.long() of every drink, as a json array or with
+        ?format=ndjson one drink per line, in the format accepted by
+        POST /drinks/import
+'''
+
+
+@app.route('/drinks/export', methods=['GET'])
+@requires_auth('get:drinks-export')
+def export_drinks_file(payload):
+    drinks = export_drinks(BULK_BATCH_SIZE)
+    if request.args.get('format') == 'ndjson':
+        body, mimetype = ndjson_lines(drinks), 'application/x-ndjson'
+    else:
+        body, mimetype = json_array_chunks(drinks), 'application/json'
+    return app.response_class(stream_with_context(body), mimetype=mimetype)
+
+
 '''
     GET /baristas
         returns a list of all users assigned with the role barista
@@ -170,13 +239,9 @@ def delete_drink(payload, drink_id):
 @app.route('/baristas', methods=['GET'])
 @requires_auth('get:baristas')
 def get_baristas(payload):
-    url = "https://fwd-fsnd.us.auth0.com/api/v2/roles/rol_lRvjhWQ9EQS6QFKr/users"
-    hdr = {'authorization': "Bearer {}".format(MANG_TOKEN)}
-    req = urllib.request.Request(url, headers=hdr)
-    response = urllib.request.urlopen(req)
     return jsonify({
         "success": True,
-        "data": response.read()
+        "data": management.role_users(BARISTA_ROLE)
     })
 
 
@@ -189,14 +254,7 @@ def get_baristas(payload):
 @app.route('/baristas/<barista_id>', methods=['POST'])
 @requires_auth('post:baristas')
 def add_baristas(payload, barista_id):
-    values = {"roles": ["rol_lRvjhWQ9EQS6QFKr"]}
-    data = json.dumps(values)
-    data = bytes(data.encode("utf-8"))
-    url = "https://fwd-fsnd.us.auth0.com/api/v2/users/{}/roles".format(
-        barista_id)
-    hdr = {'authorization': "Bearer {}".format(MANG_TOKEN)}
-    req = urllib.request.Request(url, data=data, headers=hdr)
-    req.add_header("Content-type", "application/json; charset=UTF-8")
+    management.add_role(barista_id, BARISTA_ROLE)
     return jsonify({
         "success": True,
         "barista_id": barista_id
@@ -213,14 +271,7 @@ def add_baristas(payload, barista_id):
 @app.route('/baristas/<barista_id>', methods=['DELETE'])
 @requires_auth('post:baristas')
 def delete_baristas(payload, barista_id):
-    values = {"roles": ["rol_lRvjhWQ9EQS6QFKr"]}
-    data = json.dumps(values)
-    data = bytes(data.encode("utf-8"))
-    url = "https://fwd-fsnd.us.auth0.com/api/v2/users/{}/roles".format(
-        barista_id)
-    hdr = {'authorization': "Bearer {}".format(MANG_TOKEN)}
-    req = urllib.request.Request(url, data=data, headers=hdr, method="DELETE")
-    req.add_header("Content-type", "application/json; charset=UTF-8")
+    management.remove_role(barista_id, BARISTA_ROLE)
     return jsonify({
         "success": True,
         "barista_id": barista_id
@@ -236,13 +287,9 @@ def delete_baristas(payload, barista_id):
 @app.route('/managers', methods=['GET'])
 @requires_auth('get:managers')
 def get_managers(payload):
-    url = "https://fwd-fsnd.us.auth0.com/api/v2/roles/rol_njAOVPELGos8Y1x8/users"
-    hdr = {'authorization': "Bearer {}".format(MANG_TOKEN)}
-    req = urllib.request.Request(url, headers=hdr)
-    response = urllib.request.urlopen(req)
     return jsonify({
         "success": True,
-        "data": response.read()
+        "data": management.role_users(MANAGER_ROLE)
     })
 
 
@@ -255,15 +302,7 @@ def get_managers(payload):
 @app.route('/managers/<manager_id>/add', methods=['POST'])
 @requires_auth('post:managers')
 def add_managers(payload, manager_id):
-    values = {"roles": ["rol_njAOVPELGos8Y1x8"]}
-    data = json.dumps(values)
-    data = bytes(data.encode("utf-8"))
-    url = "https://fwd-fsnd.us.auth0.com/api/v2/users/{}/roles".format(
-        manager_id)
-    hdr = {'authorization': "Bearer {}".format(MANG_TOKEN)}
-    req = urllib.request.Request(url, data=data, headers=hdr)
-    req.add_header("Content-type", "application/json; charset=UTF-8")
-    response = urllib.request.urlopen(req)
+    management.add_role(manager_id, MANAGER_ROLE)
     return jsonify({
         "success": True,
         "manager_id": manager_id
@@ -280,21 +319,63 @@ def add_managers(payload, manager_id):
 @app.route('/managers/<manager_id>', methods=['DELETE'])
 @requires_auth('post:managers')
 def delete_managers(payload, manager_id):
-    values = {"roles": ["rol_njAOVPELGos8Y1x8"]}
-    data = json.dumps(values)
-    data = bytes(data.encode("utf-8"))
-    url = "https://fwd-fsnd.us.auth0.com/api/v2/users/{}/roles".format(
-        manager_id)
-    hdr = {'authorization': "Bearer {}".format(MANG_TOKEN)}
-    req = urllib.request.Request(url, data=data, headers=hdr, method="DELETE")
-    req.add_header("Content-type", "application/json; charset=UTF-8")
-    response = urllib.request.urlopen(req)
+    management.remove_role(manager_id, MANAGER_ROLE)
     return jsonify({
         "success": True,
         "manager_id": manager_id
     })
 
 
+'''
+    GET /admin/pool
+        it should require the 'get:pool-stats' permission
+        returns live database connection pool statistics
+'''
+
+
+@app.route('/admin/pool', methods=['GET'])
+@requires_auth('get:pool-stats')
+def get_pool_stats(payload):
+    return jsonify({
+        "success": True,
+        "pool": pool_stats()
+    })
+
+
+'''
+    GET /admin/token-cache
+        it should require the 'get:auth-stats' permission
+        returns hits, misses and verification cpu time of the verified
+        token cache
+'''
+
+
+@app.route('/admin/token-cache', methods=['GET'])
+@requires_auth('get:auth-stats')
+def get_token_cache_stats(payload):
+    return jsonify({
+        "success": True,
+        "token_cache": token_cache.stats()
+    })
+
+
+'''
+    GET /admin/management
+        it should require the 'get:auth-stats' permission
+        returns call, retry and cache counters of the management api client
+        and the state of its circuit breaker
+'''
+
+
+@app.route('/admin/management', methods=['GET'])
+@requires_auth('get:auth-stats')
+def get_management_stats(payload):
+    return jsonify({
+        "success": True,
+        "management": management.stats()
+    })
+
+
 # Error Handling
 '''
 Example error handling for unprocessable entity
@@ -369,6 +450,21 @@ def auth_error(error):
     }), error.status_code
 
 
+'''
+    errors of the Auth0 management api, 502 when it failed and 503 while
+    the circuit breaker is open
+'''
+
+
+@app.errorhandler(ManagementError)
+def management_error(error):
+    return jsonify({
+        'success': False,
+        'error': error.status_code,
+        "message": error.error
+    }), error.status_code
+
+
 @app.errorhandler(401)
 def unathorized(error):
     return jsonify({
@@ -0,0 +1,420 @@
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from functools import wraps
+
+import databases
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from .config import MANG_TOKEN, MANAGEMENT_API, BARISTA_ROLE, MANAGER_ROLE
+from .auth.auth import (AuthError, check_permissions, parse_auth_header,
+                        token_cache, verify_decode_jwt_async)
+from .database.models import (database_path, drinks_using, recipe_lines, Drink,
+                              DrinkIngredient, Ingredient)
+from .management import AsyncManagementClient, ManagementError
+
+'''
+ASGI variant of the coffee shop API
+
+    serves the routes of api.py (except the bulk import and export) on
+    asyncio, so one worker keeps handling requests while others wait on the
+    database or the Auth0 management api:
+        - Drink rows are read and written through the databases package
+          (aiosqlite for the default SQLite file, asyncpg for PostgreSQL)
+          against the same table as the flask app
+        - management api calls go through an AsyncManagementClient, with
+          the retries, circuit breaker and role listing cache of the flask
+          app over one httpx.AsyncClient that keeps connections to Auth0
+          alive between requests
+        - signing keys come from the shared jwks_cache, a missing key is
+          fetched without blocking the event loop
+
+    run it with
+        uvicorn --factory src.asgi:create_app
+'''
+
+drinks = Drink.__table__
+ingredients = Ingredient.__table__
+drink_ingredients = DrinkIngredient.__table__
+
+ERROR_MESSAGES = {
+    400: "bad request",
+    401: "The server could not verify that you are authorized to access the URL requested. You either supplied the wrong credentials (e.g. a bad password), or your browser doesn't understand how to supply the credentials required.",
+    403: "access to the requested resource is forbidden",
+    404: "resource not found",
+    405: "this method is not allowed",
+    422: "unprocessable",
+    500: "Internal server error"
+}
+
+
+'''
+database_options(url)
+    pool size of the async driver, read from the same DB_POOL_SIZE and
+    DB_MAX_OVERFLOW variables as the flask app (SQLite has no pool)
+'''
+def database_options(url):
+    if url.startswith('sqlite'):
+        return {}
+    pool_size = int(os.environ.get('DB_POOL_SIZE', 5))
+    return {
+        'min_size': pool_size,
+        'max_size': pool_size + int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    }
+
+
+'''
+pool_stats(database)
+    statistics of the async connection pool, asyncpg exposes its size and
+    idle connections
+'''
+def pool_stats(database):
+    stats = {'pool': database.url.dialect}
+    # databases keeps the driver pool on its private backend object
+    pool = getattr(database._backend, '_pool', None)
+    if pool is not None and hasattr(pool, 'get_size'):
+        stats.update({
+            'size': pool.get_size(),
+            'checked_in': pool.get_idle_size(),
+            'checked_out': pool.get_size() - pool.get_idle_size()
+        })
+    return stats
+
+
+'''
+requires_auth(permission)
+    requires_auth of auth.py for async handlers, the decoded payload is
+    passed to the handler after the request
+'''
+def requires_auth(permission=''):
+    def requires_auth_decorator(f):
+        @wraps(f)
+        async def wrapper(request):
+            token = parse_auth_header(request.headers.get('Authorization'))
+            verified = token_cache.get(token)
+            if verified is None:
+                started = time.thread_time()
+                try:
+                    payload = await verify_decode_jwt_async(token)
+                except Exception:
+                    raise HTTPException(401)
+                finally:
+                    token_cache.record_verification(time.thread_time() - started)
+                verified = token_cache.put(token, payload)
+            check_permissions(permission, verified.payload, verified.permissions)
+            return await f(request, verified.payload)
+
+        return wrapper
+    return requires_auth_decorator
+
+
+def to_drink(row):
+    return Drink(id=row['id'], title=row['title'], recipe=row['recipe'])
+
+
+'''
+save_recipe(database, drink_id, recipe)
+    Drink.set_recipe() for core queries, replaces the recipe lines of the
+    drink, must run inside a transaction
+'''
+async def save_recipe(database, drink_id, recipe):
+    names = {r['name'] for r in recipe}
+    rows = await database.fetch_all(
+        ingredients.select().where(ingredients.c.name.in_(names))) if names else []
+    ids = {row['name']: row['id'] for row in rows}
+    missing = names - set(ids)
+    if missing:
+        # like Ingredient.get_or_create(), a concurrent insert of the same
+        # name is not an error
+        await database.execute_many(
+            'INSERT INTO ingredient (name) VALUES (:name) ON CONFLICT (name) DO NOTHING',
+            [{'name': name} for name in missing])
+        rows = await database.fetch_all(
+            ingredients.select().where(ingredients.c.name.in_(missing)))
+        ids.update((row['name'], row['id']) for row in rows)
+    await database.execute(drink_ingredients.delete().where(
+        drink_ingredients.c.drink_id == drink_id))
+    if recipe:
+        await database.execute_many(drink_ingredients.insert(), [{
+            'drink_id': drink_id,
+            'position': position,
+            'ingredient_id': ids[r['name']],
+            'color': r['color'],
+            'parts': r['parts']
+        } for position, r in enumerate(recipe)])
+
+
+# ROUTES
+'''
+    GET /drinks
+        public, drink.short() of every drink, ?ingredient=<name> keeps the
+        drinks using every named ingredient
+'''
+async def return_drinks(request):
+    query = drinks.select()
+    for name in request.query_params.getlist('ingredient'):
+        query = query.where(drinks_using(name))
+    rows = await request.app.state.database.fetch_all(query.order_by(drinks.c.id))
+    if not rows:
+        raise HTTPException(404)
+    return JSONResponse({
+        'success': True,
+        'drinks': [to_drink(row).short() for row in rows]
+    })
+
+
+'''
+    GET /drinks-detail
+        requires 'get:drinks-detail', drink.long() of every drink
+'''
+@requires_auth('get:drinks-detail')
+async def return_drinks_detail(request, payload):
+    rows = await request.app.state.database.fetch_all(drinks.select().order_by(drinks.c.id))
+    if not rows:
+        raise HTTPException(404)
+    return JSONResponse({
+        'success': True,
+        'drinks': [to_drink(row).long() for row in rows]
+    })
+
+
+'''
+    POST /drinks
+        requires 'post:drinks', creates a drink
+'''
+@requires_auth('post:drinks')
+async def add_drink(request, payload):
+    database = request.app.state.database
+    req = await request.json()
+    recipe = recipe_lines(req['recipe'])
+    values = {'title': req['title'], 'recipe': json.dumps(recipe)}
+    async with database.transaction():
+        drink_id = await database.execute(drinks.insert().values(**values))
+        await save_recipe(database, drink_id, recipe)
+    return JSONResponse({
+        "sucess": True,
+        "drinks": Drink(id=drink_id, **values).long()
+    })
+
+
+'''
+    PATCH /drinks/<id>
+        requires 'patch:drinks', updates the title and optionally the recipe
+'''
+@requires_auth('patch:drinks')
+async def update_drink_info(request, payload):
+    database = request.app.state.database
+    drink_id = request.path_params['drink_id']
+    row = await database.fetch_one(drinks.select().where(drinks.c.id == drink_id))
+    if row is None:
+        raise HTTPException(404)
+    req = await request.json()
+    values = {'title': req['title']}
+    async with database.transaction():
+        if 'recipe' in req:
+            recipe = recipe_lines(req['recipe'])
+            values['recipe'] = json.dumps(recipe)
+            await save_recipe(database, drink_id, recipe)
+        await database.execute(
+            drinks.update().where(drinks.c.id == drink_id).values(**values))
+    return JSONResponse({
+        'success': True,
+        'drinks': [Drink(**dict(row, **values)).short()]
+    })
+
+
+'''
+    DELETE /drinks/<id>
+        requires 'delete:drinks'
+'''
+@requires_auth('delete:drinks')
+async def delete_drink(request, payload):
+    database = request.app.state.database
+    drink_id = request.path_params['drink_id']
+    async with database.transaction():
+        row = await database.fetch_one(
+            drinks.select().where(drinks.c.id == drink_id))
+        if row is None:
+            raise HTTPException(404)
+        await database.execute(drink_ingredients.delete().where(
+            drink_ingredients.c.drink_id == drink_id))
+        await database.execute(drinks.delete().where(drinks.c.id == drink_id))
+    return JSONResponse({
+        'success': True,
+        'drink_id': drink_id
+    })
+
+
+@requires_auth('get:baristas')
+async def get_baristas(request, payload):
+    return JSONResponse({
+        "success": True,
+        "data": await request.app.state.management.role_users(BARISTA_ROLE)
+    })
+
+
+@requires_auth('post:baristas')
+async def add_baristas(request, payload):
+    barista_id = request.path_params['barista_id']
+    await request.app.state.management.add_role(barista_id, BARISTA_ROLE)
+    return JSONResponse({
+        "success": True,
+        "barista_id": barista_id
+    })
+
+
+@requires_auth('post:baristas')
+async def delete_baristas(request, payload):
+    barista_id = request.path_params['barista_id']
+    await request.app.state.management.remove_role(barista_id, BARISTA_ROLE)
+    return JSONResponse({
+        "success": True,
+        "barista_id": barista_id
+    })
+
+
+@requires_auth('get:managers')
+async def get_managers(request, payload):
+    return JSONResponse({
+        "success": True,
+        "data": await request.app.state.management.role_users(MANAGER_ROLE)
+    })
+
+
+@requires_auth('post:managers')
+async def add_managers(request, payload):
+    manager_id = request.path_params['manager_id']
+    await request.app.state.management.add_role(manager_id, MANAGER_ROLE)
+    return JSONResponse({
+        "success": True,
+        "manager_id": manager_id
+    })
+
+
+@requires_auth('post:managers')
+async def delete_managers(request, payload):
+    manager_id = request.path_params['manager_id']
+    await request.app.state.management.remove_role(manager_id, MANAGER_ROLE)
+    return JSONResponse({
+        "success": True,
+        "manager_id": manager_id
+    })
+
+
+@requires_auth('get:pool-stats')
+async def get_pool_stats(request, payload):
+    return JSONResponse({
+        "success": True,
+        "pool": pool_stats(request.app.state.database)
+    })
+
+
+@requires_auth('get:auth-stats')
+async def get_token_cache_stats(request, payload):
+    return JSONResponse({
+        "success": True,
+        "token_cache": token_cache.stats()
+    })
+
+
+@requires_auth('get:auth-stats')
+async def get_management_stats(request, payload):
+    return JSONResponse({
+        "success": True,
+        "management": request.app.state.management.stats()
+    })
+
+
+# Error Handling
+async def http_error(request, error):
+    return JSONResponse({
+        "success": False,
+        "error": error.status_code,
+        "message": ERROR_MESSAGES.get(error.status_code, error.detail)
+    }, status_code=error.status_code)
+
+
+async def auth_error(request, error):
+    return JSONResponse({
+        'success': False,
+        'error': error.status_code,
+        "message": error.error
+    }, status_code=error.status_code)
+
+
+# 502 when the management api failed, 503 while its circuit is open
+async def management_error(request, error):
+    return JSONResponse({
+        'success': False,
+        'error': error.status_code,
+        "message": error.error
+    }, status_code=error.status_code)
+
+
+async def server_error(request, error):
+    return JSONResponse({
+        "success": False,
+        "error": 500,
+        "message": ERROR_MESSAGES[500]
+    }, status_code=500)
+
+
+routes = [
+    Route('/drinks', return_drinks, methods=['GET']),
+    Route('/drinks', add_drink, methods=['POST']),
+    Route('/drinks-detail', return_drinks_detail, methods=['GET']),
+    Route('/drinks/{drink_id:int}', update_drink_info, methods=['PATCH']),
+    Route('/drinks/{drink_id:int}', delete_drink, methods=['DELETE']),
+    Route('/baristas', get_baristas, methods=['GET']),
+    Route('/baristas/{barista_id}', add_baristas, methods=['POST']),
+    Route('/baristas/{barista_id}', delete_baristas, methods=['DELETE']),
+    Route('/managers', get_managers, methods=['GET']),
+    Route('/managers/{manager_id}/add', add_managers, methods=['POST']),
+    Route('/managers/{manager_id}', delete_managers, methods=['DELETE']),
+    Route('/admin/pool', get_pool_stats, methods=['GET']),
+    Route('/admin/token-cache', get_token_cache_stats, methods=['GET']),
+    Route('/admin/management', get_management_stats, methods=['GET'])
+]
+
+
+'''
+create_app(database_url, management_url, management_transport)
+    builds the ASGI application, the database and the management api
+    client are opened on startup and closed on shutdown. The management
+    client is configured from the same environment variables as the flask
+    app's, management_transport replaces its httpx transport in tests
+'''
+def create_app(database_url=None, management_url=None, management_transport=None):
+    database_url = database_url or database_path
+    management_url = management_url or MANAGEMENT_API
+
+    @asynccontextmanager
+    async def lifespan(app):
+        app.state.database = databases.Database(
+            database_url, **database_options(database_url))
+        app.state.management = AsyncManagementClient.from_env(
+            management_url, MANG_TOKEN, transport=management_transport)
+        await app.state.database.connect()
+        try:
+            yield
+        finally:
+            await app.state.management.close()
+            await app.state.database.disconnect()
+
+    return Starlette(
+        routes=routes,
+        middleware=[Middleware(CORSMiddleware, allow_origins=['*'],
+                               allow_methods=['*'], allow_headers=['*'])],
+        exception_handlers={
+            HTTPException: http_error,
+            AuthError: auth_error,
+            ManagementError: management_error,
+            Exception: server_error
+        },
+        lifespan=lifespan)
@@ -1,4 +1,11 @@
+import asyncio
+import hashlib
 import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
 from flask import request, _request_ctx_stack, abort
 from functools import wraps
 from jose import jwt
@@ -8,6 +15,12 @@ from urllib.request import urlopen
 AUTH0_DOMAIN = 'fwd-fsnd.us.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'coffee'
+# point this at a local file (file:///path/jwks.json) or a stub server in tests
+JWKS_URL = os.environ.get(
+    'AUTH0_JWKS_URL', f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+# verified tokens kept in memory and the longest time one is trusted
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 1024))
+TOKEN_CACHE_TTL = int(os.environ.get('TOKEN_CACHE_TTL', 300))
 
 ## AuthError Exception
 '''
@@ -20,6 +33,238 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+## JWKS Cache
+'''
+JWKSCache
+    signing keys of the identity provider, indexed by key id (kid)
+
+    keys are kept for the max-age announced in Cache-Control (default_ttl
+    when there is none). Expired keys keep being served while a background
+    thread refreshes them, and a failed refresh keeps the stale keys in
+    place. Requests never wait on that refresh, the network call runs
+    outside the lock guarding the keys. A kid that is not in the cache
+    triggers one synchronous refetch, shared by every request waiting on
+    it and limited to one per min_refetch_interval, so a key rotation is
+    picked up immediately while made-up kids cannot hammer the identity
+    provider.
+'''
+class JWKSCache:
+    def __init__(self, url, default_ttl=600, min_refetch_interval=30,
+                 retry_interval=30, timeout=5):
+        self.url = url
+        self.default_ttl = default_ttl
+        self.min_refetch_interval = min_refetch_interval
+        self.retry_interval = retry_interval
+        self.timeout = timeout
+        self._keys = {}
+        self._expires_at = 0
+        self._fetched_at = None
+        # _lock only guards swapping the fetched keys in, _fetch_lock is held
+        # for the whole network fetch so there is never more than one
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+
+    def get_key(self, kid):
+        key = self._keys.get(kid)
+        if key is not None:
+            if time.monotonic() >= self._expires_at:
+                self._refresh_in_background()
+            return key
+        self._refetch()
+        return self._keys.get(kid)
+
+    async def get_key_async(self, kid):
+        key = self._keys.get(kid)
+        if key is not None:
+            if time.monotonic() >= self._expires_at:
+                self._refresh_in_background()
+            return key
+        # the refetch blocks on the network, keep it off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self._refetch)
+        return self._keys.get(kid)
+
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._expires_at = 0
+            self._fetched_at = None
+
+    def _refetch(self):
+        requested_at = time.monotonic()
+        # waits for a fetch in flight and reuses its outcome
+        with self._fetch_lock:
+            fetched_at = self._fetched_at
+            # another request fetched while this one waited for the lock
+            if fetched_at is not None and fetched_at >= requested_at:
+                return
+            if (fetched_at is not None and
+                    requested_at - fetched_at < self.min_refetch_interval):
+                return
+            self._fetch()
+
+    def _refresh_in_background(self):
+        # never waits: a fetch in flight will refresh the keys anyway
+        if not self._fetch_lock.acquire(blocking=False):
+            return
+
+        def refresh():
+            try:
+                self._fetch()
+            finally:
+                self._fetch_lock.release()
+
+        try:
+            threading.Thread(target=refresh, daemon=True).start()
+        except Exception:
+            self._fetch_lock.release()
+            raise
+
+    def _fetch(self):
+        # must be called with self._fetch_lock held, the network call runs
+        # without self._lock so readers are never held up by it
+        started = time.monotonic()
+        try:
+            response = urlopen(self.url, timeout=self.timeout)
+            jwks = json.loads(response.read())
+            keys = {key['kid']: key for key in jwks['keys']}
+            max_age = self._max_age(response.headers.get('Cache-Control'))
+        except Exception:
+            # keep serving what we have and try again a little later
+            with self._lock:
+                self._fetched_at = started
+                self._expires_at = started + self.retry_interval
+            return
+        with self._lock:
+            self._keys = keys
+            self._fetched_at = started
+            self._expires_at = started + max_age
+
+    def _max_age(self, cache_control):
+        match = re.search(r'max-age=(\d+)', cache_control or '')
+        return int(match.group(1)) if match else self.default_ttl
+
+
+jwks_cache = JWKSCache(JWKS_URL)
+
+
+## Verified Token Cache
+'''
+TokenCache
+    payloads of tokens that already passed verify_decode_jwt, keyed by the
+    sha256 of the token so raw bearer tokens are never kept in memory
+
+    an entry lives until the token expires or for ttl seconds, whichever
+    comes first, and the least recently used entries are dropped beyond
+    max_entries. The permissions claim is turned into a frozenset once so
+    check_permissions is a set lookup.
+
+    revocation hooks:
+        revoke(token)          rejects that token until it expires
+        revoke_subject(sub)    rejects every token of sub issued until now
+        clear()                forgets every verified token
+'''
+VerifiedToken = namedtuple('VerifiedToken', 'payload permissions expires_at')
+
+
+class TokenCache:
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._revoked_tokens = {}
+        self._revoked_subjects = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.verifications = 0
+        self.verify_cpu_seconds = 0.0
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get(self, token):
+        key = self.key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+    def put(self, token, payload):
+        key = self.key(token)
+        if self._is_revoked(key, payload):
+            raise AuthError({
+                'code': 'token_revoked',
+                'description': 'Token has been revoked.'
+            }, 401)
+        permissions = payload.get('permissions')
+        entry = VerifiedToken(
+            payload,
+            frozenset(permissions) if permissions is not None else None,
+            min(payload.get('exp', float('inf')), time.time() + self.ttl))
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def record_verification(self, cpu_seconds):
+        with self._lock:
+            self.verifications += 1
+            self.verify_cpu_seconds += cpu_seconds
+
+    def revoke(self, token):
+        key = self.key(token)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            expires_at = entry.payload.get('exp') if entry else None
+            self._revoked_tokens[key] = expires_at or time.time() + self.ttl
+
+    def revoke_subject(self, subject):
+        with self._lock:
+            self._revoked_subjects[subject] = time.time()
+            for key, entry in list(self._entries.items()):
+                if entry.payload.get('sub') == subject:
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'verifications': self.verifications,
+            'verify_cpu_seconds': round(self.verify_cpu_seconds, 6),
+            'revoked_tokens': len(self._revoked_tokens),
+            'revoked_subjects': len(self._revoked_subjects)
+        }
+
+    def _is_revoked(self, key, payload):
+        now = time.time()
+        with self._lock:
+            # forget revocations of tokens that have expired anyway
+            for revoked, expires_at in list(self._revoked_tokens.items()):
+                if expires_at <= now:
+                    del self._revoked_tokens[revoked]
+            if key in self._revoked_tokens:
+                return True
+            revoked_at = self._revoked_subjects.get(payload.get('sub'))
+            return revoked_at is not None and payload.get('iat', 0) <= revoked_at
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+
 ## Auth Header
 
 '''
@@ -31,7 +276,14 @@ class AuthError(Exception):
     return the token part of the header
 '''
 def get_token_auth_header():
-    auth = request.headers.get('Authorization', None)
+    return parse_auth_header(request.headers.get('Authorization', None))
+
+'''
+parse_auth_header(auth)
+    the get_token_auth_header checks on an Authorization header value,
+    shared with the ASGI app which has no flask request
+'''
+def parse_auth_header(auth):
     if not auth:
         raise AuthError({
             'code': 'authorization_header_missing',
@@ -65,6 +317,8 @@ def get_token_auth_header():
     @INPUTS
         permission: string permission (i.e. 'post:drink')
         payload: decoded jwt payload
+        permissions: optional set of the payload permissions, looked up
+            instead of the payload list when given
 
     it should raise an AuthError if permissions are not included in the payload
         !!NOTE check your RBAC settings in Auth0
@@ -72,13 +326,15 @@ def get_token_auth_header():
     return true otherwise
 '''
 
-def check_permissions(permission, payload):
+def check_permissions(permission, payload, permissions=None):
     if 'permissions' not in payload:
         raise AuthError({
             'code': 'invalid_claims',
             'description': 'Permissions not included in JWT.'
         }, 400)
-    if permission not in payload['permissions']:
+    if permissions is None:
+        permissions = payload['permissions']
+    if permission not in permissions:
         raise AuthError({
             'code': 'unauthorized',
             'description': 'Permission not found.'
@@ -92,6 +348,7 @@ def check_permissions(permission, payload):
 
     it should be an Auth0 token with key id (kid)
     it should verify the token using Auth0 /.well-known/jwks.json
+        (served from jwks_cache, not fetched on every request)
     it should decode the payload from the token
     it should validate the claims
     return the decoded payload
@@ -99,25 +356,35 @@ def check_permissions(permission, payload):
     !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
 '''
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
+    return decode_jwt(token, jwks_cache.get_key(get_token_kid(token)))
+
+'''
+verify_decode_jwt_async(token)
+    verify_decode_jwt for the ASGI app, a signing key that is not cached yet
+    is fetched without blocking the event loop
+'''
+async def verify_decode_jwt_async(token):
+    return decode_jwt(token, await jwks_cache.get_key_async(get_token_kid(token)))
+
+def get_token_kid(token):
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
+    return unverified_header['kid']
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+def decode_jwt(token, key):
+    rsa_key = {}
+    if key:
+        rsa_key = {
+            'kty': key['kty'],
+            'kid': key['kid'],
+            'use': key['use'],
+            'n': key['n'],
+            'e': key['e']
+        }
 
     if rsa_key:
         try:
@@ -160,6 +427,7 @@ def verify_decode_jwt(token):
 
     it should use the get_token_auth_header method to get the token
     it should use the verify_decode_jwt method to decode the jwt
+        (only for tokens that are not in token_cache yet)
     it should use the check_permissions method validate claims and check the requested permission
     return the decorator which passes the decoded payload to the decorated method
 '''    
@@ -169,12 +437,18 @@ def requires_auth(permission=''):
         @wraps(f)
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
-            try:
-                payload = verify_decode_jwt(token)
-            except:
-                abort(401)    
-            check_permissions(permission, payload)
-            return f(payload, *args, **kwargs)
+            verified = token_cache.get(token)
+            if verified is None:
+                started = time.thread_time()
+                try:
+                    payload = verify_decode_jwt(token)
+                except:
+                    abort(401)    
+                finally:
+                    token_cache.record_verification(time.thread_time() - started)
+                verified = token_cache.put(token, payload)
+            check_permissions(permission, verified.payload, verified.permissions)
+            return f(verified.payload, *args, **kwargs)
 
         return wrapper
     return requires_auth_decorator
\ No newline at end of file
@@ -0,0 +1,227 @@
+import codecs
+import json
+from numbers import Number
+
+from sqlalchemy import exc
+from sqlalchemy.orm import joinedload
+
+from .database.models import db, Drink, Ingredient
+
+CHUNK_SIZE = 64 * 1024
+# a failed import of a large file reports its first errors and counts the rest
+MAX_REPORTED_ERRORS = 100
+
+'''
+iter_ndjson(stream)
+    the documents of a newline delimited json body, read line by line, as
+    (row number, document or ValueError) pairs; blank lines are skipped
+'''
+def iter_ndjson(stream):
+    row = 0
+    while True:
+        line = stream.readline()
+        if not line:
+            return
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            yield row, json.loads(line)
+        except ValueError as error:
+            yield row, ValueError('invalid json: {}'.format(error))
+
+
+'''
+iter_json_array(stream)
+    the elements of a json array body as (row number, element) pairs,
+    decoded chunk by chunk so the whole body is never held in memory; a
+    malformed body ends the iteration with a ValueError
+'''
+def iter_json_array(stream, chunk_size=CHUNK_SIZE):
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    position = 0
+    eof = False
+    expect = '['
+    row = 0
+
+    def fill():
+        nonlocal buffer, position, eof
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + text.decode(chunk, final=eof)
+        position = 0
+
+    while True:
+        while position < len(buffer) and buffer[position].isspace():
+            position += 1
+        if position == len(buffer):
+            if eof:
+                raise ValueError('unexpected end of the json array')
+            fill()
+            continue
+        char = buffer[position]
+        if expect == '[':
+            if char != '[':
+                raise ValueError('the body must be a json array')
+            position += 1
+            expect = 'value or ]'
+        elif expect in ('value or ]', ', or ]') and char == ']':
+            return
+        elif expect == ', or ]':
+            if char != ',':
+                raise ValueError('expected , or ] after row {}'.format(row))
+            position += 1
+            expect = 'value'
+        else:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                # the element may continue in the next chunk
+                if eof:
+                    raise ValueError('invalid json in row {}'.format(row + 1))
+                fill()
+                continue
+            # a number can be cut by the chunk boundary, read further first
+            if end == len(buffer) and not eof:
+                fill()
+                continue
+            position = end
+            row += 1
+            expect = ', or ]'
+            yield row, value
+
+
+'''
+validate_drink(document)
+    (title, recipe) of an imported drink, raises ValueError with the reason
+    when the document is not a valid drink
+'''
+def validate_drink(document):
+    if isinstance(document, ValueError):
+        raise document
+    if not isinstance(document, dict):
+        raise ValueError('a drink must be a json object')
+    title = document.get('title')
+    if not isinstance(title, str) or not title.strip() or len(title) > 80:
+        raise ValueError('title must be a non empty string of at most 80 characters')
+    recipe = document.get('recipe')
+    if isinstance(recipe, dict):
+        recipe = [recipe]
+    if not isinstance(recipe, list) or not recipe:
+        raise ValueError('recipe must be a non empty list of ingredients')
+    lines = []
+    for line in recipe:
+        if not isinstance(line, dict):
+            raise ValueError('recipe lines must be json objects')
+        name, color, parts = line.get('name'), line.get('color'), line.get('parts')
+        if not isinstance(name, str) or not name.strip() or len(name) > 80:
+            raise ValueError('ingredient name must be a non empty string of at most 80 characters')
+        if not isinstance(color, str) or not color.strip() or len(color) > 40:
+            raise ValueError('ingredient color must be a non empty string of at most 40 characters')
+        if isinstance(parts, bool) or not isinstance(parts, Number) or parts <= 0:
+            raise ValueError('ingredient parts must be a positive number')
+        lines.append({'color': color, 'name': name, 'parts': parts})
+    return title, lines
+
+
+'''
+import_drinks(rows, batch_size)
+    inserts the drinks of (row number, document) pairs, <batch_size> drinks
+    per transaction with one ingredient lookup and one title check per
+    batch. Invalid rows and titles that already exist are reported and
+    skipped, a batch the database rejects is reported as a whole.
+    returns the import report
+        {'rows': n, 'imported': n, 'failed': n, 'errors': [{'row', 'error'}]}
+'''
+def import_drinks(rows, batch_size=500):
+    report = {'rows': 0, 'imported': 0, 'failed': 0, 'errors': []}
+
+    def fail(row, error):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'row': row, 'error': str(error)})
+
+    def flush(batch):
+        titles = [title for _, title, _ in batch]
+        taken = {title for title, in db.session.query(Drink.title)
+                 .filter(Drink.title.in_(titles))}
+        drinks = []
+        for row, title, recipe in batch:
+            if title in taken:
+                fail(row, 'a drink titled {!r} already exists'.format(title))
+                continue
+            taken.add(title)
+            drinks.append((row, title, recipe))
+        if not drinks:
+            return
+        ingredients = Ingredient.get_or_create(
+            line['name'] for _, _, recipe in drinks for line in recipe)
+        for _, title, recipe in drinks:
+            drink = Drink(title=title)
+            drink.set_recipe(recipe, ingredients)
+            db.session.add(drink)
+        try:
+            db.session.commit()
+            report['imported'] += len(drinks)
+        except exc.SQLAlchemyError as error:
+            db.session.rollback()
+            for row, _, _ in drinks:
+                fail(row, 'batch rejected by the database: {}'.format(
+                    type(error).__name__))
+        # keep the session from growing with every batch
+        db.session.expunge_all()
+
+    batch = []
+    try:
+        for row, document in rows:
+            report['rows'] = row
+            try:
+                batch.append((row,) + validate_drink(document))
+            except ValueError as error:
+                fail(row, error)
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+    except ValueError as error:
+        # the body itself is malformed, nothing after this point is read
+        fail(report['rows'] + 1, error)
+    if batch:
+        flush(batch)
+    return report
+
+
+'''
+export_drinks(batch_size)
+    drink.long() of every drink in id order, read <batch_size> drinks per
+    query so exporting a large menu keeps a flat memory profile
+'''
+def export_drinks(batch_size=500):
+    last_id = 0
+    while True:
+        drinks = Drink.query.options(joinedload(Drink.ingredients)).filter(
+            Drink.id > last_id).order_by(Drink.id).limit(batch_size).all()
+        if not drinks:
+            return
+        for drink in drinks:
+            yield drink.long()
+        last_id = drinks[-1].id
+        db.session.expunge_all()
+
+
+'''
+ndjson_lines(documents) / json_array_chunks(documents)
+    encoded chunks of a streamed response body
+'''
+def ndjson_lines(documents):
+    for document in documents:
+        yield json.dumps(document) + '\n'
+
+
+def json_array_chunks(documents):
+    separator = '['
+    for document in documents:
+        yield separator + json.dumps(document)
+        separator = ',\n'
+    yield '[]' if separator == '[' else ']'
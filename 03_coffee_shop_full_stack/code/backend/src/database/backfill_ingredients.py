@@ -0,0 +1,53 @@
+import json
+import sys
+
+from flask import Flask
+
+from .models import db, setup_db, Drink, DrinkIngredient
+
+'''
+backfill_ingredients
+    migrates an existing database to the ingredient tables:
+        - creates the ingredient and drink_ingredient tables (create_all
+          leaves existing tables alone)
+        - on PostgreSQL widens drink.recipe from VARCHAR(180) to TEXT
+        - fills the recipe lines of every drink that has none from its
+          json recipe, <batch_size> drinks per commit
+
+    it can be run again safely, drinks that already have lines are skipped
+
+    from within the ./backend directory run
+        python -m src.database.backfill_ingredients [batch_size]
+'''
+
+
+def upgrade(batch_size=500):
+    db.create_all()
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute('ALTER TABLE drink ALTER COLUMN recipe TYPE TEXT')
+        db.session.commit()
+
+    pending = db.session.query(Drink.id).filter(
+        ~Drink.ingredients.any()).order_by(Drink.id)
+    ids = [drink_id for drink_id, in pending]
+    migrated = skipped = 0
+    for start in range(0, len(ids), batch_size):
+        batch = Drink.query.filter(Drink.id.in_(ids[start:start + batch_size])).all()
+        for drink in batch:
+            try:
+                drink.set_recipe(json.loads(drink.recipe))
+                migrated += 1
+            except (ValueError, KeyError, TypeError):
+                print('skipped drink {}: unreadable recipe {!r}'.format(
+                    drink.id, drink.recipe))
+                skipped += 1
+        db.session.commit()
+    print('migrated {} drinks, skipped {}, {} recipe lines in total'.format(
+        migrated, skipped, DrinkIngredient.query.count()))
+
+
+if __name__ == '__main__':
+    app = Flask(__name__)
+    setup_db(app)
+    with app.app_context():
+        upgrade(*(int(arg) for arg in sys.argv[1:]))
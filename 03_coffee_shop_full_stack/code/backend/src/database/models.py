@@ -1,13 +1,92 @@
 import os
-from sqlalchemy import Column, String, Integer
+import time
+from sqlalchemy import Column, String, Integer, Float, Text, ForeignKey, Index, select, text
+from sqlalchemy.orm import relationship, validates
+from sqlalchemy.pool import QueuePool
 from flask_sqlalchemy import SQLAlchemy
 import json
 
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
-database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
+database_path = os.environ.get(
+    'DATABASE_URL',
+    "sqlite:///{}".format(os.path.join(project_dir, database_filename)))
 db = SQLAlchemy()
 
+
+'''
+TimedQueuePool
+    QueuePool that records how long checkouts wait for a connection
+'''
+class TimedQueuePool(QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            self.checkouts += 1
+            self.wait_time += waited
+            self.max_wait = max(self.max_wait, waited)
+
+
+'''
+engine_options(database_path)
+    create_engine options read from the environment when DATABASE_URL
+    points at a server database (the default SQLite file keeps its pool):
+    DB_POOL_SIZE (5), DB_MAX_OVERFLOW (10), DB_POOL_TIMEOUT (30 s),
+    DB_POOL_RECYCLE (1800 s), DB_POOL_PRE_PING (true) and
+    DB_STATEMENT_TIMEOUT (ms, 0 disables it, PostgreSQL only)
+'''
+def engine_options(database_path):
+    if database_path.startswith('sqlite'):
+        return {}
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.environ.get(
+            'DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes', 'on'),
+    }
+    statement_timeout = int(os.environ.get('DB_STATEMENT_TIMEOUT', 0))
+    if statement_timeout and database_path.startswith('postgres'):
+        options['connect_args'] = {
+            'options': '-c statement_timeout={}'.format(statement_timeout)}
+    return options
+
+
+'''
+pool_stats()
+    live statistics of the connection pool behind db
+'''
+def pool_stats():
+    pool = db.engine.pool
+    stats = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            # overflow() counts up from -size while the pool fills up
+            'overflow': max(pool.overflow(), 0),
+        })
+    if isinstance(pool, TimedQueuePool):
+        stats.update({
+            'checkouts': pool.checkouts,
+            'wait_seconds_total': round(pool.wait_time, 6),
+            'wait_seconds_max': round(pool.max_wait, 6),
+        })
+    return stats
+
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
@@ -15,6 +94,7 @@ setup_db(app)
 def setup_db(app):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path)
     db.app = app
     db.init_app(app)
 
@@ -28,6 +108,88 @@ def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
 
+'''
+Ingredient
+    an ingredient used by drink recipes, stored once by name
+'''
+class Ingredient(db.Model):
+    id = Column(Integer, primary_key=True)
+    # unique, so looking an ingredient up by name uses its index
+    name = Column(String(80), unique=True, nullable=False)
+
+    '''
+    get_or_create(names)
+        the ingredients with the given names by name, missing ones are
+        inserted in the current transaction with ON CONFLICT DO NOTHING
+        (PostgreSQL, SQLite 3.24 or later) and read back, so two requests
+        adding the same new ingredient both get the one row
+    '''
+    @classmethod
+    def get_or_create(cls, names):
+        names = set(names)
+        ingredients = {ingredient.name: ingredient for ingredient in
+                       cls.query.filter(cls.name.in_(names)).all()} if names else {}
+        missing = names - set(ingredients)
+        if missing:
+            db.session.execute(text(
+                'INSERT INTO ingredient (name) VALUES (:name) ON CONFLICT (name) DO NOTHING'),
+                [{'name': name} for name in missing])
+            ingredients.update((ingredient.name, ingredient) for ingredient in
+                               cls.query.filter(cls.name.in_(missing)).all())
+        return ingredients
+
+
+'''
+DrinkIngredient
+    one line of a drink recipe, in recipe order
+'''
+class DrinkIngredient(db.Model):
+    __tablename__ = 'drink_ingredient'
+    __table_args__ = (
+        # drinks that use an ingredient, answered from the index alone
+        Index('ix_drink_ingredient_ingredient_id_drink_id',
+              'ingredient_id', 'drink_id'),
+    )
+
+    drink_id = Column(Integer, ForeignKey('drink.id', ondelete='CASCADE'), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    ingredient_id = Column(Integer, ForeignKey('ingredient.id'), nullable=False)
+    color = Column(String(40), nullable=False)
+    parts = Column(Float, nullable=False)
+    ingredient = relationship(Ingredient, lazy='joined', innerjoin=True)
+
+    def long(self):
+        parts = self.parts
+        return {
+            'color': self.color,
+            'name': self.ingredient.name,
+            'parts': int(parts) if float(parts).is_integer() else parts
+        }
+
+
+'''
+recipe_lines(recipe)
+    a recipe from a request as a list of {'color', 'name', 'parts'} dicts,
+    a single line may be sent without the enclosing list
+'''
+def recipe_lines(recipe):
+    if isinstance(recipe, dict):
+        recipe = [recipe]
+    return [{'color': r['color'], 'name': r['name'], 'parts': r['parts']} for r in recipe]
+
+
+'''
+drinks_using(name)
+    a filter on the drink id matching drinks with the named ingredient,
+    usable both in Drink.query.filter() and in core queries
+'''
+def drinks_using(name):
+    return Drink.__table__.c.id.in_(
+        select([DrinkIngredient.drink_id])
+        .where(DrinkIngredient.ingredient_id == Ingredient.id)
+        .where(Ingredient.name == name))
+
+
 '''
 Drink
 a persistent drink entity, extends the base SQLAlchemy Model
@@ -37,21 +199,75 @@ class Drink(db.Model):
     id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
     # String Title
     title = Column(String(80), unique=True)
-    # the ingredients blob - this stores a lazy json blob
+    # the recipe as a json blob, kept in step with ingredients by set_recipe()
     # the required datatype is [{'color': string, 'name':string, 'parts':number}]
-    recipe =  Column(String(180), nullable=False)
+    recipe =  Column(Text, nullable=False)
+    # the recipe lines, the menu and the export load them in the drinks
+    # query with joinedload(Drink.ingredients)
+    ingredients = relationship(DrinkIngredient, order_by=DrinkIngredient.position,
+                               cascade='all, delete-orphan')
+
+    '''
+    set_recipe(recipe, ingredients=None)
+        replaces the recipe, both its lines and the json blob, ingredients
+        may hold the Ingredient.get_or_create() of a whole batch of drinks
+        EXAMPLE
+            drink.set_recipe([{'name': 'milk', 'color': 'white', 'parts': 1}])
+            drink.update()
+    '''
+    def set_recipe(self, recipe, ingredients=None):
+        recipe = recipe_lines(recipe)
+        if ingredients is None:
+            ingredients = Ingredient.get_or_create(r['name'] for r in recipe)
+        self.ingredients = [DrinkIngredient(
+            position=position,
+            ingredient=ingredients[r['name']],
+            color=r['color'],
+            parts=r['parts']
+        ) for position, r in enumerate(recipe)]
+        self.recipe = json.dumps(recipe)
+
+    '''
+    long_recipe() / short_recipe()
+        the recipe and its short projection, built once per loaded instance
+        from the ingredient lines and kept until the recipe changes (drinks
+        that have no lines yet fall back to the json blob)
+    '''
+    def long_recipe(self):
+        recipe = self.__dict__.get('_long_recipe')
+        if recipe is None:
+            if self.ingredients:
+                recipe = [line.long() for line in self.ingredients]
+            else:
+                recipe = json.loads(self.recipe)
+            self._long_recipe = recipe
+        return recipe
+
+    def short_recipe(self):
+        recipe = self.__dict__.get('_short_recipe')
+        if recipe is None:
+            recipe = self._short_recipe = [
+                {'color': r['color'], 'parts': r['parts']} for r in self.long_recipe()]
+        return recipe
+
+    def forget_recipe(self):
+        self.__dict__.pop('_long_recipe', None)
+        self.__dict__.pop('_short_recipe', None)
+
+    @validates('recipe')
+    def validate_recipe(self, key, recipe):
+        self.forget_recipe()
+        return recipe
 
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': short_recipe
+            'recipe': self.short_recipe()
         }
 
     '''
@@ -62,7 +278,7 @@ class Drink(db.Model):
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': self.long_recipe()
         }
 
     '''
@@ -71,7 +287,8 @@ class Drink(db.Model):
         the model must have a unique name
         the model must have a unique id or null id
         EXAMPLE
-            drink = Drink(title=req_title, recipe=req_recipe)
+            drink = Drink(title=req_title)
+            drink.set_recipe(req_recipe)
             drink.insert()
     '''
     def insert(self):
@@ -101,6 +318,8 @@ class Drink(db.Model):
     '''
     def update(self):
         db.session.commit()
+        # the row may have been changed by someone else, parse it again
+        self.forget_recipe()
 
     def __repr__(self):
         return json.dumps(self.short())
\ No newline at end of file
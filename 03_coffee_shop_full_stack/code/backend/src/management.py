@@ -0,0 +1,267 @@
+import asyncio
+import os
+import random
+import threading
+import time
+
+import httpx
+
+'''
+ManagementError
+    a management api call that failed, status_code is the status returned
+    to our own client (502 upstream error, 503 circuit open)
+'''
+class ManagementError(Exception):
+    def __init__(self, error, status_code):
+        self.error = error
+        self.status_code = status_code
+
+
+'''
+CircuitBreaker
+    opens after <threshold> consecutive failed calls, rejects calls while
+    open and lets a single trial call through after <reset_timeout> seconds;
+    the trial closes the circuit again on success
+'''
+class CircuitBreaker:
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+'''
+ManagementClient
+    Auth0 management api client shared by the whole app
+
+    one httpx.Client keeps a pool of keep-alive connections, so calls skip
+    the TCP/TLS setup. Every attempt has a timeout, connection errors, 429
+    and 5xx responses are retried with jittered exponential backoff, and a
+    CircuitBreaker stops calling Auth0 while it keeps failing. Role member
+    listings are cached for <cache_ttl> seconds and dropped when the role
+    changes through this client.
+
+    transport is handed to httpx.Client, pass an httpx.MockTransport or
+    point base_url at a local fake server in tests
+'''
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class ManagementClient:
+    def __init__(self, base_url, token, transport=None, timeout=5, retries=2,
+                 backoff=0.1, max_backoff=2, cache_ttl=30, pool_size=10,
+                 breaker=None):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.cache_ttl = cache_ttl
+        self.breaker = breaker or CircuitBreaker()
+        self._client = self._http_client(
+            base_url=base_url,
+            headers={'authorization': "Bearer {}".format(token)},
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=pool_size,
+                                max_keepalive_connections=pool_size),
+            transport=transport)
+        self._role_users = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.attempts = 0
+        self.cache_hits = 0
+
+    @classmethod
+    def from_env(cls, base_url, token, **options):
+        settings = dict(
+            timeout=float(os.environ.get('MANAGEMENT_TIMEOUT', 5)),
+            retries=int(os.environ.get('MANAGEMENT_RETRIES', 2)),
+            cache_ttl=float(os.environ.get('MANAGEMENT_CACHE_TTL', 30)),
+            pool_size=int(os.environ.get('MANAGEMENT_POOL_SIZE', 10)))
+        settings.update(options)
+        return cls(base_url, token, **settings)
+
+    def _http_client(self, **options):
+        return httpx.Client(**options)
+
+    def role_users(self, role):
+        users = self._cached(role)
+        if users is None:
+            users = self._store(role, self._call('GET', '/roles/{}/users'.format(role)).json())
+        return users
+
+    def add_role(self, user_id, role):
+        self._call('POST', '/users/{}/roles'.format(user_id),
+                   json={'roles': [role]})
+        self.invalidate(role)
+
+    def remove_role(self, user_id, role):
+        self._call('DELETE', '/users/{}/roles'.format(user_id),
+                   json={'roles': [role]})
+        self.invalidate(role)
+
+    def invalidate(self, role=None):
+        with self._lock:
+            if role is None:
+                self._role_users.clear()
+            else:
+                self._role_users.pop(role, None)
+
+    def close(self):
+        self._client.close()
+
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'attempts': self.attempts,
+            'retries': self.attempts - self.calls,
+            'cache_hits': self.cache_hits,
+            'cached_roles': len(self._role_users),
+            'circuit': self.breaker.state
+        }
+
+    def _cached(self, role):
+        with self._lock:
+            cached = self._role_users.get(role)
+            if cached is not None and cached[0] > time.monotonic():
+                self.cache_hits += 1
+                return cached[1]
+        return None
+
+    def _store(self, role, users):
+        with self._lock:
+            self._role_users[role] = (time.monotonic() + self.cache_ttl, users)
+        return users
+
+    def _call(self, method, path, **kwargs):
+        self._start_call()
+        for attempt in range(self.retries + 1):
+            self.attempts += 1
+            try:
+                response = self._client.request(method, path, **kwargs)
+            except httpx.TransportError as error:
+                response, reason = None, str(error) or type(error).__name__
+            else:
+                reason = self._retry_reason(response)
+                if reason is None:
+                    return self._result(response)
+            if attempt < self.retries:
+                time.sleep(self._delay(attempt, response))
+        raise self._failure(reason)
+
+    def _start_call(self):
+        if not self.breaker.allow():
+            raise ManagementError({
+                'code': 'management_unavailable',
+                'description': 'Auth0 management api is failing, try again later.'
+            }, 503)
+        self.calls += 1
+
+    def _retry_reason(self, response):
+        if response.status_code in RETRY_STATUS:
+            return 'status {}'.format(response.status_code)
+        return None
+
+    def _result(self, response):
+        self.breaker.success()
+        if response.is_error:
+            # 4xx, our request is wrong and retrying will not change that
+            raise ManagementError({
+                'code': 'management_error',
+                'description': 'Auth0 management api answered {}.'.format(
+                    response.status_code)
+            }, 502)
+        return response
+
+    def _failure(self, reason):
+        self.breaker.failure()
+        return ManagementError({
+            'code': 'management_error',
+            'description': 'Auth0 management api call failed: {}.'.format(reason)
+        }, 502)
+
+    def _delay(self, attempt, response):
+        retry_after = response.headers.get('Retry-After') if response else None
+        if retry_after and retry_after.isdigit():
+            return min(int(retry_after), self.max_backoff)
+        # full jitter keeps workers from retrying in lockstep
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+'''
+AsyncManagementClient
+    ManagementClient for the ASGI app: the same retries, circuit breaker
+    and role listing cache over one httpx.AsyncClient, and backoff waits
+    that do not block the event loop
+'''
+class AsyncManagementClient(ManagementClient):
+    def _http_client(self, **options):
+        return httpx.AsyncClient(**options)
+
+    async def role_users(self, role):
+        users = self._cached(role)
+        if users is None:
+            response = await self._call('GET', '/roles/{}/users'.format(role))
+            users = self._store(role, response.json())
+        return users
+
+    async def add_role(self, user_id, role):
+        await self._call('POST', '/users/{}/roles'.format(user_id),
+                         json={'roles': [role]})
+        self.invalidate(role)
+
+    async def remove_role(self, user_id, role):
+        await self._call('DELETE', '/users/{}/roles'.format(user_id),
+                         json={'roles': [role]})
+        self.invalidate(role)
+
+    async def close(self):
+        await self._client.aclose()
+
+    async def _call(self, method, path, **kwargs):
+        self._start_call()
+        for attempt in range(self.retries + 1):
+            self.attempts += 1
+            try:
+                response = await self._client.request(method, path, **kwargs)
+            except httpx.TransportError as error:
+                response, reason = None, str(error) or type(error).__name__
+            else:
+                reason = self._retry_reason(response)
+                if reason is None:
+                    return self._result(response)
+            if attempt < self.retries:
+                await asyncio.sleep(self._delay(attempt, response))
+        raise self._failure(reason)
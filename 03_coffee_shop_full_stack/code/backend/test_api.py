@@ -0,0 +1,265 @@
+import json
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+from sqlalchemy import create_engine
+
+# the apps read DATABASE_URL when they are imported
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+from src import api, bulk  # noqa: E402
+from src.api import app, menu  # noqa: E402
+from src.auth.auth import token_cache  # noqa: E402
+from src.database.models import (db, engine_options, Drink, Ingredient,  # noqa: E402
+                                  TimedQueuePool)
+
+TOKEN = 'api-test-token'
+PERMISSIONS = ['get:drinks-detail', 'post:drinks', 'patch:drinks', 'delete:drinks',
+               'post:drinks-import', 'get:drinks-export']
+
+
+def recipe(*names):
+    return [{'name': name, 'color': 'brown', 'parts': 1} for name in names]
+
+
+class CoffeeShopTestCase(unittest.TestCase):
+    """Drinks endpoints of the flask app on an in-memory SQLite database"""
+
+    def setUp(self):
+        self.client = app.test_client
+        self.context = app.app_context()
+        self.context.push()
+        db.create_all()
+        for title, names in (('latte', ('milk', 'coffee')), ('espresso', ('coffee',))):
+            drink = Drink(title=title)
+            drink.set_recipe(recipe(*names))
+            db.session.add(drink)
+        db.session.commit()
+        db.session.remove()
+        menu.clear()
+        token_cache.put(TOKEN, {
+            'sub': 'api-test',
+            'exp': time.time() + 3600,
+            'permissions': PERMISSIONS
+        })
+        self.headers = {'Authorization': 'Bearer {}'.format(TOKEN)}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def titles(self, res):
+        return [drink['title'] for drink in json.loads(res.data)['drinks']]
+
+    # menu snapshot
+
+    def test_GET_drinks_sends_etag_and_no_cache(self):
+        res = self.client().get('/drinks')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.titles(res), ['latte', 'espresso'])
+        self.assertTrue(res.headers['ETag'])
+        self.assertTrue(res.cache_control.no_cache)
+        self.assertFalse(res.cache_control.private)
+
+    def test_GET_drinks_304_when_etag_matches(self):
+        etag = self.client().get('/drinks').headers['ETag']
+        res = self.client().get('/drinks', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+    def test_GET_drinks_200_when_etag_is_stale(self):
+        res = self.client().get('/drinks', headers={'If-None-Match': '"stale"'})
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_GET_drinks_detail_is_private(self):
+        res = self.client().get('/drinks-detail', headers=self.headers)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.cache_control.private)
+        self.assertTrue(res.cache_control.no_cache)
+        self.assertIn('recipe', json.loads(res.data)['drinks'][0])
+
+    def test_menu_is_served_without_queries(self):
+        self.client().get('/drinks')
+        rebuilds = menu.rebuilds
+        self.client().get('/drinks')
+        self.client().get('/drinks-detail', headers=self.headers)
+
+        self.assertEqual(menu.rebuilds, rebuilds)
+
+    def test_POST_drink_rebuilds_menu(self):
+        etag = self.client().get('/drinks').headers['ETag']
+        self.client().post('/drinks', headers=self.headers,
+                           json={'title': 'mocha', 'recipe': recipe('chocolate', 'coffee')})
+        res = self.client().get('/drinks', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+        self.assertEqual(self.titles(res), ['latte', 'espresso', 'mocha'])
+
+    def test_PATCH_drink_rebuilds_menu(self):
+        etag = self.client().get('/drinks').headers['ETag']
+        self.client().patch('/drinks/1', headers=self.headers, json={'title': 'flat white'})
+        res = self.client().get('/drinks', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.titles(res), ['flat white', 'espresso'])
+
+    def test_DELETE_drink_rebuilds_menu(self):
+        self.client().get('/drinks')
+        self.client().delete('/drinks/2', headers=self.headers)
+        res = self.client().get('/drinks')
+
+        self.assertEqual(self.titles(res), ['latte'])
+
+    def test_GET_drinks_404_when_menu_is_empty(self):
+        self.client().delete('/drinks/1', headers=self.headers)
+        self.client().delete('/drinks/2', headers=self.headers)
+        res = self.client().get('/drinks')
+
+        self.assertEqual(res.status_code, 404)
+
+    # bulk import and export
+
+    def import_body(self, body, content_type):
+        with mock.patch.object(api, 'BULK_BATCH_SIZE', 2):
+            res = self.client().post('/drinks/import', headers=self.headers,
+                                     data=body, content_type=content_type)
+        return res.status_code, json.loads(res.data)
+
+    def test_POST_import_ndjson(self):
+        lines = [json.dumps({'title': 'drink {}'.format(i), 'recipe': recipe('milk', 'syrup')})
+                 for i in range(5)]
+        status, report = self.import_body('\n'.join(lines) + '\n\n', 'application/x-ndjson')
+
+        self.assertEqual(status, 200)
+        self.assertTrue(report['success'])
+        self.assertEqual((report['rows'], report['imported'], report['failed']), (5, 5, 0))
+        self.assertEqual(Drink.query.count(), 7)
+        # ingredients are shared, not duplicated per drink
+        self.assertEqual(Ingredient.query.count(), 3)
+
+    def test_POST_import_json_array(self):
+        drinks = [{'title': 'drink {}'.format(i), 'recipe': recipe('milk')} for i in range(3)]
+        status, report = self.import_body(json.dumps(drinks), 'application/json')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(report['imported'], 3)
+        self.assertIn('drink 2', self.titles(self.client().get('/drinks')))
+
+    def test_POST_import_reports_invalid_rows(self):
+        lines = [
+            json.dumps({'title': 'cortado', 'recipe': recipe('milk')}),
+            json.dumps({'title': '', 'recipe': recipe('milk')}),
+            '{not json',
+            json.dumps({'title': 'macchiato', 'recipe': [{'name': 'milk', 'color': 'white', 'parts': 0}]}),
+            # the title is taken by a seeded drink, then by an earlier row
+            json.dumps({'title': 'latte', 'recipe': recipe('milk')}),
+            json.dumps({'title': 'cortado', 'recipe': recipe('milk')}),
+        ]
+        status, report = self.import_body('\n'.join(lines), 'application/x-ndjson')
+
+        self.assertEqual(status, 200)
+        self.assertFalse(report['success'])
+        self.assertEqual((report['rows'], report['imported'], report['failed']), (6, 1, 5))
+        self.assertEqual([error['row'] for error in report['errors']], [2, 3, 4, 5, 6])
+        self.assertIn('title', report['errors'][0]['error'])
+        self.assertIn('invalid json', report['errors'][1]['error'])
+        self.assertIn('already exists', report['errors'][3]['error'])
+        self.assertIn('already exists', report['errors'][4]['error'])
+        self.assertEqual(Drink.query.filter_by(title='cortado').count(), 1)
+
+    def test_POST_import_caps_reported_errors(self):
+        lines = ['{}'] * (bulk.MAX_REPORTED_ERRORS + 20)
+        status, report = self.import_body('\n'.join(lines), 'application/x-ndjson')
+
+        self.assertEqual(report['failed'], bulk.MAX_REPORTED_ERRORS + 20)
+        self.assertEqual(len(report['errors']), bulk.MAX_REPORTED_ERRORS)
+
+    def test_POST_import_malformed_array(self):
+        body = '[{"title": "cortado", "recipe": [{"name": "milk", "color": "white", "parts": 1}]}, {"title": '
+        status, report = self.import_body(body, 'application/json')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(report['imported'], 1)
+        self.assertEqual(report['failed'], 1)
+        self.assertEqual(report['errors'], [{'row': 2, 'error': 'invalid json in row 2'}])
+
+    def test_GET_export_json_array(self):
+        with mock.patch.object(api, 'BULK_BATCH_SIZE', 1):
+            res = self.client().get('/drinks/export', headers=self.headers)
+
+        self.assertEqual(res.mimetype, 'application/json')
+        self.assertTrue(res.is_streamed)
+        drinks = json.loads(res.data)
+        self.assertEqual([drink['title'] for drink in drinks], ['latte', 'espresso'])
+        self.assertEqual(drinks[0]['recipe'], recipe('milk', 'coffee'))
+
+    def test_GET_export_ndjson(self):
+        res = self.client().get('/drinks/export?format=ndjson', headers=self.headers)
+
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        lines = res.data.decode().splitlines()
+        self.assertEqual([json.loads(line)['title'] for line in lines], ['latte', 'espresso'])
+
+    def test_GET_export_empty_menu(self):
+        self.client().delete('/drinks/1', headers=self.headers)
+        self.client().delete('/drinks/2', headers=self.headers)
+        res = self.client().get('/drinks/export', headers=self.headers)
+
+        self.assertEqual(json.loads(res.data), [])
+
+    def test_export_can_be_imported_back(self):
+        exported = self.client().get('/drinks/export?format=ndjson', headers=self.headers).data
+        self.client().delete('/drinks/1', headers=self.headers)
+        self.client().delete('/drinks/2', headers=self.headers)
+        status, report = self.import_body(exported, 'application/x-ndjson')
+
+        self.assertEqual(report['imported'], 2)
+        self.assertEqual(self.titles(self.client().get('/drinks')), ['latte', 'espresso'])
+
+
+class PoolTestCase(unittest.TestCase):
+    """This class represents the connection pool statistics test case"""
+
+    def test_GET_admin_pool_reports_checkouts(self):
+        env = {'DB_POOL_SIZE': '1', 'DB_MAX_OVERFLOW': '0', 'DB_POOL_TIMEOUT': '5',
+               'DB_POOL_RECYCLE': '60', 'DB_POOL_PRE_PING': 'false', 'DB_STATEMENT_TIMEOUT': '500'}
+        with mock.patch.dict(os.environ, env):
+            options = engine_options('postgresql://localhost/coffee')
+        self.assertEqual(options.pop('connect_args'), {'options': '-c statement_timeout=500'})
+        self.assertEqual(options, {'poolclass': TimedQueuePool, 'pool_size': 1, 'max_overflow': 0,
+                                   'pool_timeout': 5, 'pool_recycle': 60, 'pool_pre_ping': False})
+
+        # the same pool over SQLite, its only connection is released after 0.2 s
+        engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, **options)
+        self.addCleanup(engine.dispose)
+        token_cache.put(TOKEN, {'sub': 'api-test', 'exp': time.time() + 3600,
+                                'permissions': ['get:pool-stats']})
+        held = engine.connect()
+        threading.Timer(0.2, held.close).start()
+        with engine.connect():
+            with mock.patch.object(type(db), 'engine', new_callable=mock.PropertyMock,
+                                   return_value=engine):
+                res = app.test_client().get(
+                    '/admin/pool', headers={'Authorization': 'Bearer {}'.format(TOKEN)})
+        data = json.loads(res.data)['pool']
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['pool'], 'TimedQueuePool')
+        self.assertEqual(data['checked_out'], 1)
+        self.assertEqual(data['checkouts'], 2)
+        self.assertGreaterEqual(data['wait_seconds_max'], 0.15)
+        self.assertGreaterEqual(data['wait_seconds_total'], data['wait_seconds_max'])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
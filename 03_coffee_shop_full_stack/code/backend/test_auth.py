@@ -0,0 +1,170 @@
+import asyncio
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.auth.auth import JWKSCache
+
+KEY_A = {'kid': 'a', 'kty': 'RSA', 'n': 'n-a', 'e': 'AQAB'}
+KEY_B = {'kid': 'b', 'kty': 'RSA', 'n': 'n-b', 'e': 'AQAB'}
+
+
+class StubJWKSServer:
+    """A local identity provider serving a JWKS document.
+
+    keys, status, cache_control and delay (seconds before answering) can be
+    changed between requests, hits counts the requests served.
+    """
+
+    def __init__(self):
+        self.keys = [KEY_A]
+        self.status = 200
+        self.cache_control = 'max-age=600'
+        self.delay = 0
+        self.hits = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.hits += 1
+                time.sleep(stub.delay)
+                body = json.dumps({'keys': stub.keys}).encode()
+                self.send_response(stub.status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                if stub.cache_control:
+                    self.send_header('Cache-Control', stub.cache_control)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/.well-known/jwks.json'.format(self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class JWKSCacheTestCase(unittest.TestCase):
+    """This class represents the JWKS cache test case"""
+
+    def setUp(self):
+        self.idp = StubJWKSServer()
+        self.cache = JWKSCache(self.idp.url, min_refetch_interval=30, retry_interval=30)
+
+    def tearDown(self):
+        self.wait_for_refresh()
+        self.idp.close()
+
+    def wait_for_refresh(self):
+        """Returns once no fetch is in flight."""
+        with self.cache._fetch_lock:
+            pass
+
+    def expire(self):
+        self.cache._expires_at = time.monotonic() - 1
+
+    def test_first_fetch(self):
+        self.assertEqual(self.cache.get_key('a'), KEY_A)
+        self.assertEqual(self.idp.hits, 1)
+
+    def test_max_age_is_honoured(self):
+        self.idp.cache_control = 'public, max-age=120'
+        self.cache.get_key('a')
+        for _ in range(5):
+            self.assertEqual(self.cache.get_key('a'), KEY_A)
+
+        self.assertEqual(self.idp.hits, 1)
+        self.assertAlmostEqual(self.cache._expires_at - time.monotonic(), 120, delta=5)
+
+    def test_default_ttl_without_cache_control(self):
+        self.idp.cache_control = None
+        self.cache.get_key('a')
+
+        self.assertAlmostEqual(self.cache._expires_at - time.monotonic(),
+                               self.cache.default_ttl, delta=5)
+
+    def test_unknown_kid_refetch_is_single_flight(self):
+        self.cache.get_key('a')
+        # the identity provider rotated its keys
+        self.idp.keys = [KEY_A, KEY_B]
+        self.idp.delay = 0.3
+        self.cache._fetched_at -= self.cache.min_refetch_interval
+        found = []
+        threads = [threading.Thread(target=lambda: found.append(self.cache.get_key('b')))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(found, [KEY_B] * 8)
+        self.assertEqual(self.idp.hits, 2)
+
+    def test_unknown_kid_refetch_is_rate_limited(self):
+        self.cache.get_key('a')
+
+        self.assertIsNone(self.cache.get_key('made-up'))
+        self.assertIsNone(self.cache.get_key('made-up'))
+        self.assertEqual(self.idp.hits, 1)
+
+    def test_stale_keys_served_when_refresh_fails(self):
+        self.cache.get_key('a')
+        self.idp.status = 500
+        self.expire()
+
+        self.assertEqual(self.cache.get_key('a'), KEY_A)
+        self.wait_for_refresh()
+        self.assertEqual(self.idp.hits, 2)
+        self.assertEqual(self.cache.get_key('a'), KEY_A)
+        # the failed refresh is retried after retry_interval, not on every request
+        self.assertAlmostEqual(self.cache._expires_at - time.monotonic(),
+                               self.cache.retry_interval, delta=5)
+        self.assertEqual(self.idp.hits, 2)
+
+    def test_refresh_does_not_block_callers(self):
+        self.cache.get_key('a')
+        self.idp.delay = 1
+        self.idp.keys = [KEY_B]
+        self.expire()
+
+        started = time.monotonic()
+        results = [self.cache.get_key('a') for _ in range(20)]
+        # a second thread arriving while the refresh is in flight
+        thread = threading.Thread(target=lambda: results.append(self.cache.get_key('a')))
+        thread.start()
+        thread.join()
+        elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(results, [KEY_A] * 21)
+        self.wait_for_refresh()
+        self.assertEqual(self.idp.hits, 2)
+        self.assertEqual(self.cache.get_key('b'), KEY_B)
+
+    def test_refresh_does_not_block_the_event_loop(self):
+        self.cache.get_key('a')
+        self.idp.delay = 1
+        self.expire()
+
+        async def lookups():
+            started = time.monotonic()
+            keys = [await self.cache.get_key_async('a') for _ in range(20)]
+            return keys, time.monotonic() - started
+
+        keys, elapsed = asyncio.run(lookups())
+
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(keys, [KEY_A] * 20)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,291 @@
+import asyncio
+import json
+import os
+import time
+import unittest
+from unittest import mock
+
+import httpx
+
+# the apps read DATABASE_URL when they are imported
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+from src import api  # noqa: E402
+from src.auth.auth import token_cache  # noqa: E402
+from src.management import (AsyncManagementClient, CircuitBreaker,  # noqa: E402
+                            ManagementClient, ManagementError)
+
+ROLE = 'rol_barista'
+USERS = [{'user_id': 'auth0|1', 'email': 'barista@example.com'}]
+TOKEN = 'management-test-token'
+
+
+class FakeManagementApi:
+    """httpx.MockTransport handler answering with the queued responses.
+
+    Each queued item is a status code, an (status, headers) pair or an
+    exception to raise. Once the queue is empty every call succeeds.
+    requests records (method, path) of every call.
+    """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+        self.transport = httpx.MockTransport(self)
+
+    def __call__(self, request):
+        self.requests.append((request.method, request.url.path))
+        outcome = self.responses.pop(0) if self.responses else 200
+        if isinstance(outcome, Exception):
+            raise outcome
+        status, headers = outcome if isinstance(outcome, tuple) else (outcome, {})
+        body = USERS if request.method == 'GET' and status == 200 else {}
+        return httpx.Response(status, headers=headers, json=body)
+
+
+class ManagementClientTestCase(unittest.TestCase):
+    """This class represents the management api client test case"""
+
+    def client(self, fake, **options):
+        options.setdefault('breaker', CircuitBreaker(threshold=3, reset_timeout=30))
+        client = ManagementClient('https://tenant.example/api/v2', 'token',
+                                  transport=fake.transport, **options)
+        self.addCleanup(client.close)
+        return client
+
+    def test_retries_5xx_with_jittered_backoff(self):
+        fake = FakeManagementApi(503, 500)
+        client = self.client(fake, retries=2, backoff=0.1)
+        with mock.patch('src.management.time.sleep') as sleep:
+            self.assertEqual(client.role_users(ROLE), USERS)
+
+        self.assertEqual(len(fake.requests), 3)
+        delays = [call.args[0] for call in sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        # full jitter: anywhere between 0 and backoff * 2 ** attempt
+        self.assertTrue(0 <= delays[0] <= 0.1)
+        self.assertTrue(0 <= delays[1] <= 0.2)
+        self.assertEqual(client.stats()['retries'], 2)
+
+    def test_retry_after_is_honoured_on_429(self):
+        fake = FakeManagementApi((429, {'Retry-After': '1'}))
+        client = self.client(fake, max_backoff=2)
+        with mock.patch('src.management.time.sleep') as sleep:
+            client.role_users(ROLE)
+
+        sleep.assert_called_once_with(1)
+
+    def test_retries_transport_errors(self):
+        fake = FakeManagementApi(httpx.ConnectError('refused'))
+        client = self.client(fake)
+        with mock.patch('src.management.time.sleep'):
+            self.assertEqual(client.role_users(ROLE), USERS)
+
+        self.assertEqual(len(fake.requests), 2)
+
+    def test_gives_up_with_502(self):
+        fake = FakeManagementApi(503, 503, 503)
+        client = self.client(fake, retries=2)
+        with mock.patch('src.management.time.sleep'):
+            with self.assertRaises(ManagementError) as raised:
+                client.role_users(ROLE)
+
+        self.assertEqual(raised.exception.status_code, 502)
+        self.assertEqual(len(fake.requests), 3)
+
+    def test_4xx_is_not_retried(self):
+        fake = FakeManagementApi(404)
+        client = self.client(fake)
+        with self.assertRaises(ManagementError) as raised:
+            client.add_role('auth0|1', ROLE)
+
+        self.assertEqual(raised.exception.status_code, 502)
+        self.assertEqual(len(fake.requests), 1)
+        # the upstream answered, so the circuit stays closed
+        self.assertEqual(client.breaker.state, 'closed')
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        fake = FakeManagementApi(*[503] * 3)
+        client = self.client(fake, retries=0)
+        for _ in range(3):
+            with self.assertRaises(ManagementError):
+                client.role_users(ROLE)
+
+        self.assertEqual(client.breaker.state, 'open')
+        with self.assertRaises(ManagementError) as raised:
+            client.role_users(ROLE)
+        self.assertEqual(raised.exception.status_code, 503)
+        self.assertEqual(len(fake.requests), 3)
+
+    def test_circuit_half_opens_for_one_trial(self):
+        fake = FakeManagementApi(*[503] * 4)
+        client = self.client(fake, retries=0)
+        for _ in range(3):
+            with self.assertRaises(ManagementError):
+                client.role_users(ROLE)
+        client.breaker.opened_at -= client.breaker.reset_timeout
+        self.assertEqual(client.breaker.state, 'half-open')
+
+        # the failed trial opens the circuit again
+        with self.assertRaises(ManagementError) as raised:
+            client.role_users(ROLE)
+        self.assertEqual(raised.exception.status_code, 502)
+        self.assertEqual(client.breaker.state, 'open')
+
+        # a successful trial closes it
+        client.breaker.opened_at -= client.breaker.reset_timeout
+        self.assertEqual(client.role_users(ROLE), USERS)
+        self.assertEqual(client.breaker.state, 'closed')
+        self.assertEqual(len(fake.requests), 5)
+
+    def test_half_open_lets_a_single_trial_through(self):
+        breaker = CircuitBreaker(threshold=1, reset_timeout=0)
+        breaker.failure()
+
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+
+    def test_role_listing_is_cached(self):
+        fake = FakeManagementApi()
+        client = self.client(fake, cache_ttl=30)
+        client.role_users(ROLE)
+        client.role_users(ROLE)
+
+        self.assertEqual(fake.requests, [('GET', '/api/v2/roles/{}/users'.format(ROLE))])
+        self.assertEqual(client.stats()['cache_hits'], 1)
+
+    def test_role_listing_expires_after_ttl(self):
+        fake = FakeManagementApi()
+        client = self.client(fake, cache_ttl=30)
+        client.role_users(ROLE)
+        with mock.patch('src.management.time.monotonic', return_value=time.monotonic() + 31):
+            client.role_users(ROLE)
+
+        self.assertEqual(len(fake.requests), 2)
+
+    def test_role_change_invalidates_listing(self):
+        fake = FakeManagementApi()
+        client = self.client(fake)
+        client.role_users(ROLE)
+        client.add_role('auth0|2', ROLE)
+        client.role_users(ROLE)
+        client.remove_role('auth0|2', ROLE)
+        client.role_users(ROLE)
+
+        self.assertEqual([method for method, _ in fake.requests],
+                         ['GET', 'POST', 'GET', 'DELETE', 'GET'])
+
+
+class AsyncManagementClientTestCase(unittest.TestCase):
+    """This class represents the async management api client test case"""
+
+    def run_with_client(self, fake, calls, **options):
+        async def run():
+            client = AsyncManagementClient('https://tenant.example/api/v2', 'token',
+                                           transport=fake.transport, **options)
+            try:
+                return await calls(client)
+            finally:
+                await client.close()
+        return asyncio.run(run())
+
+    def test_retries_and_caches(self):
+        fake = FakeManagementApi(503)
+
+        async def calls(client):
+            with mock.patch('src.management.asyncio.sleep') as sleep:
+                first = await client.role_users(ROLE)
+                second = await client.role_users(ROLE)
+            return first, second, client.stats()
+
+        first, second, stats = self.run_with_client(fake, calls)
+
+        self.assertEqual(first, USERS)
+        self.assertEqual(second, USERS)
+        self.assertEqual(len(fake.requests), 2)
+        self.assertEqual(stats['retries'], 1)
+        self.assertEqual(stats['cache_hits'], 1)
+
+    def test_role_change_invalidates_listing(self):
+        fake = FakeManagementApi()
+
+        async def calls(client):
+            await client.role_users(ROLE)
+            await client.add_role('auth0|2', ROLE)
+            await client.role_users(ROLE)
+
+        self.run_with_client(fake, calls)
+
+        self.assertEqual([method for method, _ in fake.requests], ['GET', 'POST', 'GET'])
+
+
+class ManagementErrorResponseTestCase(unittest.TestCase):
+    """ManagementError answers 502 or 503 in the flask and the ASGI app"""
+
+    def setUp(self):
+        token_cache.put(TOKEN, {
+            'sub': 'management-test',
+            'exp': time.time() + 3600,
+            'permissions': ['get:baristas', 'post:baristas']
+        })
+        self.headers = {'Authorization': 'Bearer {}'.format(TOKEN)}
+
+    def flask_client(self, fake):
+        management = ManagementClient('https://tenant.example/api/v2', 'token',
+                                      transport=fake.transport, retries=0,
+                                      breaker=CircuitBreaker(threshold=1))
+        self.addCleanup(management.close)
+        patcher = mock.patch.object(api, 'management', management)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return api.app.test_client()
+
+    def asgi_responses(self, fake, *requests):
+        from starlette.testclient import TestClient
+        from src.asgi import create_app
+
+        app = create_app(database_url='sqlite://', management_transport=fake.transport)
+        with TestClient(app) as client:
+            app.state.management.retries = 0
+            app.state.management.breaker = CircuitBreaker(threshold=1)
+            return [client.request(method, path, headers=self.headers)
+                    for method, path in requests]
+
+    def test_flask_upstream_failure_is_502_then_503(self):
+        client = self.flask_client(FakeManagementApi(500))
+        failed = client.get('/baristas', headers=self.headers)
+        rejected = client.get('/baristas', headers=self.headers)
+
+        self.assertEqual(failed.status_code, 502)
+        self.assertEqual(json.loads(failed.data)['message']['code'], 'management_error')
+        self.assertEqual(rejected.status_code, 503)
+        self.assertEqual(json.loads(rejected.data)['message']['code'], 'management_unavailable')
+
+    def test_flask_upstream_4xx_is_502(self):
+        client = self.flask_client(FakeManagementApi(400))
+        res = client.post('/baristas/auth0|1', headers=self.headers)
+
+        self.assertEqual(res.status_code, 502)
+
+    def test_asgi_upstream_failure_is_502_then_503(self):
+        failed, rejected = self.asgi_responses(
+            FakeManagementApi(500), ('GET', '/baristas'), ('GET', '/baristas'))
+
+        self.assertEqual(failed.status_code, 502)
+        self.assertEqual(failed.json()['message']['code'], 'management_error')
+        self.assertEqual(rejected.status_code, 503)
+        self.assertEqual(rejected.json()['message']['code'], 'management_unavailable')
+
+    def test_asgi_role_listing_is_cached(self):
+        fake = FakeManagementApi()
+        first, second = self.asgi_responses(
+            fake, ('GET', '/baristas'), ('GET', '/baristas'))
+
+        self.assertEqual(first.json()['data'], USERS)
+        self.assertEqual(second.json()['data'], USERS)
+        self.assertEqual(len(fake.requests), 1)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,5 @@
+'''
+Load-testing benchmark suite of the three apps, see loadtest/__main__.py
+
+    python -m loadtest run --scale 10 --output results.json
+'''
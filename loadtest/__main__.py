@@ -0,0 +1,215 @@
+'''
+Load tests of Fyyur, the trivia API and the coffee shop backend.
+
+    python -m loadtest run [fyyur|trivia|coffee ...] [--scale N] [--rows NAME=COUNT ...]
+                           [--mode client|server] [--requests N] [--concurrency N]
+                           [--database-url URL] [--output results.json]
+                           [--baseline previous.json] [--threshold 0.2]
+    python -m loadtest compare previous.json results.json [--threshold 0.2]
+
+run seeds every app (all three by default) with synthetic rows, --scale
+times ROWS of loadtest.targets (venues, artists, shows, questions, drinks),
+--rows sets one count directly. Each app runs in a process of its own
+against a throwaway SQLite database, --database-url points them at a
+local PostgreSQL instead ("{app}" in it is replaced by the app name, the
+app's tables are dropped first). Every route is measured through the
+Flask test client and over HTTP against a threaded WSGI server, the
+results (p50/p95/p99 latency, throughput, queries per request) are
+printed and written as json to --output.
+
+compare, or run with --baseline, lists the endpoints whose p95 latency
+grew or throughput dropped by more than --threshold, or that run more
+queries or fail more requests, and exits with status 1 when there are any.
+'''
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+from .harness import MODES, measure, compare
+from .targets import ROOT, ROWS, TARGETS
+
+ROW_FORMAT = '{:<7} {:<7} {:<36} {:>9} {:>9} {:>9} {:>9} {:>8} {:>7}'
+
+
+def parse_rows(values):
+    # raises ValueError for anything but NAME=COUNT of a seeded kind of row
+    names = {name for rows in ROWS.values() for name in rows}
+    rows = {}
+    for value in values:
+        name, _, count = value.partition('=')
+        if name not in names or not count.isdigit():
+            raise ValueError('--rows takes NAME=COUNT with NAME one of {}, got {!r}'.format(
+                ', '.join(sorted(names)), value))
+        rows[name] = int(count)
+    return rows
+
+
+def rows_for(app, scale, overrides):
+    rows = {name: count * scale for name, count in ROWS[app].items()}
+    rows.update((name, count) for name, count in overrides.items() if name in rows)
+    return rows
+
+
+def database_url_for(app, template, directory):
+    # (url, throwaway SQLite file or None)
+    if template:
+        return template.replace('{app}', app), None
+    path = os.path.join(directory, '{}.db'.format(app))
+    return 'sqlite:///{}'.format(path), path
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def worker(args):
+    # one app, in a process of its own, results to args.output
+    app, routes = TARGETS[args.app](args.database_url, json.loads(args.rows))
+    rows = measure(app, routes, args.mode, args.requests, args.warmup, args.concurrency)
+    database = args.database_url.split(':', 1)[0].split('+', 1)[0]
+    for row in rows:
+        row.update(app=args.app, database=database)
+    with open(args.output, 'w') as f:
+        json.dump(rows, f)
+
+
+def run(args):
+    overrides = args.rows
+    results = []
+    directory = tempfile.mkdtemp()
+    for app in args.apps or list(TARGETS):
+        rows = rows_for(app, args.scale, overrides)
+        print('{}: {}'.format(app, ', '.join(
+            '{} {}'.format(count, name) for name, count in rows.items())), file=sys.stderr)
+        output = os.path.join(directory, '{}.json'.format(app))
+        database_url, database_path = database_url_for(app, args.database_url, directory)
+        command = [sys.executable, '-m', 'loadtest', 'worker', app,
+                   '--database-url', database_url,
+                   '--rows', json.dumps(rows), '--output', output,
+                   '--requests', str(args.requests), '--warmup', str(args.warmup),
+                   '--concurrency', str(args.concurrency), '--mode'] + (args.mode or list(MODES))
+        subprocess.check_call(command, cwd=ROOT)
+        with open(output) as f:
+            app_results = json.load(f)
+        for row in app_results:
+            row['rows'] = rows
+        results.extend(app_results)
+        os.remove(output)
+        if database_path and os.path.exists(database_path):
+            os.remove(database_path)
+
+    print_results(results)
+    report = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'scale': args.scale,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('results written to {}'.format(args.output), file=sys.stderr)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        return print_regressions(compare(baseline, results, args.threshold))
+    return 0
+
+
+def print_results(results):
+    print(ROW_FORMAT.format('app', 'mode', 'endpoint', 'p50 ms', 'p95 ms', 'p99 ms',
+                            'req/s', 'queries', 'errors'))
+    for row in results:
+        print(ROW_FORMAT.format(
+            row['app'], row['mode'], row['endpoint'], row['p50_ms'], row['p95_ms'],
+            row['p99_ms'], row['throughput_rps'], row['queries_per_request'], row['errors']))
+
+
+def print_regressions(regressions):
+    for app, mode, endpoint, metric, before, after in regressions:
+        print('REGRESSION {} {} {}: {} {} -> {}'.format(app, mode, endpoint, metric, before, after))
+    if not regressions:
+        print('no regressions')
+    return 1 if regressions else 0
+
+
+def compare_files(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    with open(args.current) as f:
+        current = json.load(f)['results']
+    return print_regressions(compare(baseline, current, args.threshold))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m loadtest')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    def measurement_options(command):
+        command.add_argument('--mode', nargs='+', choices=MODES,
+                             help='test client, WSGI server or both (default)')
+        command.add_argument('--requests', type=int, default=200,
+                             help='timed requests per endpoint and mode (200)')
+        command.add_argument('--warmup', type=int, default=5,
+                             help='untimed requests before them (5)')
+        command.add_argument('--concurrency', type=int, default=8,
+                             help='requests in flight against the server (8)')
+
+    command = commands.add_parser('run', help='seed the apps and measure their routes')
+    command.add_argument('apps', nargs='*', metavar='app',
+                         help='fyyur, trivia or coffee (default: all of them)')
+    command.add_argument('--scale', type=int, default=1, help='multiplies the seeded rows (1)')
+    command.add_argument('--rows', nargs='+', default=[], metavar='NAME=COUNT',
+                         help='rows of one kind, e.g. shows=50000')
+    command.add_argument('--database-url', default=os.environ.get('LOADTEST_DATABASE_URL'),
+                         help='database of the apps, "{app}" is replaced by the app name')
+    command.add_argument('--output', default='loadtest-results.json')
+    command.add_argument('--baseline', help='earlier results to compare with')
+    command.add_argument('--threshold', type=float, default=0.2)
+    measurement_options(command)
+    command.set_defaults(handler=run)
+
+    command = commands.add_parser('compare', help='compare two result files')
+    command.add_argument('baseline')
+    command.add_argument('current')
+    command.add_argument('--threshold', type=float, default=0.2)
+    command.set_defaults(handler=compare_files)
+
+    command = commands.add_parser('worker')
+    command.add_argument('app', choices=list(TARGETS))
+    command.add_argument('--database-url', required=True)
+    command.add_argument('--rows', required=True)
+    command.add_argument('--output', required=True)
+    measurement_options(command)
+    command.set_defaults(handler=worker)
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        unknown = set(args.apps) - set(TARGETS)
+        if unknown:
+            parser.error('unknown app {}, choose from {}'.format(
+                ', '.join(sorted(unknown)), ', '.join(TARGETS)))
+        try:
+            args.rows = parse_rows(args.rows)
+        except ValueError as error:
+            parser.error(str(error))
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
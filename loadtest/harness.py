@@ -0,0 +1,224 @@
+'''
+Drives the routes of a Flask app and measures them.
+
+Every route is requested `requests` times after `warmup` untimed requests,
+either through the Flask test client, one request at a time, or over HTTP
+against the app served by a threaded werkzeug WSGI server on a local port,
+`concurrency` requests in flight. The SQL statements of every engine of the
+process are counted while a route runs.
+'''
+import http.client
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from werkzeug.serving import make_server
+
+MODES = ('client', 'server')
+
+'''
+Route(name, method, path, json=None, form=None, headers=None)
+    one endpoint to measure, name identifies it across runs when its path
+    holds ids that change from run to run
+'''
+Route = namedtuple('Route', ['name', 'method', 'path', 'json', 'form', 'headers'])
+Route.__new__.__defaults__ = (None, None, None)
+
+
+'''
+QueryCounter
+    number of SQL statements executed by any engine since it was created
+'''
+class QueryCounter:
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+        event.listen(Engine, 'before_cursor_execute', self._executed)
+
+    def _executed(self, *args):
+        with self._lock:
+            self.count += 1
+
+    def close(self):
+        event.remove(Engine, 'before_cursor_execute', self._executed)
+
+
+def percentile(values, fraction):
+    # linear interpolation between the two closest ranks
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = (len(ordered) - 1) * fraction
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(latencies, errors, queries, elapsed):
+    # latencies in seconds, the metrics in milliseconds
+    requests = len(latencies)
+    return {
+        'requests': requests,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'mean_ms': round(sum(latencies) / requests * 1000, 3) if requests else 0.0,
+        'max_ms': round(max(latencies) * 1000, 3) if requests else 0.0,
+        'throughput_rps': round(requests / elapsed, 1) if elapsed else 0.0,
+        'queries_per_request': round(queries / requests, 2) if requests else 0.0,
+    }
+
+
+def encode(route):
+    # (body, headers) of the request
+    headers = dict(route.headers or {})
+    body = None
+    if route.json is not None:
+        body = json.dumps(route.json).encode('utf-8')
+        headers['Content-Type'] = 'application/json'
+    elif route.form is not None:
+        body = urlencode(route.form).encode('utf-8')
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    return body, headers
+
+
+def client_request(client, route):
+    # the status code, the whole body is read like a browser would
+    body, headers = encode(route)
+    response = client.open(route.path, method=route.method, data=body, headers=headers)
+    response.get_data()
+    response.close()
+    return response.status_code
+
+
+def http_request(port, route):
+    body, headers = encode(route)
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        connection.request(route.method, route.path, body=body, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def timed_request(request):
+    # (seconds, failed), an exception is a failed request
+    started = time.perf_counter()
+    try:
+        failed = request() >= 400
+    except Exception:
+        failed = True
+    return time.perf_counter() - started, failed
+
+
+def drive_client(app, routes, requests, warmup, counter):
+    client = app.test_client()
+    results = {}
+    for route in routes:
+        for _ in range(warmup):
+            timed_request(lambda: client_request(client, route))
+        latencies, errors = [], 0
+        queries = counter.count
+        started = time.perf_counter()
+        for _ in range(requests):
+            elapsed, failed = timed_request(lambda: client_request(client, route))
+            latencies.append(elapsed)
+            errors += failed
+        elapsed = time.perf_counter() - started
+        results[route.name] = summarize(latencies, errors, counter.count - queries, elapsed)
+    return results
+
+
+def drive_server(app, routes, requests, warmup, counter, concurrency):
+    # werkzeug logs every request, keep the terminal for the report
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    results = {}
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for route in routes:
+                for _ in range(warmup):
+                    timed_request(lambda: http_request(server.server_port, route))
+                queries = counter.count
+                started = time.perf_counter()
+                outcomes = list(pool.map(
+                    lambda _: timed_request(lambda: http_request(server.server_port, route)),
+                    range(requests)))
+                elapsed = time.perf_counter() - started
+                results[route.name] = summarize(
+                    [latency for latency, _ in outcomes],
+                    sum(failed for _, failed in outcomes),
+                    counter.count - queries, elapsed)
+    finally:
+        server.shutdown()
+        thread.join()
+    return results
+
+
+'''
+measure(app, routes, modes, requests, warmup, concurrency)
+    one result per mode and route: requests, errors (status >= 400 or an
+    exception), p50/p95/p99/mean/max latency in ms, throughput in requests
+    per second and SQL statements per request
+'''
+def measure(app, routes, modes=MODES, requests=200, warmup=5, concurrency=8):
+    counter = QueryCounter()
+    rows = []
+    try:
+        for mode in modes:
+            if mode == 'client':
+                results = drive_client(app, routes, requests, warmup, counter)
+            else:
+                results = drive_server(app, routes, requests, warmup, counter, concurrency)
+            for route in routes:
+                rows.append(dict(mode=mode, endpoint=route.name, **results[route.name]))
+    finally:
+        counter.close()
+    return rows
+
+
+def key(row):
+    return row['app'], row['mode'], row['endpoint']
+
+
+'''
+compare(baseline, current, threshold=0.2, floor_ms=1.0)
+    the regressions of current against baseline, two lists of result rows,
+    as (app, mode, endpoint, metric, before, after) for every endpoint of
+    both runs whose p95 latency grew, or throughput dropped, by more than
+    threshold (p95 changes under floor_ms are noise), or that runs more
+    queries per request or fails more requests. Endpoints measured over
+    different seeded rows are not compared.
+'''
+def compare(baseline, current, threshold=0.2, floor_ms=1.0):
+    before = {key(row): row for row in baseline}
+    regressions = []
+    for row in current:
+        old = before.get(key(row))
+        if old is None or old.get('rows') != row.get('rows'):
+            continue
+        changes = []
+        if (row['p95_ms'] > old['p95_ms'] * (1 + threshold)
+                and row['p95_ms'] - old['p95_ms'] > floor_ms):
+            changes.append('p95_ms')
+        if row['throughput_rps'] < old['throughput_rps'] * (1 - threshold):
+            changes.append('throughput_rps')
+        # averages over concurrent requests can wobble by a fraction
+        if row['queries_per_request'] >= old['queries_per_request'] + 0.5:
+            changes.append('queries_per_request')
+        if row['errors'] > old['errors']:
+            changes.append('errors')
+        regressions.extend(key(row) + (metric, old[metric], row[metric]) for metric in changes)
+    return regressions
@@ -0,0 +1,163 @@
+'''
+The three apps, seeded with synthetic data and the routes to measure.
+
+Every target imports its app from its own directory, the apps share module
+names (app, models, config), so each one runs in a process of its own.
+target(database_url, rows) seeds the database, wiping the app's tables
+first, and returns (app, routes).
+'''
+import json
+import os
+import sys
+import time
+
+from .harness import Route
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DIRECTORIES = {
+    'fyyur': os.path.join(ROOT, '01_fyyur', 'code'),
+    'trivia': os.path.join(ROOT, '02_trivia_api', 'code', 'backend'),
+    'coffee': os.path.join(ROOT, '03_coffee_shop_full_stack', 'code', 'backend'),
+}
+
+# rows seeded at --scale 1
+ROWS = {
+    'fyyur': {'venues': 100, 'artists': 100, 'shows': 1000},
+    'trivia': {'questions': 1000},
+    'coffee': {'drinks': 100},
+}
+
+TRIVIA_CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+
+COFFEE_RECIPE = [{'name': 'milk', 'color': 'white', 'parts': 1},
+                 {'name': 'coffee', 'color': 'brown', 'parts': 2},
+                 {'name': 'foam', 'color': 'grey', 'parts': 1}]
+COFFEE_TOKEN = 'loadtest'
+
+
+def enter(name, database_url):
+    # the app reads DATABASE_URL when it is imported
+    os.chdir(DIRECTORIES[name])
+    sys.path.insert(0, DIRECTORIES[name])
+    os.environ['DATABASE_URL'] = database_url
+
+
+def fyyur(database_url, rows):
+    enter('fyyur', database_url)
+    os.environ['BENCH_DATABASE_URL'] = database_url
+    from benchmarks.common import setup_app, seed
+
+    app = setup_app()
+    with app.app_context():
+        seed(rows['venues'], rows['artists'], rows['shows'])
+    middle = max(rows['venues'] // 2, 1)
+    return app, [
+        Route('GET /', 'GET', '/'),
+        Route('GET /venues', 'GET', '/venues'),
+        Route('GET /venues/<id>', 'GET', '/venues/{}'.format(middle)),
+        Route('POST /venues/search', 'POST', '/venues/search',
+              form={'search_term': 'Venue 1'}),
+        Route('GET /artists', 'GET', '/artists'),
+        Route('GET /artists/<id>', 'GET', '/artists/{}'.format(middle)),
+        Route('POST /artists/search', 'POST', '/artists/search',
+              form={'search_term': 'Artist 1'}),
+        Route('GET /shows', 'GET', '/shows'),
+        Route('GET /shows?upcoming=1', 'GET', '/shows?upcoming=1'),
+    ]
+
+
+def trivia(database_url, rows):
+    enter('trivia', database_url)
+    from flaskr import create_app, QUESTIONS_PER_PAGE
+    from flaskr.search import search_backend
+    from models import db, Category, Question, QuestionCount
+
+    questions = rows['questions']
+    with create_app().app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add_all([Category(type) for type in TRIVIA_CATEGORIES])
+        db.session.commit()
+        for first in range(0, questions, 20000):
+            db.session.execute(Question.__table__.insert(), [{
+                'question': 'Question {}'.format(i),
+                'answer': 'Answer {}'.format(i),
+                'category': i % len(TRIVIA_CATEGORIES) + 1,
+                'difficulty': i % 5 + 1
+            } for i in range(first, min(first + 20000, questions))])
+        db.session.commit()
+        QuestionCount.rebuild()
+        search_backend(installed_only=False).install()
+        middle_id = db.session.query(Question.id).order_by(Question.id) \
+            .offset(questions // 2).limit(1).scalar() or 0
+
+    # the search backend is picked when the app is created
+    app = create_app()
+    session_id = app.test_client().post(
+        '/quizzes/sessions', json={'quiz_category': 0}).get_json().get('session_id')
+    last_page = max(questions // QUESTIONS_PER_PAGE, 1)
+    return app, [
+        Route('GET /categories', 'GET', '/categories'),
+        Route('GET /questions?page=1', 'GET', '/questions?page=1'),
+        Route('GET /questions?page=<last>', 'GET', '/questions?page={}'.format(last_page)),
+        Route('GET /questions?after_id=<middle>', 'GET',
+              '/questions?after_id={}'.format(middle_id)),
+        Route('GET /categories/<id>/questions', 'GET', '/categories/1/questions'),
+        Route('GET /categories/counts', 'GET', '/categories/counts'),
+        Route('POST /questions/search', 'POST', '/questions/search',
+              json={'searchTerm': 'question 1'}),
+        Route('POST /quizzes', 'POST', '/quizzes',
+              json={'quiz_category': 1, 'previous_questions': [1, 7, 13]}),
+        Route('POST /quizzes/sessions', 'POST', '/quizzes/sessions',
+              json={'quiz_category': 1}),
+        Route('POST /quizzes/sessions/<id>/next', 'POST',
+              '/quizzes/sessions/{}/next'.format(session_id)),
+    ]
+
+
+def coffee(database_url, rows):
+    enter('coffee', database_url)
+    from src.api import app
+    from src.auth.auth import token_cache
+    from src.database.models import db, Drink, DrinkIngredient, Ingredient
+
+    drinks = rows['drinks']
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.bulk_insert_mappings(Ingredient, [
+            {'id': i, 'name': line['name']} for i, line in enumerate(COFFEE_RECIPE, 1)])
+        db.session.bulk_insert_mappings(Drink, [{
+            'id': i,
+            'title': 'drink {}'.format(i),
+            'recipe': json.dumps(COFFEE_RECIPE)
+        } for i in range(1, drinks + 1)])
+        db.session.bulk_insert_mappings(DrinkIngredient, [{
+            'drink_id': i,
+            'position': position,
+            'ingredient_id': position + 1,
+            'color': line['color'],
+            'parts': line['parts']
+        } for i in range(1, drinks + 1) for position, line in enumerate(COFFEE_RECIPE)])
+        db.session.commit()
+
+    # a verified token, the runs never reach Auth0
+    token_cache.ttl = 24 * 3600
+    token_cache.put(COFFEE_TOKEN, {
+        'sub': 'loadtest',
+        'exp': time.time() + token_cache.ttl,
+        'permissions': ['get:drinks-detail', 'get:drinks-export']
+    })
+    authorized = {'Authorization': 'Bearer {}'.format(COFFEE_TOKEN)}
+    return app, [
+        Route('GET /drinks', 'GET', '/drinks'),
+        Route('GET /drinks?ingredient=milk', 'GET', '/drinks?ingredient=milk'),
+        Route('GET /drinks-detail', 'GET', '/drinks-detail', headers=authorized),
+        Route('GET /drinks/export', 'GET', '/drinks/export', headers=authorized),
+        Route('GET /drinks/export?format=ndjson', 'GET', '/drinks/export?format=ndjson',
+              headers=authorized),
+    ]
+
+
+TARGETS = {'fyyur': fyyur, 'trivia': trivia, 'coffee': coffee}